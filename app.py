@@ -1,19 +1,47 @@
 # main.py
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-import gradio as gr
-import sys
+from lazy_mount import LazyGradioMount
+from metrics import render_metrics
 
-# Import the Gradio interface from the separate file
-from assistant import gradio_init as gradio_init_assistant, assistant as assistant_original
-from assistant_with_dropdown import gradio_init as gradio_init_dropdown, assistant as assistant_dropdown
+# The assistant modules (and with them gradio and openai) are imported only
+# when their mount is first built, so uvicorn can bind its port right away
+def init_assistant():
+    from assistant import gradio_init
+    gradio_init()
 
-gradio_init_assistant()
-gradio_init_dropdown()
+def build_assistant():
+    from assistant import assistant
+    return assistant()
 
+def init_dropdown():
+    from assistant_with_dropdown import gradio_init
+    gradio_init()
+
+def build_dropdown():
+    from assistant_with_dropdown import assistant
+    return assistant()
+
+gradio_mounts = {
+    "/gradio": LazyGradioMount(init_assistant, build_assistant),
+    "/gradio2": LazyGradioMount(init_dropdown, build_dropdown),
+}
+
+@asynccontextmanager
+async def lifespan(app):
+    # Build the UIs in the background once the server is up; set
+    # GRADIO_PREWARM=false to build each one on its first request instead
+    if os.getenv("GRADIO_PREWARM", "true").lower() != "false":
+        for mount in gradio_mounts.values():
+            mount.prewarm()
+    yield
+    for mount in gradio_mounts.values():
+        await mount.close()
 
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -24,20 +52,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-interface=assistant_original()
-interface2=assistant_dropdown()
-# return client clientgradio_search_interface()
-
-# Mount Gradio app
-app = gr.mount_gradio_app(app, interface, path="/gradio")
-app = gr.mount_gradio_app(app, interface2, path="/gradio2")
+# Mount Gradio apps
+for path, mount in gradio_mounts.items():
+    app.mount(path, mount)
 
 # FastAPI route
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Article Analysis API"}
 
-# Run the app
+# Prometheus metrics: per-stage latency histograms and run/tool error counters (see metrics.py)
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Run the app; with --workers N it runs as N worker processes behind a sticky front (see workers.py)
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the assistant apps")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "1")),
+                        help="worker processes; more than one keeps sessions in a shared SQLite store")
+    args = parser.parse_args()
+    if args.workers > 1:
+        from workers import serve
+        serve(args.workers, args.host, args.port)
+    else:
+        import uvicorn
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,114 @@
+"""Indexed assistant catalog that reloads itself when assistants.csv changes.
+
+read_assistants() parsed the CSV once at startup, so adding an assistant
+needed a restart and the dropdown listed every assistant at once. The
+catalog keeps name->id and id->name indexes plus a sorted name list for
+prefix search, and re-reads the file when its modification time changes.
+Each reload builds a new snapshot and swaps it in whole, so lookups never
+see a half-loaded catalog.
+"""
+import os
+import csv
+import time
+import bisect
+import threading
+import logging
+from structured_logging import get_logger, log_event
+
+logger = get_logger("catalog")
+
+
+class _Snapshot:
+    def __init__(self, version, mtime, by_name):
+        self.version = version
+        self.mtime = mtime
+        self.by_name = by_name
+        self.by_id = {assistant_id: name for name, assistant_id in by_name.items()}
+        # Sorted by lower-case name for case-insensitive prefix search
+        self.sorted_keys = sorted((name.lower(), name) for name in by_name)
+
+
+def _read_csv(path):
+    assistants = {}
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                if 'name' in row and 'assistant_id' in row:
+                    assistants[row['name']] = row['assistant_id']
+                else:
+                    log_event(logger, "catalog_missing_columns", level=logging.WARNING, path=path)
+    except FileNotFoundError:
+        log_event(logger, "catalog_not_found", level=logging.ERROR, path=path)
+    except csv.Error as e:
+        log_event(logger, "catalog_csv_error", level=logging.ERROR, path=path, error=str(e))
+    except Exception as e:
+        log_event(logger, "catalog_read_failed", level=logging.ERROR, path=path, error=str(e))
+
+    if not assistants:
+        log_event(logger, "catalog_empty", level=logging.WARNING, path=path)
+    return assistants
+
+
+class AssistantCatalog:
+    def __init__(self, path='assistants.csv', check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._snapshot = _Snapshot(0, None, {})
+        self._maybe_reload()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._snapshot
+        with self._lock:
+            if now < self._next_check:
+                return self._snapshot
+            self._next_check = now + self.check_interval
+            mtime = self._mtime()
+            if mtime != self._snapshot.mtime or self._snapshot.version == 0:
+                self._snapshot = _Snapshot(self._snapshot.version + 1, mtime, _read_csv(self.path))
+            return self._snapshot
+
+    @property
+    def version(self):
+        return self._maybe_reload().version
+
+    def get(self, name, default=None):
+        """Assistant id for a name, or default."""
+        return self._maybe_reload().by_name.get(name, default)
+
+    def name_for(self, assistant_id, default=None):
+        return self._maybe_reload().by_id.get(assistant_id, default)
+
+    def __contains__(self, name):
+        return name in self._maybe_reload().by_name
+
+    def __getitem__(self, name):
+        return self._maybe_reload().by_name[name]
+
+    def __len__(self):
+        return len(self._maybe_reload().by_name)
+
+    def keys(self):
+        return list(self._maybe_reload().by_name.keys())
+
+    def search(self, prefix="", limit=50):
+        """Up to limit names starting with prefix (case-insensitive), in name order."""
+        keys = self._maybe_reload().sorted_keys
+        prefix = (prefix or "").lower()
+        start = bisect.bisect_left(keys, (prefix,))
+        matches = []
+        for lower_name, name in keys[start:]:
+            if not lower_name.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(name)
+        return matches
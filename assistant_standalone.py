@@ -1,41 +1,64 @@
 import os
-import time
 import gradio as gr
-from openai import OpenAI, AzureOpenAI
 from dotenv import load_dotenv
 import pprint
-import tempfile
 import json
-import traceback
-import http.client
-# Import from practical_ai_azure_keyvault
-from practical_ai_azure_keyvault import initialize_app, AIConfig
+import time
+import logging
+from contextlib import ExitStack
+from structured_logging import get_logger, log_event, elapsed_ms
+from metrics import stage, observe_stage, start_metrics_server
+from client_provider import get_client
+from run_poller import poll_run
+from thread_messages import latest_assistant_reply, forget_thread
+from warm_threads import shared_thread_pool
+from streaming import stream_run
+from http_pool import get_http_client
+from ttl_cache import TTLCache, cached_call
+from session_store import shared_session_store, new_session_key
+from transcript_export import export_transcript, release_export, EXPORT_CHOICES, GRADIO_DELETE_CACHE
+from queue_config import queue_settings, chat_event, download_event
+from rate_limiter import shared_rate_limiter, estimate_tokens, waiting_message, RateLimitBusy
+from thread_runs import shared_thread_turns, session_thread, add_user_message, ThreadBusy, WAITING_FOR_PREVIOUS_REPLY
+from reply_cache import shared_reply_cache
+from resilience import describe_error
+from tool_registry import tool, dispatch_tool_calls
+
+logger = get_logger("chat")
 
 client=None
+thread_pool=None
+rate_limiter=None
+thread_turns=None
+reply_cache=None
+sessions=None
 assistantID=None
+streamResponses=True
+# Cache for Nutrition_Advice API results; set NUTRITION_CACHE_TTL=0 to turn it off
+nutrition_cache=None
 
 # Load environment variables
 def gradio_init():
-    global client,assistantID
+    global client,thread_pool,rate_limiter,thread_turns,reply_cache,sessions,assistantID,streamResponses,nutrition_cache
     load_dotenv()
+    # Set ASSISTANT_STREAMING=false to wait for the whole reply instead of streaming it
+    streamResponses = os.getenv("ASSISTANT_STREAMING", "true").lower() != "false"
+    cache_ttl = float(os.getenv("NUTRITION_CACHE_TTL", "3600"))
+    nutrition_cache = TTLCache("Nutrition_Advice", maxsize=32, ttl=cache_ttl) if cache_ttl > 0 else None
 
-    # Check for API key
-    if os.getenv("OPENAI_API_KEY"):
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    else:
-        try:
-            initialize_app("ClassWeatherApi")  # Match assistant.py Key Vault name
-            config = AIConfig()
-            endpoint = config.endpoint
-            api_key = config.api_key
-            api_version = config.api_version
-            client = AzureOpenAI(
-                azure_endpoint=endpoint,
-                api_key=api_key,
-                api_version=api_version
-            )
-        except Exception as e:
-            raise ValueError(f"Failed to authenticate with Azure: {str(e)}")
+    # One client, connection pool and Key Vault login shared by every app in the process (see client_provider.py)
+    client = get_client()
+
+    # Keep a few empty threads ready so new conversations skip threads.create()
+    thread_pool = shared_thread_pool(client)
+    # Runs and tokens per minute, per assistant and for the API key
+    rate_limiter = shared_rate_limiter()
+    # Turns on the same thread run one after another (see thread_runs.py)
+    thread_turns = shared_thread_turns()
+    # Replies to common first questions, for the assistants in REPLY_CACHE_ASSISTANTS
+    reply_cache = shared_reply_cache()
+    # Chat histories live on the server; the browser only keeps its session key
+    sessions = shared_session_store()
 
     if os.getenv("OPENAI_ASSISTANT_ID"):
         assistantID=os.getenv("OPENAI_ASSISTANT_ID")
@@ -44,6 +67,13 @@ def gradio_init():
     return 
 
 # Tool: Generate_Workout_Plan
+@tool("Generate_Workout_Plan", {
+    "type": "object",
+    "properties": {
+        "days": {"type": "string", "description": "Number of days in a week the user intends to work out in"}
+    },
+    "required": ["days"]
+}, cache_ttl=3600)
 def Generate_Workout_Plan(days):
     """
     Generates a structured weekly workout plan tailored to the user's fitness goals, experience level, and preferred training style.
@@ -63,6 +93,13 @@ def Generate_Workout_Plan(days):
         return {"error": f"Invalid input for days: {days}. Error: {str(e)}"}
 
 # Tool: Nutrition_Advice (tool function version)
+@tool("Nutrition_Advice", {
+    "type": "object",
+    "properties": {
+        "calories": {"type": "string", "description": "Number of calories a day the user intends to eat"}
+    },
+    "required": ["calories"]
+}, cache_ttl=3600)
 def Nutrition_Advice_tool(calories):
     """
     Provides personalized nutrition advice based on the user's fitness goals.
@@ -86,65 +123,107 @@ def Nutrition_Advice_tool(calories):
 def chat_with_assistant(message, history, assistantid, thread_id):
     try:
         if not thread_id:
-            thread = client.beta.threads.create()
-            thread_id = thread.id
-
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=message
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread_id,
-            assistant_id=assistantid
-        )
-
-        start_time = time.time()
-        while run.status not in ["completed", "failed", "expired", "requires_action"]:
-            if time.time() - start_time > 60:
-                raise TimeoutError("Assistant response timed out. Please try again.")
-            time.sleep(1)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-        # Tool call handling
+            # Take a pre-created thread from the pool (see warm_threads.py)
+            with stage("thread_create", assistantid):
+                thread_id = thread_pool.take()
+
+        with stage("message_create", assistantid):
+            add_user_message(client, thread_id, message)
+
+        with stage("run_create", assistantid):
+            run = client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistantid
+            )
+
+        # Wait for the run to finish, backing off between polls (see run_poller.py)
+        run = poll_run(client, thread_id, run, assistantid)
+        # Tool call handling: registered tools run concurrently (see tool_registry.py)
         if run.status == "requires_action":
-            tools_output = []
-            for tool in run.required_action.submit_tool_outputs.tool_calls:
-                if tool.function.name == "Generate_Workout_Plan":
-                    args = json.loads(tool.function.arguments)
-                    output = Generate_Workout_Plan(args["days"])
-                    tools_output.append({"tool_call_id": tool.id, "output": json.dumps(output)})
-                elif tool.function.name == "Nutrition_Advice":
-                    args = json.loads(tool.function.arguments)
-                    output = Nutrition_Advice_tool(args["calories"])
-                    tools_output.append({"tool_call_id": tool.id, "output": json.dumps(output)})
+            with stage("tool_calls", assistantid):
+                tools_output = dispatch_tool_calls(run.required_action.submit_tool_outputs.tool_calls)
             if tools_output:
                 try:
-                    run = client.beta.threads.runs.submit_tool_outputs_and_poll(
+                    run = client.beta.threads.runs.submit_tool_outputs(
                         thread_id=thread_id,
                         run_id=run.id,
                         tool_outputs=tools_output
                     )
+                    run = poll_run(client, thread_id, run, assistantid)
                 except Exception as e:
-                    print("failed to submit tool_outputs", e)
+                    log_event(logger, "tool_outputs_failed", level=logging.WARNING, exc_info=e, assistant_id=assistantid, thread_id=thread_id, run_id=run.id)
         if run.status != "completed":
             raise Exception(f"Run failed: {run.last_error}")
 
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        assistant_messages = [msg for msg in messages if msg.role == "assistant"]
-        if assistant_messages:
-            latest_message = assistant_messages[0].content[0].text.value
+        # Fetch only the reply written by this run
+        with stage("messages_list", assistantid):
+            latest_message = latest_assistant_reply(client, thread_id, run.id)
+        if latest_message:
+            reply_cache.remember(assistantid, message, history, latest_message)
             return latest_message, thread_id
         else:
             return "No response from the assistant. Please try again.", thread_id
 
     except Exception as e:
-        tb = traceback.format_exc()
-        return f"An error occurred: {str(e)} at line {tb.splitlines()[-2]}. Please try again or contact support if the issue persists.", thread_id
+        log_event(logger, "chat_error", level=logging.ERROR, exc_info=e, assistant_id=assistantid, thread_id=thread_id)
+        return f"An error occurred: {describe_error(e)} Please try again or contact support if the issue persists.", thread_id
+
+# Stream the assistant's reply, yielding (text so far, thread_id) as tokens arrive
+def chat_with_assistant_stream(message, history, assistantid, thread_id):
+    try:
+        if not thread_id:
+            # Take a pre-created thread from the pool (see warm_threads.py)
+            with stage("thread_create", assistantid):
+                thread_id = thread_pool.take()
+
+        with stage("message_create", assistantid):
+            add_user_message(client, thread_id, message)
+
+        response = ""
+        for delta in stream_run(client, thread_id, assistantid, tool_handler=dispatch_tool_calls):
+            response += delta
+            yield response, thread_id
+        if response:
+            reply_cache.remember(assistantid, message, history, response)
+        else:
+            yield "No response from the assistant. Please try again.", thread_id
+
+    except Exception as e:
+        log_event(logger, "chat_error", level=logging.ERROR, exc_info=e, assistant_id=assistantid, thread_id=thread_id)
+        yield f"An error occurred: {describe_error(e)} Please try again or contact support if the issue persists.", thread_id
+
+# Yields (response so far, thread_id), streaming unless ASSISTANT_STREAMING=false.
+# history is the session's history, turn the index of this turn's reply in it
+def assistant_replies(message, history, session, turn, assistant_id, thread_turn):
+    thread_id = thread_turn.thread_id
+    try:
+        # One turn at a time per thread: a follow-up waits for the reply before it (see thread_runs.py)
+        for _ in thread_turn.wait():
+            yield WAITING_FOR_PREVIOUS_REPLY, thread_id
+        # The turns before this one have saved their replies by now; show them as saved
+        saved = sessions.get(session)["history"]
+        if len(saved) > turn:
+            history[:] = saved
+        earlier = history[:turn - 1]
+        # A first message asked before is answered from the reply cache, without a run (see reply_cache.py)
+        reply = reply_cache.lookup(client, assistant_id, message, earlier)
+        if reply is not None:
+            yield reply, thread_id
+            yield reply, reply_cache.record(client, assistant_id, message, reply, thread_id)
+            return
+        # Wait for the assistant's rate limit quota, showing the place in line (see rate_limiter.py)
+        for position in rate_limiter.wait(assistant_id, estimate_tokens(message, earlier)):
+            yield waiting_message(position), thread_id
+    except (ThreadBusy, RateLimitBusy) as e:
+        yield str(e), thread_id
+        return
+    if streamResponses:
+        yield from chat_with_assistant_stream(message, earlier, assistant_id, thread_id)
+    else:
+        yield chat_with_assistant(message, earlier, assistant_id, thread_id)
 
 # Nutrition Advice API function (copied from assistant.py)
 def Nutrition_Advice(location):
-    conn = http.client.HTTPSConnection("ai-workout-planner-exercise-fitness-nutrition-guide.p.rapidapi.com")
     payload = json.dumps({
         "goal": "Lose weight",
         "dietary_restrictions": ["Vegetarian"],
@@ -153,47 +232,89 @@ def Nutrition_Advice(location):
         "daily_activity_level": "Moderate",
         "lang": "en"
     })
+    # The request only depends on the payload, so repeat calls are answered from the cache
+    if nutrition_cache is None:
+        return request_nutrition_advice(payload)
+    return cached_call(nutrition_cache, payload, lambda: request_nutrition_advice(payload))
+
+def request_nutrition_advice(payload):
+    # Pooled keep-alive client with timeouts; NUTRITION_API_URL can point at a local stand-in server
+    http = get_http_client(os.getenv("NUTRITION_API_URL", "https://ai-workout-planner-exercise-fitness-nutrition-guide.p.rapidapi.com"))
     headers = {
         'x-rapidapi-key': os.getenv("RAPIDAPI_KEY"),
         'x-rapidapi-host': "ai-workout-planner-exercise-fitness-nutrition-guide.p.rapidapi.com",
         'Content-Type': "application/json"
     }
-    conn.request("POST", "/nutritionAdvice?noqueue=1", payload, headers)
-    res = conn.getresponse()
-    data = res.read()
     try:
-        response = json.loads(data.decode("utf-8"))
+        res = http.post("/nutritionAdvice", params={"noqueue": "1"}, content=payload, headers=headers)
+        res.raise_for_status()
+        response = res.json()
         return response["result"]
     except Exception as e:
         return {"error": str(e)}
 
 # Updated Gradio interface to include Nutrition Advice
-def gradio_interface_with_nutrition(message, history, assistant_id, thread_id, location):
-    if message.lower() == "nutrition advice":
-        nutrition_data = Nutrition_Advice(location)
-        response = pprint.pformat(nutrition_data)
-    else:
-        response, new_thread_id = chat_with_assistant(message, history, assistant_id, thread_id)
-        thread_id = new_thread_id
-
-    print("Debug - Returning from gradio_interface_with_nutrition:")
-    print("Response:", response)
-    print("History:")
-    pprint.pprint(history)
-    print("New Thread ID:", thread_id)
-    history.append([message, response])
-    return history, thread_id, ""
-
-def download_history(history):
-    history_text = "\n".join([f"Human: {h}\nAI: {a}" for h, a in history])
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as temp_file:
-        temp_file.write(history_text)
-        temp_file_path = temp_file.name
-    return temp_file_path
-
-def clear_conversation():
+def gradio_interface_with_nutrition(message, session, assistant_id, thread_id, location):
+    # The history is kept on the server; only the new message comes from the browser
+    session = session or new_session_key()
+    started = time.perf_counter()
+    turn = sessions.add_message(session, message, assistant_id)
+    saved = sessions.get(session)
+    history = saved["history"]
+    # gr.State lives in the worker that served the page; the session store is shared by every worker
+    thread_id = thread_id or saved["thread_id"]
+    response = ""
+    # The reply is saved before the turn entered below ends, so the next turn on the thread finds it
+    with ExitStack() as turn_scope:
+        try:
+            if message.lower() == "nutrition advice":
+                nutrition_data = Nutrition_Advice(location)
+                response = pprint.pformat(nutrition_data)
+                history[turn]["content"] = response
+                yield history, thread_id, "", session
+            else:
+                # Two quick submits on a new conversation share one thread (see thread_runs.session_thread)
+                thread_id = thread_id or session_thread(sessions, session, thread_pool)
+                thread_turn = turn_scope.enter_context(thread_turns.turn(thread_id))
+                for response, thread_id in assistant_replies(message, history, session, turn, assistant_id, thread_turn):
+                    history[turn]["content"] = response
+                    yield history, thread_id, "", session
+        finally:
+            sessions.set_reply(session, response, thread_id, turn)
+            # Sizes and timings only: message text stays out of the logs
+            log_event(logger, "chat_turn", sample=True, assistant_id=assistant_id, thread_id=thread_id, duration_ms=elapsed_ms(started),
+                      message_chars=len(message), reply_chars=len(response), turns=len(history) // 2)
+            observe_stage("turn", assistant_id, time.perf_counter() - started)
+
+
+# The transcript is read from the thread on the server, so it holds the whole
+# conversation rather than only what the browser still shows
+def download_history(session, thread_id, export_format="txt"):
+    saved = sessions.get(session)
+    history = saved["history"]
+    thread_id = thread_id or saved["thread_id"]
+    try:
+        path = export_transcript(client, thread_id, history, export_format)
+    except Exception as e:
+        log_event(logger, "export_fallback", level=logging.WARNING, exc_info=e, thread_id=thread_id)
+        path = export_transcript(client, None, history, export_format)
+    # The path is kept in a State so the file can be deleted once Gradio has served it
+    return path, path
+
+def clear_conversation(session):
+    thread_id = sessions.get(session)["thread_id"]
+    sessions.clear(session)
+    if thread_id:
+        forget_thread(thread_id)
     return None, None
 
+# Give the browser a session key, or restore the conversation it already has
+def restore_session(session):
+    if session not in sessions:
+        session = new_session_key()
+    saved = sessions.get(session)
+    return session, saved["history"] or None, saved["thread_id"]
+
 def assistant():
     head = """
     <script>
@@ -202,25 +323,36 @@ def assistant():
     })();
     </script>
     """
-    with gr.Blocks(css="#chatbot { height:600px; overflow-y:scroll; }", head=head) as app:
+    with gr.Blocks(css="#chatbot { height:600px; overflow-y:scroll; }", head=head, delete_cache=GRADIO_DELETE_CACHE) as app:
         gr.Markdown("# Chat with OpenAI Assistant")
         chatbot = gr.Chatbot(elem_id="chatbot", placeholder="say 'Hello' to start chatting with the assistant...")
         msg = gr.Textbox()
         location = gr.Textbox(label="Location (e.g., San Francisco, CA)", placeholder="Enter your location")
         clear = gr.Button("Clear")
+        download_format = gr.Radio(choices=EXPORT_CHOICES, value="txt", label="Download Format")
         download_button = gr.Button("Download Chat History")
         download_output = gr.File(label="Chat History")
+        export_path = gr.State()
         assistant_id = gr.State(value=assistantID)
         thread_id = gr.State()
+        # Kept in the browser's local storage so a reload finds its conversation again
+        session = gr.BrowserState(None, storage_key="assistant_session")
         msg.submit(gradio_interface_with_nutrition, 
-                    inputs=[msg, chatbot, assistant_id, thread_id, location], 
-                    outputs=[chatbot, thread_id, msg])
-        clear.click(lambda: (None, None, ""), None, [chatbot, thread_id], queue=False)
-        download_button.click(download_history, inputs=[chatbot], outputs=[download_output])
+                    inputs=[msg, session, assistant_id, thread_id, location], 
+                    outputs=[chatbot, thread_id, msg, session], api_name="chat",
+                    **chat_event("assistant", assistantID))
+        clear.click(clear_conversation, [session], [chatbot, thread_id], queue=False, api_name="clear")
+        download_button.click(download_history, inputs=[session, thread_id, download_format], outputs=[download_output, export_path], api_name="download",
+                              **download_event("assistant")).then(
+            release_export, inputs=[export_path], outputs=[export_path], queue=False)
+        app.load(restore_session, [session], [session, chatbot, thread_id], queue=False)
+    # Queue size and concurrency limits, see queue_config.py
+    app.queue(**queue_settings("assistant"))
     return app
 
 if __name__ == "__main__":
     gradio_init()
+    # Prometheus metrics on their own port when METRICS_PORT is set
+    start_metrics_server()
     app = assistant()
-    app.queue()
     app.launch()
\ No newline at end of file
@@ -1,166 +1,362 @@
 import os
-import csv
-import time
+import asyncio
 import gradio as gr
-from openai import OpenAI, AzureOpenAI
 from dotenv import load_dotenv
-import pprint
-import tempfile
 import json
-import traceback
-# Import from practical_ai_azure_keyvault
-from practical_ai_azure_keyvault import initialize_app, AIConfig
+import time
+import logging
+from assistant_catalog import AssistantCatalog
+from structured_logging import get_logger, log_event, elapsed_ms
+from metrics import stage, observe_stage
+from client_provider import get_client, get_async_client
+from run_poller import poll_run, apoll_run
+from thread_messages import latest_assistant_reply, alatest_assistant_reply, forget_thread
+from warm_threads import shared_thread_pool
+from streaming import stream_run, astream_run
+from session_store import shared_session_store, new_session_key
+from transcript_export import export_transcript, release_export, EXPORT_CHOICES, GRADIO_DELETE_CACHE
+from queue_config import queue_settings, chat_event, download_event, shared_assistant_slots
+from rate_limiter import shared_rate_limiter, estimate_tokens, waiting_message, RateLimitBusy
+from thread_runs import shared_thread_turns, session_thread, asession_thread, add_user_message, aadd_user_message, ThreadBusy, WAITING_FOR_PREVIOUS_REPLY
+from reply_cache import shared_reply_cache
+from resilience import describe_error
+from tool_registry import tool, dispatch_tool_calls, adispatch_tool_calls
+
+logger = get_logger("chat")
+
+INVALID_ASSISTANT = "Please select a valid assistant."
 
 client=None
+thread_pool=None
+rate_limiter=None
+thread_turns=None
+reply_cache=None
+sessions=None
+assistant_slots=None
+aclient=None
 assistants=None
+streamResponses=True
 
-# Read assistants from CSV
-def read_assistants():
-  assistants = {}
-  try:
-      with open('assistants.csv', 'r', newline='', encoding='utf-8') as f:
-          reader = csv.DictReader(f)
-          for row in reader:
-              if 'name' in row and 'assistant_id' in row:
-                  assistants[row['name']] = row['assistant_id']
-              else:
-                  print("Warning: CSV file is missing required columns")
-  except FileNotFoundError:
-      print("Error: assistants.csv file not found")
-  except csv.Error as e:
-      print(f"Error reading CSV file: {e}")
-  except Exception as e:
-      print(f"Unexpected error reading CSV: {e}")
-  
-  if not assistants:
-      print("Warning: No assistants loaded from CSV")
-  return assistants
+# Assistants are read from assistants.csv by an AssistantCatalog, which
+# reloads the file when it changes (see assistant_catalog.py)
+def search_assistants(key_up_data: gr.KeyUpData):
+    return gr.Dropdown(choices=assistants.search(key_up_data.input_value))
 
 # Load environment variables
 def gradio_init():
-    global client,assistants
+    global client,thread_pool,rate_limiter,thread_turns,reply_cache,sessions,assistant_slots,aclient,assistants,streamResponses
     load_dotenv()
+    # Set ASSISTANT_STREAMING=false to wait for the whole reply instead of streaming it
+    streamResponses = os.getenv("ASSISTANT_STREAMING", "true").lower() != "false"
 
-    # Check for API key
-    if os.getenv("OPENAI_API_KEY"):
-        # Initialize OpenAI client
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    else:
-        # Use device code authentication with Azure Key Vault
-        try:
-            # Initialize with your Key Vault name - this will trigger device code authentication
-            initialize_app("ClassWeatherAPI")  # Replace with your actual key vault name
-            
-            # Access the configuration
-            config = AIConfig()
-            
-            # Extract only the required parameters explicitly
-            endpoint = config.endpoint
-            api_key = config.api_key
-            api_version = config.api_version
-            
-            client = AzureOpenAI(
-                azure_endpoint=endpoint,
-                api_key=api_key,
-                api_version=api_version
-            )
-        except Exception as e:
-            raise ValueError(f"Failed to authenticate with Azure: {str(e)}")
+    # One client, connection pool and Key Vault login shared by every app in the process (see client_provider.py)
+    client = get_client()
+    aclient = get_async_client()
+
+    # Keep a few empty threads ready so new conversations skip threads.create()
+    thread_pool = shared_thread_pool(client)
+    # Runs and tokens per minute, per assistant and for the API key
+    rate_limiter = shared_rate_limiter()
+    # Turns on the same thread run one after another (see thread_runs.py)
+    thread_turns = shared_thread_turns()
+    # Replies to common first questions, for the assistants in REPLY_CACHE_ASSISTANTS
+    reply_cache = shared_reply_cache()
+    # Chat histories live on the server; the browser only keeps its session key
+    sessions = shared_session_store()
+    # Per-assistant caps on chat turns, set with ASSISTANT_CONCURRENCY (see queue_config.py)
+    assistant_slots = shared_assistant_slots()
 
-    assistants = read_assistants()
+    assistants = AssistantCatalog('assistants.csv')
     return
 
+# Tools: register each tool function under the name the LLM will call it, e.g.
+# @tool("tool_name", {"type": "object", "properties": {"parameter": {"type": "string"}}, "required": ["parameter"]}) #copy the parameters from the tool specification
+# def tool_function1(parameter):
+#     return {"result": ...} #the output of the tool, returned to the assistant as JSON
+
 # Function to interact with the selected assistant
 def chat_with_assistant(message, history, assistant_id, thread_id):
     try:
         if not thread_id:
-            thread = client.beta.threads.create()
-            thread_id = thread.id
-
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=message
-        )
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
-
-        # Wait for the run to complete with a timeout
-        start_time = time.time()
-        while run.status not in ["completed", "failed", "expired", "requires_action"]:
-            if time.time() - start_time > 60:  # 60 seconds timeout
-                raise TimeoutError("Assistant response timed out. Please try again.")
-            time.sleep(1)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-        # if there tools then uncomment below code
+            # Take a pre-created thread from the pool (see warm_threads.py)
+            with stage("thread_create", assistant_id):
+                thread_id = thread_pool.take()
+
+        with stage("message_create", assistant_id):
+            add_user_message(client, thread_id, message)
+
+        with stage("run_create", assistant_id):
+            run = client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id
+            )
+
+        # Wait for the run to finish, backing off between polls (see run_poller.py)
+        run = poll_run(client, thread_id, run, assistant_id)
+        # if there are tools then register them with @tool (see tool_registry.py) and uncomment below code
         # if run.status=="requires_action":
-        #     tools_output=[]
-        #     for tool in run.required_action.submit_tool_outputs.tool_calls:
-        #         if tool.function.name=="tool_name": #change to the tool name the LLM will call
-        #             tools_output.append({"tool_call_id":tool.id,"output":tool_funtion1(json.loads(tool.function.arguments)["parameter"])}) #change tool_funtion(parameter) to the function that will return the output of the tool
-        #         elif tool.function.name=="tool_name": #change to the tool name the LLM will call
-        #             tools_output.append({"tool_call_id":tool.id,"output":tool_funtion2(json.loads(tool.function.arguments)["parameter"])}) #change tool_funtion(parameter) to the function that will return the output of the tool
-        #     if tools_output:
-        #         try:
-        #             client.beta.threads.runs.submit_tool_outputs_and_poll(thread_id=thread_id,run_id=run.id,tool_outputs=tools_output)
-        #         except Exception as e:
-        #             print("failed to submit tool_outputs",e)
+        #     tools_output=dispatch_tool_calls(run.required_action.submit_tool_outputs.tool_calls) #runs every registered tool the LLM called at the same time
+        #     try:
+        #         run=client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id,run_id=run.id,tool_outputs=tools_output)
+        #         run=poll_run(client,thread_id,run,assistant_id)
+        #     except Exception as e:
+        #         log_event(logger,"tool_outputs_failed",level=logging.WARNING,exc_info=e,assistant_id=assistant_id,thread_id=thread_id,run_id=run.id)
         
         # 
         #   
         if run.status != "completed": #change to elif if tools
             raise Exception(f"Run failed: {run.last_error}")
 
-        # Retrieve messages
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        
-        # Get the latest assistant message
-        assistant_messages = [msg for msg in messages if msg.role == "assistant"]
-        if assistant_messages:
-            latest_message = assistant_messages[0].content[0].text.value
+        # Fetch only the reply written by this run
+        with stage("messages_list", assistant_id):
+            latest_message = latest_assistant_reply(client, thread_id, run.id)
+        if latest_message:
+            reply_cache.remember(assistant_id, message, history, latest_message)
+            return latest_message, thread_id
+        else:
+            return "No response from the assistant. Please try again.", thread_id
+
+    except Exception as e:
+        log_event(logger, "chat_error", level=logging.ERROR, exc_info=e, assistant_id=assistant_id, thread_id=thread_id)
+        return f"An error occurred: {describe_error(e)} Please try again or contact support if the issue persists.", thread_id
+
+
+# Stream the assistant's reply, yielding (text so far, thread_id) as tokens arrive
+def chat_with_assistant_stream(message, history, assistant_id, thread_id):
+    try:
+        if not thread_id:
+            # Take a pre-created thread from the pool (see warm_threads.py)
+            with stage("thread_create", assistant_id):
+                thread_id = thread_pool.take()
+
+        with stage("message_create", assistant_id):
+            add_user_message(client, thread_id, message)
+
+        # if there are tools then pass tool_handler=dispatch_tool_calls to stream_run
+        response = ""
+        for delta in stream_run(client, thread_id, assistant_id):
+            response += delta
+            yield response, thread_id
+        if response:
+            reply_cache.remember(assistant_id, message, history, response)
+        else:
+            yield "No response from the assistant. Please try again.", thread_id
+
+    except Exception as e:
+        log_event(logger, "chat_error", level=logging.ERROR, exc_info=e, assistant_id=assistant_id, thread_id=thread_id)
+        yield f"An error occurred: {describe_error(e)} Please try again or contact support if the issue persists.", thread_id
+
+# Yields (response so far, thread_id), streaming unless ASSISTANT_STREAMING=false.
+# history is the session's history, turn the index of this turn's reply in it
+def assistant_replies(message, history, session, turn, assistant_id, thread_turn):
+    thread_id = thread_turn.thread_id
+    try:
+        # One turn at a time per thread: a follow-up waits for the reply before it (see thread_runs.py)
+        for _ in thread_turn.wait():
+            yield WAITING_FOR_PREVIOUS_REPLY, thread_id
+        # The turns before this one have saved their replies by now; show them as saved
+        saved = sessions.get(session)["history"]
+        if len(saved) > turn:
+            history[:] = saved
+        earlier = history[:turn - 1]
+        # A first message asked before is answered from the reply cache, without a run (see reply_cache.py)
+        reply = reply_cache.lookup(client, assistant_id, message, earlier)
+        if reply is not None:
+            yield reply, thread_id
+            yield reply, reply_cache.record(client, assistant_id, message, reply, thread_id)
+            return
+        # Wait for the assistant's rate limit quota, showing the place in line (see rate_limiter.py)
+        for position in rate_limiter.wait(assistant_id, estimate_tokens(message, earlier)):
+            yield waiting_message(position), thread_id
+    except (ThreadBusy, RateLimitBusy) as e:
+        yield str(e), thread_id
+        return
+    if streamResponses:
+        yield from chat_with_assistant_stream(message, earlier, assistant_id, thread_id)
+    else:
+        yield chat_with_assistant(message, earlier, assistant_id, thread_id)
+
+
+# Async versions of the chat functions for the FastAPI app (app.py). These use
+# the async client so a waiting conversation does not hold a worker thread.
+async def chat_with_assistant_async(message, history, assistant_id, thread_id):
+    try:
+        if not thread_id:
+            # Take a pre-created thread from the pool (see warm_threads.py)
+            with stage("thread_create", assistant_id):
+                thread_id = await thread_pool.atake(aclient)
+
+        with stage("message_create", assistant_id):
+            await aadd_user_message(aclient, thread_id, message)
+
+        with stage("run_create", assistant_id):
+            run = await aclient.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id
+            )
+
+        # Wait for the run to finish, backing off between polls (see run_poller.py)
+        run = await apoll_run(aclient, thread_id, run, assistant_id)
+        if run.status != "completed":
+            raise Exception(f"Run failed: {run.last_error}")
+
+        # Fetch only the reply written by this run
+        with stage("messages_list", assistant_id):
+            latest_message = await alatest_assistant_reply(aclient, thread_id, run.id)
+        if latest_message:
+            reply_cache.remember(assistant_id, message, history, latest_message)
             return latest_message, thread_id
         else:
             return "No response from the assistant. Please try again.", thread_id
 
     except Exception as e:
-        tb = traceback.format_exc()
-        return f"An error occurred: {str(e)} at line {tb.splitlines()[-2]}. Please try again or contact support if the issue persists.", thread_id
+        log_event(logger, "chat_error", level=logging.ERROR, exc_info=e, assistant_id=assistant_id, thread_id=thread_id)
+        return f"An error occurred: {describe_error(e)} Please try again or contact support if the issue persists.", thread_id
 
+async def chat_with_assistant_stream_async(message, history, assistant_id, thread_id):
+    try:
+        if not thread_id:
+            # Take a pre-created thread from the pool (see warm_threads.py)
+            with stage("thread_create", assistant_id):
+                thread_id = await thread_pool.atake(aclient)
+
+        with stage("message_create", assistant_id):
+            await aadd_user_message(aclient, thread_id, message)
+
+        # if there are tools then pass tool_handler=adispatch_tool_calls to astream_run
+        response = ""
+        async for delta in astream_run(aclient, thread_id, assistant_id):
+            response += delta
+            yield response, thread_id
+        if response:
+            reply_cache.remember(assistant_id, message, history, response)
+        else:
+            yield "No response from the assistant. Please try again.", thread_id
+
+    except Exception as e:
+        log_event(logger, "chat_error", level=logging.ERROR, exc_info=e, assistant_id=assistant_id, thread_id=thread_id)
+        yield f"An error occurred: {describe_error(e)} Please try again or contact support if the issue persists.", thread_id
+
+async def assistant_replies_async(message, history, session, turn, assistant_id, thread_turn):
+    thread_id = thread_turn.thread_id
+    try:
+        async for _ in thread_turn.await_turn():
+            yield WAITING_FOR_PREVIOUS_REPLY, thread_id
+        saved = (await asyncio.to_thread(sessions.get, session))["history"]
+        if len(saved) > turn:
+            history[:] = saved
+        earlier = history[:turn - 1]
+        reply = await reply_cache.alookup(aclient, assistant_id, message, earlier)
+        if reply is not None:
+            yield reply, thread_id
+            yield reply, await reply_cache.arecord(aclient, assistant_id, message, reply, thread_id)
+            return
+        async for position in rate_limiter.await_turn(assistant_id, estimate_tokens(message, earlier)):
+            yield waiting_message(position), thread_id
+    except (ThreadBusy, RateLimitBusy) as e:
+        yield str(e), thread_id
+        return
+    if streamResponses:
+        async for reply in chat_with_assistant_stream_async(message, earlier, assistant_id, thread_id):
+            yield reply
+    else:
+        yield await chat_with_assistant_async(message, earlier, assistant_id, thread_id)
 
-def gradio_interface(message, history, assistant_name, thread_id):
-    if assistant_name not in assistants:
-        return "Please select a valid assistant.", history, thread_id
-    assistant_id = assistants[assistant_name]
-    response, new_thread_id = chat_with_assistant(message, history, assistant_id, thread_id)
+def gradio_interface(message, session, assistant_name, thread_id):
+    # The history is kept on the server; only the new message comes from the browser
+    session = session or new_session_key()
+    started = time.perf_counter()
+    assistant_id = assistants.get(assistant_name)
+    if assistant_id is None:
+        turn = sessions.add_message(session, message)
+        sessions.set_reply(session, INVALID_ASSISTANT, thread_id, turn)
+        saved = sessions.get(session)
+        yield saved["history"], thread_id or saved["thread_id"], message, session
+        return
+    turn = sessions.add_message(session, message, assistant_name)
+    saved = sessions.get(session)
+    history = saved["history"]
+    # gr.State lives in the worker that served the page; the session store is shared by every worker
+    thread_id = thread_id or saved["thread_id"]
+    # Two quick submits on a new conversation share one thread (see thread_runs.session_thread)
+    thread_id = thread_id or session_thread(sessions, session, thread_pool)
+    response, new_thread_id = "", thread_id
+    # The reply is saved before the turn ends, so the next turn on the thread finds it
+    with thread_turns.turn(thread_id) as thread_turn:
+        try:
+            with assistant_slots.slot(assistant_id):
+                for response, new_thread_id in assistant_replies(message, history, session, turn, assistant_id, thread_turn):
+                    history[turn]["content"] = response
+                    yield history, new_thread_id, "", session
+        finally:
+            sessions.set_reply(session, response, new_thread_id, turn)
+            # Sizes and timings only: message text stays out of the logs
+            log_event(logger, "chat_turn", sample=True, assistant_id=assistant_id, thread_id=new_thread_id, duration_ms=elapsed_ms(started),
+                      message_chars=len(message), reply_chars=len(response), turns=len(history) // 2)
+            observe_stage("turn", assistant_id, time.perf_counter() - started)
 
-    # Debug print statement
-    print("Debug - Returning from gradio_interface:")
-    print("Response:", response)
-    print("History:")
-    pprint.pprint(history)
-    print("New Thread ID:", new_thread_id)
-    history.append([message, response])
-    return history, new_thread_id, ""
+async def gradio_interface_async(message, session, assistant_name, thread_id):
+    # Session store calls can wait on the SQLite write lock, so they run off the event loop
+    session = session or new_session_key()
+    started = time.perf_counter()
+    assistant_id = assistants.get(assistant_name)
+    if assistant_id is None:
+        turn = await asyncio.to_thread(sessions.add_message, session, message)
+        await asyncio.to_thread(sessions.set_reply, session, INVALID_ASSISTANT, thread_id, turn)
+        saved = await asyncio.to_thread(sessions.get, session)
+        yield saved["history"], thread_id or saved["thread_id"], message, session
+        return
+    turn = await asyncio.to_thread(sessions.add_message, session, message, assistant_name)
+    saved = await asyncio.to_thread(sessions.get, session)
+    history = saved["history"]
+    thread_id = thread_id or saved["thread_id"]
+    # Two quick submits on a new conversation share one thread (see thread_runs.session_thread)
+    thread_id = thread_id or await asession_thread(sessions, session, thread_pool, aclient)
+    response = ""
+    with thread_turns.turn(thread_id) as thread_turn:
+        try:
+            async with assistant_slots.aslot(assistant_id):
+                async for response, thread_id in assistant_replies_async(message, history, session, turn, assistant_id, thread_turn):
+                    history[turn]["content"] = response
+                    yield history, thread_id, "", session
+        finally:
+            await asyncio.to_thread(sessions.set_reply, session, response, thread_id, turn)
+            # Sizes and timings only: message text stays out of the logs
+            log_event(logger, "chat_turn", sample=True, assistant_id=assistant_id, thread_id=thread_id, duration_ms=elapsed_ms(started),
+                      message_chars=len(message), reply_chars=len(response), turns=len(history) // 2)
+            observe_stage("turn", assistant_id, time.perf_counter() - started)
 
 # Function to download chat history
 
-def download_history(history):
-  history_text = "\n".join([f"Human: {h}\nAI: {a}" for h, a in history])
-  
-  # Create a temporary file with a short, fixed name
-  with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as temp_file:
-      temp_file.write(history_text)
-      temp_file_path = temp_file.name
-  
-  return temp_file_path
+# The transcript is read from the thread on the server, so it holds the whole
+# conversation rather than only what the browser still shows
+def download_history(session, thread_id, export_format="txt"):
+  saved = sessions.get(session)
+  history = saved["history"]
+  thread_id = thread_id or saved["thread_id"]
+  try:
+    path = export_transcript(client, thread_id, history, export_format)
+  except Exception as e:
+    log_event(logger, "export_fallback", level=logging.WARNING, exc_info=e, thread_id=thread_id)
+    path = export_transcript(client, None, history, export_format)
+  # The path is kept in a State so the file can be deleted once Gradio has served it
+  return path, path
 
 # Function to clear conversation and thread
-def clear_conversation():
+def clear_conversation(session):
+  thread_id = sessions.get(session)["thread_id"]
+  sessions.clear(session)
+  if thread_id:
+    forget_thread(thread_id)
   return None, None
 
+# Give the browser a session key, or restore the conversation it already has
+def restore_session(session):
+  if session not in sessions:
+    session = new_session_key()
+  saved = sessions.get(session)
+  return session, saved["history"] or None, saved["thread_id"], saved["assistant"]
+
 def assistant():
     head = """
     <script>
@@ -235,27 +431,43 @@ def assistant():
     </script>
     """
 
-    with gr.Blocks(css="#chatbot { height:600px; overflow-y:scroll; }", head=head) as app:
+    with gr.Blocks(css="#chatbot { height:600px; overflow-y:scroll; }", head=head, delete_cache=GRADIO_DELETE_CACHE) as app:
         # ... rest of your code
         gr.Markdown("# Chat with OpenAI Assistant")
         
         with gr.Row():
-            assistant_dropdown = gr.Dropdown(choices=list(assistants.keys()), label="Select Assistant")
+            # Choices are searched on the server as the user types, so large catalogs stay usable
+            # A restored session can name an assistant outside the first page of
+            # choices; gradio_interface checks the name, so accept any value here
+            assistant_dropdown = gr.Dropdown(choices=assistants.search(""), label="Select Assistant", filterable=True, allow_custom_value=True)
         
         chatbot = gr.Chatbot(elem_id="chatbot", height="600px", placeholder="say 'Hello' to start chatting with the assistant...")
         msg = gr.Textbox()
         clear = gr.Button("Clear")
         
+        download_format = gr.Radio(choices=EXPORT_CHOICES, value="txt", label="Download Format")
         download_button = gr.Button("Download Chat History")
         download_output = gr.File(label="Chat History")
+        export_path = gr.State()
 
         thread_id = gr.State()
+        # Kept in the browser's local storage so a reload finds its conversation again
+        session = gr.BrowserState(None, storage_key="assistant_dropdown_session")
 
-        msg.submit(gradio_interface, 
-                    inputs=[msg, chatbot, assistant_dropdown, thread_id], 
-                    outputs=[chatbot, thread_id, msg])
-        clear.click(lambda: (None, None,""), None, [chatbot, thread_id], queue=False)
-        download_button.click(download_history, inputs=[chatbot], outputs=[download_output])
+        msg.submit(gradio_interface_async, 
+                    inputs=[msg, session, assistant_dropdown, thread_id], 
+                    outputs=[chatbot, thread_id, msg, session], api_name="chat",
+                    **chat_event("dropdown"))
+        clear.click(clear_conversation, [session], [chatbot, thread_id], queue=False, api_name="clear")
+        download_button.click(download_history, inputs=[session, thread_id, download_format], outputs=[download_output, export_path], api_name="download",
+                              **download_event("dropdown")).then(
+            release_export, inputs=[export_path], outputs=[export_path], queue=False)
 
-        assistant_dropdown.change(clear_conversation, None, [chatbot, thread_id], queue=False)
+        # .input rather than .change, so restoring the selection on load keeps the conversation
+        assistant_dropdown.input(clear_conversation, [session], [chatbot, thread_id], queue=False, api_name="select_assistant")
+        app.load(restore_session, [session], [session, chatbot, thread_id, assistant_dropdown], queue=False)
+        assistant_dropdown.key_up(search_assistants, None, assistant_dropdown, queue=False)
+        assistant_dropdown.focus(lambda: gr.Dropdown(choices=assistants.search("")), None, assistant_dropdown, queue=False)
+    # Queue size and concurrency limits, see queue_config.py
+    app.queue(**queue_settings("dropdown"))
     return app
\ No newline at end of file
@@ -0,0 +1,306 @@
+"""Chat turn latency and throughput benchmark against the mock Assistants API.
+
+Starts benchmarks/mock_assistants_server.py, points the assistant modules at
+it (OPENAI_API_KEY=mock, OPENAI_BASE_URL) and drives their chat functions at
+each concurrency level. Every module variant runs in its own process so
+clients, thread pools and event loops are not shared between them:
+
+  poll          chat_with_assistant (runs.create + polling)
+  stream        chat_with_assistant_stream
+  async_poll    chat_with_assistant_async (FastAPI modules only)
+  async_stream  chat_with_assistant_stream_async (FastAPI modules only)
+
+For each variant and concurrency it reports p50/p95/p99/mean turn latency,
+time to first token for streamed variants, turns per second and errors.
+Results are JSON; pass --compare with an earlier result file to see the
+change in p50, p95 and turns per second between commits.
+
+    python benchmarks/chat_bench.py --concurrency 1 4 16 --turns 64 --output chat.json
+    python benchmarks/chat_bench.py --compare chat.json --run-seconds 0.5 --tool-rate 0.2
+
+Mock server options (--latency, --run-seconds, --failure-rate, --tool-rate,
+--tool-call, ...) are passed through; see mock_assistants_server.py.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import threading
+import concurrent.futures
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_assistants_server import add_arguments  # noqa: E402
+
+ASSISTANT_ID = "asst_benchmark"
+MESSAGE = "How many days a week should I train?"
+
+# module -> variants it supports
+MODULES = {
+    "assistant": ["poll", "stream", "async_poll", "async_stream"],
+    "assistant_with_dropdown": ["poll", "stream", "async_poll", "async_stream"],
+    "assistant_standalone": ["poll", "stream"],
+    "assistant_with_dropdown_standalone": ["poll", "stream"],
+}
+
+# Mock server options forwarded on its command line
+MOCK_OPTIONS = ["latency", "jitter", "run_seconds", "token_seconds", "reply_words",
+                "failure_rate", "error_rate", "tool_rate", "seed"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(latencies, first_tokens, errors, elapsed, concurrency):
+    latencies = sorted(latencies)
+    first_tokens = sorted(first_tokens)
+    turns = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "turns": turns,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "turns_per_second": round(turns / elapsed, 3) if elapsed else None,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / turns if turns else None,
+        },
+        "first_token_seconds": {
+            "p50": percentile(first_tokens, 50),
+            "p95": percentile(first_tokens, 95),
+            "p99": percentile(first_tokens, 99),
+        } if first_tokens else None,
+    }
+
+
+def is_error(reply):
+    return reply.startswith("An error occurred") or reply.startswith("No response from the assistant")
+
+
+# --- worker: runs inside the per-variant process ---
+
+def sync_turn(module, variant, thread_id):
+    started = time.perf_counter()
+    first_token = None
+    if variant == "poll":
+        reply, thread_id = module.chat_with_assistant(MESSAGE, [], ASSISTANT_ID, thread_id)
+    else:
+        reply = ""
+        for reply, thread_id in module.chat_with_assistant_stream(MESSAGE, [], ASSISTANT_ID, thread_id):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+    return time.perf_counter() - started, first_token, is_error(reply), thread_id
+
+
+async def async_turn(module, variant, thread_id):
+    started = time.perf_counter()
+    first_token = None
+    if variant == "async_poll":
+        reply, thread_id = await module.chat_with_assistant_async(MESSAGE, [], ASSISTANT_ID, thread_id)
+    else:
+        reply = ""
+        async for reply, thread_id in module.chat_with_assistant_stream_async(MESSAGE, [], ASSISTANT_ID, thread_id):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+    return time.perf_counter() - started, first_token, is_error(reply), thread_id
+
+
+def run_sync_level(module, variant, concurrency, turns):
+    results = []
+    lock = threading.Lock()
+
+    def conversation(count):
+        # Each worker is one user holding one conversation
+        thread_id = None
+        for _ in range(count):
+            latency, first_token, error, thread_id = sync_turn(module, variant, thread_id)
+            with lock:
+                results.append((latency, first_token, error))
+
+    counts = [turns // concurrency + (1 if i < turns % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(conversation, counts))
+    return results, time.perf_counter() - started
+
+
+async def run_async_level(module, variant, concurrency, turns):
+    results = []
+
+    async def conversation(count):
+        thread_id = None
+        for _ in range(count):
+            latency, first_token, error, thread_id = await async_turn(module, variant, thread_id)
+            results.append((latency, first_token, error))
+
+    counts = [turns // concurrency + (1 if i < turns % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(count) for count in counts if count))
+    return results, time.perf_counter() - started
+
+
+def worker(module_name, variant, levels, turns):
+    import importlib
+    module = importlib.import_module(module_name)
+    module.gradio_init()
+    if variant.startswith("async"):
+        async def all_levels():
+            await async_turn(module, variant, None)  # warm up connections
+            return [(c, await run_async_level(module, variant, c, turns)) for c in levels]
+        measured = asyncio.run(all_levels())
+    else:
+        sync_turn(module, variant, None)  # warm up connections
+        measured = [(c, run_sync_level(module, variant, c, turns)) for c in levels]
+
+    summaries = []
+    for concurrency, (results, elapsed) in measured:
+        latencies = [latency for latency, _, _ in results]
+        first_tokens = [first for _, first, _ in results if first is not None]
+        errors = sum(1 for _, _, error in results if error)
+        summaries.append(summarize(latencies, first_tokens, errors, elapsed, concurrency))
+    print(json.dumps(summaries))
+
+
+# --- driver ---
+
+def start_mock(args, port):
+    command = [sys.executable, os.path.join(ROOT, "benchmarks", "mock_assistants_server.py"), "--port", str(port)]
+    for name in MOCK_OPTIONS:
+        value = getattr(args, name)
+        if value is not None:
+            command += [f"--{name.replace('_', '-')}", str(value)]
+    for name, arguments in args.tool_calls or []:
+        command += ["--tool-call", f"{name}:{json.dumps(arguments)}"]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/mock/stats", timeout=5)
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("mock server did not start")
+
+
+def run_variant(module_name, variant, args, port):
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "OPENAI_ASSISTANT_ID": ASSISTANT_ID,
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    command = [sys.executable, os.path.abspath(__file__), "--worker", module_name, variant,
+               "--concurrency", *map(str, args.concurrency), "--turns", str(args.turns)]
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, timeout=args.timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"{module_name}/{variant} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results):
+    """Print the change in p50, p95 and turns per second against a baseline result file."""
+    previous = {(r["module"], r["variant"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"Compared with {baseline.get('commit')}:", file=sys.stderr)
+    for r in results:
+        old = previous.get((r["module"], r["variant"], r["concurrency"]))
+        if old is None:
+            continue
+        changes = []
+        for label, new_value, old_value in (
+            ("p50", r["latency_seconds"]["p50"], old["latency_seconds"]["p50"]),
+            ("p95", r["latency_seconds"]["p95"], old["latency_seconds"]["p95"]),
+            ("turns/s", r["turns_per_second"], old["turns_per_second"]),
+        ):
+            if new_value is not None and old_value:
+                changes.append(f"{label} {(new_value - old_value) / old_value:+.1%}")
+        print(f"  {r['module']}/{r['variant']} c={r['concurrency']}: {', '.join(changes)}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", choices=list(MODULES), default=list(MODULES))
+    parser.add_argument("--variants", nargs="+", choices=["poll", "stream", "async_poll", "async_stream"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--turns", type=int, default=32, help="turns per concurrency level")
+    parser.add_argument("--timeout", type=float, default=900, help="seconds allowed per variant")
+    parser.add_argument("--output", help="write the JSON results here as well as to stdout")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--worker", nargs=2, metavar=("MODULE", "VARIANT"), help=argparse.SUPPRESS)
+    add_arguments(parser)
+    # Leave unset mock options to the server's defaults
+    parser.set_defaults(**{name: None for name in MOCK_OPTIONS})
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker[0], args.worker[1], args.concurrency, args.turns)
+        return
+
+    port = free_port()
+    mock = start_mock(args, port)
+    results = []
+    try:
+        for module_name in args.modules:
+            for variant in MODULES[module_name]:
+                if args.variants and variant not in args.variants:
+                    continue
+                for summary in run_variant(module_name, variant, args, port):
+                    results.append({"module": module_name, "variant": variant, **summary})
+                    latency = summary["latency_seconds"]
+                    print(f"{module_name}/{variant} c={summary['concurrency']}: p50 {latency['p50']:.3f}s "
+                          f"p95 {latency['p95']:.3f}s p99 {latency['p99']:.3f}s, "
+                          f"{summary['turns_per_second']} turns/s, {summary['errors']} errors", file=sys.stderr)
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    output = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "mock": {name: getattr(args, name) for name in MOCK_OPTIONS},
+        "turns": args.turns,
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    text = json.dumps(output, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
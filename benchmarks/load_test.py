@@ -0,0 +1,280 @@
+"""Load test for the Gradio apps mounted by app.py, through the Gradio client protocol.
+
+Each simulated session is its own gradio_client.Client (its own Gradio
+session) holding a multi-turn conversation with /gradio or /gradio2. On
+/gradio2 it switches assistant through the dropdown every --switch-every
+turns, and every session can finish with a transcript download. Sessions
+start spread over --ramp seconds and pause --think seconds between turns.
+
+Every event is split into queue wait (submitted until Gradio starts
+processing it) and processing time (until it finishes), and the report gives
+p50/p95/p99 of each per mount and event, with error counts, as JSON. A chat
+turn whose reply is an error message (see chat_bench.is_error) counts as an
+error, not only one whose event failed.
+
+Against a running server:
+
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --sessions 50 --turns 4
+
+Against the mock backend: --start-app starts benchmarks/mock_assistants_server.py
+and app.py pointed at it, with a generated assistants.csv. Mock server options
+(--run-seconds, --tool-rate, ...) are passed through:
+
+    python benchmarks/load_test.py --start-app --sessions 50 --turns 4 --run-seconds 2 --output load.json
+"""
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import random
+import tempfile
+import argparse
+import threading
+import subprocess
+import urllib.request
+import concurrent.futures
+from datetime import datetime
+from gradio_client import Client
+from gradio_client.utils import Status, StatusUpdate
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from chat_bench import ROOT, MOCK_OPTIONS, free_port, percentile, start_mock, is_error  # noqa: E402
+from mock_assistants_server import add_arguments  # noqa: E402
+
+PROCESSING_STATUSES = (Status.PROCESSING, Status.ITERATING)
+MESSAGES = [
+    "Can you give me a three day workout plan?",
+    "What should I eat before training?",
+    "How much protein do I need a day?",
+    "Summarise what we talked about.",
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+
+def status_updates(job):
+    """Every status update the job received, in order, each stamped with the time it arrived."""
+    updates = []
+    communicator = getattr(job, "communicator", None)
+    while communicator is not None and not communicator.updates.empty():
+        update = communicator.updates.get_nowait()
+        if isinstance(update, StatusUpdate):
+            updates.append(update)
+    return updates
+
+
+def reply_error(event, result):
+    """The error a chat event answered with, or None."""
+    if event != "chat":
+        return None
+    history = result[0] if isinstance(result, (list, tuple)) else result
+    reply = history[-1]["content"] if history else ""
+    if isinstance(reply, list):
+        # Gradio 6 sends message content as a list of typed parts
+        reply = "".join(part.get("text", "") for part in reply if isinstance(part, dict))
+    return f"reply: {reply[:200]}" if isinstance(reply, str) and is_error(reply) else None
+
+
+def timed_event(client, recorder, mount, event, **kwargs):
+    """Run one event, splitting its time into queue wait and processing from its status updates."""
+    submitted = datetime.now()
+    job = None
+    error = None
+    try:
+        job = client.submit(api_name=f"/{event}", **kwargs)
+        error = reply_error(event, job.result())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finished = datetime.now()
+    updates = status_updates(job) if job is not None else []
+    processing_started = next((u.time for u in updates if u.code in PROCESSING_STATUSES), None)
+    # An event that reports no processing status was not queued
+    start = processing_started or submitted
+    recorder.add({
+        "mount": mount,
+        "event": event,
+        "queue_wait": (start - submitted).total_seconds() if processing_started else None,
+        "processing": (finished - start).total_seconds(),
+        "total": (finished - submitted).total_seconds(),
+        "error": error,
+    })
+
+
+def endpoint_parameters(client):
+    """{event: parameter names} for the app's named endpoints."""
+    endpoints = client.view_api(print_info=False, return_format="dict")["named_endpoints"]
+    return {name.lstrip("/"): [p["parameter_name"] for p in info["parameters"]] for name, info in endpoints.items()}
+
+
+def run_session(index, base_url, mount, args, assistants, recorder):
+    time.sleep(args.ramp * index / max(args.sessions, 1))
+    rng = random.Random(index)
+    client = Client(f"{base_url}{mount}/", verbose=False)
+    parameters = endpoint_parameters(client)
+    values = {
+        # The session key the browser would keep in local storage
+        "session": uuid.uuid4().hex,
+        "location": "San Francisco, CA",
+        "assistant_name": rng.choice(assistants) if assistants else None,
+        "export_format": args.download,
+    }
+
+    def send(event):
+        timed_event(client, recorder, mount, event, **{name: values.get(name) for name in parameters[event]})
+
+    can_switch = "select_assistant" in parameters and len(assistants) > 1
+    for turn in range(args.turns):
+        if can_switch and args.switch_every and turn and turn % args.switch_every == 0:
+            values["assistant_name"] = rng.choice([a for a in assistants if a != values["assistant_name"]])
+            send("select_assistant")
+        values["message"] = MESSAGES[turn % len(MESSAGES)]
+        send("chat")
+        if args.think:
+            time.sleep(rng.uniform(0.5, 1.5) * args.think)
+    if args.download and "download" in parameters:
+        send("download")
+
+
+def report(records, elapsed):
+    groups = {}
+    for record in records:
+        groups.setdefault((record["mount"], record["event"]), []).append(record)
+    events = []
+    for (mount, event), group in sorted(groups.items()):
+        entry = {"mount": mount, "event": event, "count": len(group), "errors": sum(1 for r in group if r["error"])}
+        for field in ("queue_wait", "processing", "total"):
+            values = sorted(r[field] for r in group if r[field] is not None and not r["error"])
+            entry[f"{field}_seconds"] = {
+                "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+                "max": values[-1] if values else None,
+            }
+        entry["sample_errors"] = sorted({r["error"] for r in group if r["error"]})[:5]
+        events.append(entry)
+    return {"seconds": round(elapsed, 3), "events_per_second": round(len(records) / elapsed, 3) if elapsed else None, "events": events}
+
+
+def wait_for(url, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not answer within {timeout} seconds")
+
+
+def start_app(args, mock_port, workdir):
+    """app.py on a free port, using the mock backend and a generated assistants.csv."""
+    names = [f"Mock Assistant {i}" for i in range(args.mock_assistants)]
+    with open(os.path.join(workdir, "assistants.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["assistant_id", "name"])
+        for i, name in enumerate(names):
+            writer.writerow([f"asst_mock_{i}", name])
+    port = free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "OPENAI_ASSISTANT_ID": "asst_mock_0",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", ROOT, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for mount in args.mounts:
+        wait_for(f"{base_url}{mount}/", process, args.startup_timeout)
+    return process, base_url, names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="server running app.py")
+    parser.add_argument("--mounts", nargs="+", default=["/gradio", "/gradio2"])
+    parser.add_argument("--sessions", type=int, default=20, help="simulated sessions per mount")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--switch-every", type=int, default=2, help="switch assistant every N turns on dropdown apps, 0 never")
+    parser.add_argument("--download", default="txt", help="export format to download at the end of each session, empty for none")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which the sessions start")
+    parser.add_argument("--think", type=float, default=1.0, help="average pause between turns in seconds")
+    parser.add_argument("--assistants", nargs="+", help="assistant names to pick from on dropdown apps")
+    parser.add_argument("--start-app", action="store_true", help="start the mock backend and app.py for the run")
+    parser.add_argument("--mock-assistants", type=int, default=3, help="assistants in the generated assistants.csv")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    add_arguments(parser)
+    parser.set_defaults(**{name: None for name in MOCK_OPTIONS})
+    args = parser.parse_args()
+
+    processes = []
+    base_url = args.url.rstrip("/")
+    assistants = args.assistants or []
+    # The started app runs in a scratch directory (its assistants.csv, session database), removed once it has stopped
+    with tempfile.TemporaryDirectory(prefix="load_test_") as workdir:
+        try:
+            if args.start_app:
+                mock_port = free_port()
+                processes.append(start_mock(args, mock_port))
+                app_process, base_url, names = start_app(args, mock_port, workdir)
+                processes.append(app_process)
+                assistants = args.assistants or names
+            elif not assistants and os.path.exists(os.path.join(ROOT, "assistants.csv")):
+                with open(os.path.join(ROOT, "assistants.csv"), newline="") as f:
+                    assistants = [row["name"] for row in csv.DictReader(f)]
+
+            recorder = Recorder()
+            started = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.sessions * len(args.mounts)) as executor:
+                futures = [
+                    executor.submit(run_session, i, base_url, mount, args, assistants, recorder)
+                    for mount in args.mounts for i in range(args.sessions)
+                ]
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"session failed: {e}", file=sys.stderr)
+            elapsed = time.perf_counter() - started
+        finally:
+            for process in processes:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    result = {
+        "url": base_url,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "sessions": args.sessions,
+        "turns": args.turns,
+        **report(recorder.records, elapsed),
+    }
+    for event in result["events"]:
+        queue_wait, processing = event["queue_wait_seconds"], event["processing_seconds"]
+        print(f"{event['mount']} {event['event']}: {event['count']} events, {event['errors']} errors, "
+              f"queue p50 {queue_wait['p50']} p95 {queue_wait['p95']}, "
+              f"processing p50 {processing['p50']} p95 {processing['p95']}", file=sys.stderr)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
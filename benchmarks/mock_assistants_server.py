@@ -0,0 +1,501 @@
+"""Local stand-in for the OpenAI Assistants API.
+
+Implements the assistant, thread, message, run and tool-output endpoints
+the assistant modules use (including streamed runs) with configurable
+latency, failures and tool calls, so chat throughput and latency can be
+measured without spending API quota. The assistant, file and vector store
+endpoints migrate_assistants.py uses are there too, so a migration can be
+tried between two mock servers. Point the apps at it with
+
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+
+    python benchmarks/mock_assistants_server.py --port 8100 --run-seconds 1.5 --tool-rate 0.2
+
+Runs finish run_seconds after they are created (give or take --jitter).
+A run may instead end failed (--failure-rate), or stop with requires_action
+for one of the --tool-call calls first (--tool-rate). --error-rate makes any
+request return 500. The reply is --reply-words words long and, when
+streamed, arrives one word every --token-seconds. Like the real API, a
+thread takes no new messages or runs while one of its runs is active.
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+class MockConfig:
+    def __init__(self, latency=0.02, jitter=0.25, run_seconds=1.0, token_seconds=0.01, reply_words=60,
+                 failure_rate=0.0, error_rate=0.0, tool_rate=0.0, tool_calls=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.run_seconds = run_seconds
+        self.token_seconds = token_seconds
+        self.reply_words = reply_words
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.tool_rate = tool_rate
+        self.tool_calls = tool_calls or [("Generate_Workout_Plan", {"days": "3"})]
+        self.random = random.Random(seed)
+
+    def vary(self, seconds):
+        """seconds give or take jitter (a fraction of it)."""
+        return max(0.0, seconds * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+
+def _id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _text_content(text):
+    return [{"type": "text", "text": {"value": text, "annotations": []}}]
+
+
+class MockState:
+    def __init__(self, config):
+        self.config = config
+        self.threads = {}   # thread_id -> thread object
+        self.messages = {}  # thread_id -> [message], oldest first
+        self.runs = {}      # run_id -> run object
+        self.plans = {}     # run_id -> what the run will do
+        self.assistants = {}     # assistant_id -> assistant object, oldest first
+        self.files = {}          # file_id -> (file object, content)
+        self.vector_stores = {}  # vector_store_id -> (vector store object, [file_id])
+        self.counts = {"requests": 0, "errors": 0, "runs": 0}
+
+    def new_thread(self, metadata=None):
+        thread = {"id": _id("thread"), "object": "thread", "created_at": int(time.time()),
+                  "metadata": metadata or {}, "tool_resources": None}
+        self.threads[thread["id"]] = thread
+        self.messages[thread["id"]] = []
+        return thread
+
+    def add_message(self, thread_id, role, text, assistant_id=None, run_id=None):
+        message = {
+            "id": _id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": role, "content": _text_content(text),
+            "assistant_id": assistant_id, "run_id": run_id, "attachments": [], "metadata": {},
+            "status": "completed", "completed_at": int(time.time()), "incomplete_at": None, "incomplete_details": None
+        }
+        self.messages[thread_id].append(message)
+        return message
+
+    def new_assistant(self, body, assistant_id=None):
+        assistant = {
+            "id": assistant_id or _id("asst"), "object": "assistant", "created_at": int(time.time()),
+            "name": body.get("name"), "description": body.get("description"), "model": body.get("model", "mock"),
+            "instructions": body.get("instructions"), "tools": body.get("tools") or [],
+            "tool_resources": body.get("tool_resources"), "metadata": body.get("metadata") or {},
+            "temperature": body.get("temperature", 1.0), "top_p": body.get("top_p", 1.0), "response_format": "auto"
+        }
+        self.assistants[assistant["id"]] = assistant
+        return assistant
+
+    def new_file(self, filename, content, purpose="assistants"):
+        # File IDs use a dash, like the real ones
+        file = {"id": "file-" + uuid.uuid4().hex[:24], "object": "file", "bytes": len(content),
+                "created_at": int(time.time()), "filename": filename, "purpose": purpose, "status": "processed"}
+        self.files[file["id"]] = (file, content)
+        return file
+
+    def new_vector_store(self, name=None, file_ids=None, metadata=None):
+        file_ids = list(file_ids or [])
+        store = {
+            "id": _id("vs"), "object": "vector_store", "created_at": int(time.time()), "name": name,
+            "usage_bytes": 0, "status": "completed", "expires_after": None, "expires_at": None,
+            "last_active_at": int(time.time()), "metadata": metadata or {},
+            "file_counts": {"in_progress": 0, "completed": len(file_ids), "failed": 0, "cancelled": 0, "total": len(file_ids)}
+        }
+        self.vector_stores[store["id"]] = (store, file_ids)
+        return store
+
+    def reply_text(self):
+        return " ".join(f"word{i}" for i in range(self.config.reply_words))
+
+    def new_run(self, thread_id, assistant_id):
+        config = self.config
+        now = time.time()
+        run = {
+            "id": _id("run"), "object": "thread.run", "created_at": int(now), "thread_id": thread_id,
+            "assistant_id": assistant_id, "status": "queued", "required_action": None, "last_error": None,
+            "expires_at": int(now) + 600, "started_at": int(now), "cancelled_at": None, "failed_at": None,
+            "completed_at": None, "incomplete_details": None, "model": "mock", "instructions": "",
+            "tools": [], "metadata": {}, "usage": None, "temperature": 1.0, "top_p": 1.0,
+            "max_prompt_tokens": None, "max_completion_tokens": None, "truncation_strategy": None,
+            "response_format": "auto", "tool_choice": "auto", "parallel_tool_calls": True
+        }
+        roll = config.random.random()
+        if roll < config.failure_rate:
+            outcome = "failed"
+        elif roll < config.failure_rate + config.tool_rate:
+            outcome = "requires_action"
+        else:
+            outcome = "completed"
+        self.plans[run["id"]] = {"ready_at": now + config.vary(config.run_seconds), "outcome": outcome}
+        self.runs[run["id"]] = run
+        self.counts["runs"] += 1
+        return run
+
+    def active_run(self, thread_id):
+        """The thread's run that is still going, if any."""
+        for run in self.runs.values():
+            if run["thread_id"] == thread_id:
+                self.advance(run)
+                if run["status"] in ("queued", "in_progress", "requires_action", "cancelling"):
+                    return run
+        return None
+
+    def tool_action(self):
+        calls = [
+            {"id": _id("call"), "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+            for name, arguments in self.config.tool_calls
+        ]
+        return {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": calls}}
+
+    def finish(self, run, status):
+        """Move a run to its final (or requires_action) status."""
+        now = int(time.time())
+        run["status"] = status
+        if status == "completed":
+            run["completed_at"] = now
+            run["required_action"] = None
+            self.add_message(run["thread_id"], "assistant", self.reply_text(), run["assistant_id"], run["id"])
+        elif status == "failed":
+            run["failed_at"] = now
+            run["last_error"] = {"code": "server_error", "message": "Mock run failure"}
+        elif status == "requires_action":
+            run["required_action"] = self.tool_action()
+        elif status == "cancelled":
+            run["cancelled_at"] = now
+
+    def advance(self, run):
+        """Settle a polled run whose time has come."""
+        plan = self.plans.get(run["id"])
+        if plan and plan.get("streaming"):
+            # The stream settles the run itself
+            return run
+        if plan and run["status"] in ("queued", "in_progress") and time.time() >= plan["ready_at"]:
+            self.finish(run, plan["outcome"])
+        elif plan and run["status"] == "queued":
+            run["status"] = "in_progress"
+        return run
+
+    def submit_tool_outputs(self, run):
+        # After the tool outputs the run carries on and completes
+        run["status"] = "queued"
+        run["required_action"] = None
+        self.plans[run["id"]] = {"ready_at": time.time() + self.config.vary(self.config.run_seconds), "outcome": "completed"}
+        return run
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_run(state, run):
+    """SSE events for a streamed run, ending at completion, failure or requires_action."""
+    config = state.config
+    plan = state.plans[run["id"]]
+    plan["streaming"] = True
+    try:
+        async for event in _stream_events(state, run, plan, config):
+            yield event
+    finally:
+        # A run whose stream was dropped carries on and finishes when polled, as on the real server
+        plan["streaming"] = False
+
+
+async def _stream_events(state, run, plan, config):
+    yield _sse("thread.run.created", run)
+    run["status"] = "in_progress"
+    yield _sse("thread.run.in_progress", run)
+    if plan["outcome"] != "completed":
+        await asyncio.sleep(max(0.0, plan["ready_at"] - time.time()))
+        if run["status"] != "in_progress":
+            return
+        state.finish(run, plan["outcome"])
+        yield _sse(f"thread.run.{plan['outcome']}", run)
+        yield "event: done\ndata: [DONE]\n\n"
+        return
+
+    # Time before the first token; the words then take token_seconds each
+    words = state.reply_text().split(" ")
+    first_token = max(0.0, plan["ready_at"] - time.time() - config.token_seconds * len(words))
+    await asyncio.sleep(first_token)
+    message = {
+        "id": _id("msg"), "object": "thread.message", "created_at": int(time.time()),
+        "thread_id": run["thread_id"], "role": "assistant", "content": [], "assistant_id": run["assistant_id"],
+        "run_id": run["id"], "attachments": [], "metadata": {}, "status": "in_progress",
+        "completed_at": None, "incomplete_at": None, "incomplete_details": None
+    }
+    yield _sse("thread.message.created", message)
+    yield _sse("thread.message.in_progress", message)
+    for i, word in enumerate(words):
+        if run["status"] != "in_progress":
+            # Cancelled while streaming
+            return
+        chunk = word if i == 0 else " " + word
+        delta = {"id": message["id"], "object": "thread.message.delta",
+                 "delta": {"content": [{"index": 0, "type": "text", "text": {"value": chunk, "annotations": []}}]}}
+        yield _sse("thread.message.delta", delta)
+        if config.token_seconds:
+            await asyncio.sleep(config.token_seconds)
+    message.update(status="completed", completed_at=int(time.time()), content=_text_content(" ".join(words)))
+    state.messages[run["thread_id"]].append(message)
+    yield _sse("thread.message.completed", message)
+    run["status"] = "completed"
+    run["completed_at"] = int(time.time())
+    yield _sse("thread.run.completed", run)
+    yield "event: done\ndata: [DONE]\n\n"
+
+
+def _not_found(kind, object_id):
+    return JSONResponse({"error": {"message": f"No {kind} found with id '{object_id}'.", "type": "invalid_request_error"}}, status_code=404)
+
+
+def _bad_request(message):
+    return JSONResponse({"error": {"message": message, "type": "invalid_request_error"}}, status_code=400)
+
+
+def _list_page(items, limit=20, after=None):
+    """A cursor page of items, oldest first, starting after the item with id after."""
+    ids = [item["id"] for item in items]
+    if after in ids:
+        items = items[ids.index(after) + 1:]
+    page = items[:limit]
+    return {"object": "list", "data": page, "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None, "has_more": len(items) > limit}
+
+
+def create_app(config=None):
+    config = config or MockConfig()
+    state = MockState(config)
+    app = FastAPI()
+    app.state.mock = state
+
+    @app.middleware("http")
+    async def latency_and_errors(request, call_next):
+        state.counts["requests"] += 1
+        if config.latency:
+            await asyncio.sleep(config.vary(config.latency))
+        if config.error_rate and config.random.random() < config.error_rate:
+            state.counts["errors"] += 1
+            return JSONResponse({"error": {"message": "Mock server error", "type": "server_error"}}, status_code=500)
+        return await call_next(request)
+
+    @app.post("/v1/assistants")
+    async def create_assistant(request: Request):
+        return state.new_assistant(await request.json())
+
+    @app.get("/v1/assistants")
+    async def list_assistants(limit: int = 20, after: str = None):
+        return _list_page(list(state.assistants.values()), limit, after)
+
+    @app.get("/v1/assistants/{assistant_id}")
+    async def retrieve_assistant(assistant_id: str):
+        if assistant_id in state.assistants:
+            return state.assistants[assistant_id]
+        # Any other ID is an assistant too, so the chat benchmarks need no setup
+        return {"id": assistant_id, "object": "assistant", "created_at": 0, "name": assistant_id, "description": None,
+                "model": "mock", "instructions": "", "tools": [], "tool_resources": None, "metadata": {},
+                "temperature": 1.0, "top_p": 1.0, "response_format": "auto"}
+
+    @app.post("/v1/files")
+    async def create_file(request: Request):
+        form = await request.form()
+        upload = form["file"]
+        return state.new_file(upload.filename, await upload.read(), form.get("purpose", "assistants"))
+
+    @app.get("/v1/files/{file_id}")
+    async def retrieve_file(file_id: str):
+        if file_id not in state.files:
+            return _not_found("file", file_id)
+        return state.files[file_id][0]
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in state.files:
+            return _not_found("file", file_id)
+        return Response(state.files[file_id][1], media_type="application/octet-stream")
+
+    @app.post("/v1/vector_stores")
+    async def create_vector_store(request: Request):
+        body = await request.json()
+        missing = [file_id for file_id in body.get("file_ids") or [] if file_id not in state.files]
+        if missing:
+            return _bad_request(f"Files not found: {', '.join(missing)}")
+        return state.new_vector_store(body.get("name"), body.get("file_ids"), body.get("metadata"))
+
+    @app.get("/v1/vector_stores")
+    async def list_vector_stores(limit: int = 20, after: str = None):
+        return _list_page([store for store, _ in state.vector_stores.values()], limit, after)
+
+    @app.get("/v1/vector_stores/{vector_store_id}")
+    async def retrieve_vector_store(vector_store_id: str):
+        if vector_store_id not in state.vector_stores:
+            return _not_found("vector store", vector_store_id)
+        return state.vector_stores[vector_store_id][0]
+
+    @app.get("/v1/vector_stores/{vector_store_id}/files")
+    async def list_vector_store_files(vector_store_id: str, limit: int = 20, after: str = None):
+        if vector_store_id not in state.vector_stores:
+            return _not_found("vector store", vector_store_id)
+        store, file_ids = state.vector_stores[vector_store_id]
+        files = [{"id": file_id, "object": "vector_store.file", "created_at": store["created_at"],
+                  "vector_store_id": vector_store_id, "status": "completed", "usage_bytes": 0, "last_error": None}
+                 for file_id in file_ids]
+        return _list_page(files, limit, after)
+
+    @app.post("/v1/threads")
+    async def create_thread(request: Request):
+        body = await request.json() if await request.body() else {}
+        thread = state.new_thread(body.get("metadata"))
+        for message in body.get("messages") or []:
+            state.add_message(thread["id"], message.get("role", "user"), message.get("content", ""))
+        return thread
+
+    @app.delete("/v1/threads/{thread_id}")
+    async def delete_thread(thread_id: str):
+        state.threads.pop(thread_id, None)
+        state.messages.pop(thread_id, None)
+        return {"id": thread_id, "object": "thread.deleted", "deleted": True}
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def create_message(thread_id: str, request: Request):
+        if thread_id not in state.threads:
+            return _not_found("thread", thread_id)
+        active = state.active_run(thread_id)
+        if active:
+            return _bad_request(f"Can't add messages to {thread_id} while a run {active['id']} is active.")
+        body = await request.json()
+        content = body.get("content", "")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+        return state.add_message(thread_id, body.get("role", "user"), content)
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str, order: str = "desc", limit: int = 20, after: str = None,
+                            before: str = None, run_id: str = None):
+        if thread_id not in state.threads:
+            return _not_found("thread", thread_id)
+        for run in state.runs.values():
+            if run["thread_id"] == thread_id:
+                state.advance(run)
+        messages = [m for m in state.messages[thread_id] if run_id is None or m["run_id"] == run_id]
+        if order == "desc":
+            messages = list(reversed(messages))
+        ids = [m["id"] for m in messages]
+        if after in ids:
+            messages = messages[ids.index(after) + 1:]
+        elif before in ids:
+            messages = messages[:ids.index(before)]
+        page = messages[:limit]
+        return {"object": "list", "data": page, "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None, "has_more": len(messages) > limit}
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        if thread_id not in state.threads:
+            return _not_found("thread", thread_id)
+        active = state.active_run(thread_id)
+        if active:
+            return _bad_request(f"Thread {thread_id} already has an active run {active['id']}.")
+        body = await request.json()
+        run = state.new_run(thread_id, body.get("assistant_id"))
+        if body.get("stream"):
+            return StreamingResponse(_stream_run(state, run), media_type="text/event-stream")
+        return run
+
+    @app.get("/v1/threads/{thread_id}/runs")
+    async def list_runs(thread_id: str, limit: int = 20):
+        if thread_id not in state.threads:
+            return _not_found("thread", thread_id)
+        runs = [state.advance(run) for run in reversed(list(state.runs.values())) if run["thread_id"] == thread_id]
+        page = runs[:limit]
+        return {"object": "list", "data": page, "first_id": page[0]["id"] if page else None,
+                "last_id": page[-1]["id"] if page else None, "has_more": len(runs) > limit}
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def retrieve_run(thread_id: str, run_id: str):
+        if run_id not in state.runs:
+            return _not_found("run", run_id)
+        return state.advance(state.runs[run_id])
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+    async def submit_tool_outputs(thread_id: str, run_id: str, request: Request):
+        run = state.runs.get(run_id)
+        if run is None:
+            return _not_found("run", run_id)
+        if run["status"] != "requires_action":
+            return _bad_request(f"Run {run_id} is not waiting for tool outputs")
+        body = await request.json()
+        state.submit_tool_outputs(run)
+        if body.get("stream"):
+            return StreamingResponse(_stream_run(state, run), media_type="text/event-stream")
+        return run
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+    async def cancel_run(thread_id: str, run_id: str):
+        run = state.runs.get(run_id)
+        if run is None:
+            return _not_found("run", run_id)
+        if run["status"] in ("queued", "in_progress", "requires_action"):
+            state.finish(run, "cancelled")
+            state.plans.pop(run_id, None)
+        return run
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {**state.counts, "threads": len(state.threads), "assistants": len(state.assistants),
+                "files": len(state.files), "vector_stores": len(state.vector_stores)}
+
+    return app
+
+
+def parse_tool_call(value):
+    """--tool-call 'Name:{"arg": "value"}'"""
+    name, _, arguments = value.partition(":")
+    return name, json.loads(arguments) if arguments else {}
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.25, help="+/- fraction applied to latencies and run times")
+    parser.add_argument("--run-seconds", type=float, default=1.0, help="time from run creation to completion")
+    parser.add_argument("--token-seconds", type=float, default=0.01, help="gap between streamed words")
+    parser.add_argument("--reply-words", type=int, default=60)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of runs that end failed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--tool-rate", type=float, default=0.0, help="share of runs that call tools first")
+    parser.add_argument("--tool-call", action="append", type=parse_tool_call, dest="tool_calls",
+                        help='tool call to inject, as Name:{"arg": "value"}; repeat for several')
+    parser.add_argument("--seed", type=int)
+
+
+def config_from_args(args):
+    return MockConfig(
+        latency=args.latency, jitter=args.jitter, run_seconds=args.run_seconds, token_seconds=args.token_seconds,
+        reply_words=args.reply_words, failure_rate=args.failure_rate, error_rate=args.error_rate,
+        tool_rate=args.tool_rate, tool_calls=args.tool_calls, seed=args.seed
+    )
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    # Like the real API, keep idle connections open longer than clients keep them in their pools
+    # (httpx: 5 seconds); with uvicorn's default of 5 the two race and reused connections get reset
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning",
+                timeout_keep_alive=75)
+
+
+if __name__ == "__main__":
+    main()
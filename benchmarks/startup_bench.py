@@ -0,0 +1,115 @@
+"""Startup-time benchmark for the entry points.
+
+For each entry point this measures, over several fresh processes:
+  import_seconds         time to import the module
+  listening_seconds      time from process start until the server answers at all
+  first_request_seconds  time from process start until the chat UI answers 200
+
+The servers need the same environment as a normal run (OPENAI_API_KEY or a
+warm credential cache, OPENAI_ASSISTANT_ID, assistants.csv). Point
+OPENAI_BASE_URL at benchmarks/mock_assistants_server.py to keep the API out
+of the numbers.
+
+    python benchmarks/startup_bench.py --runs 5 --output startup.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (module to import, server command, ping path, UI path)
+TARGETS = {
+    "app": ("app", [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", "{port}"], "/", "/gradio/"),
+    "assistant_standalone": ("assistant_standalone", [sys.executable, "assistant_standalone.py"], "/", "/"),
+    "assistant_with_dropdown_standalone": ("assistant_with_dropdown_standalone", [sys.executable, "assistant_with_dropdown_standalone.py"], "/", "/"),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def wait_for(url, started, process, timeout):
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"{url} did not answer within {timeout} seconds")
+
+
+def measure_server(command, ping_path, ui_path, timeout):
+    port = free_port()
+    env = {**os.environ, "GRADIO_SERVER_PORT": str(port), "GRADIO_SERVER_NAME": "127.0.0.1"}
+    command = [part.format(port=port) for part in command]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        listening = wait_for(f"http://127.0.0.1:{port}{ping_path}", started, process, timeout)
+        first_request = wait_for(f"http://127.0.0.1:{port}{ui_path}", started, process, timeout)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return listening, first_request
+
+
+def summarize(samples):
+    return {"median": statistics.median(samples), "min": min(samples), "max": max(samples), "samples": samples}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--output", help="write the JSON results here as well as to stdout")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "runs": args.runs, "targets": {}}
+    for name in args.targets:
+        module, command, ping_path, ui_path = TARGETS[name]
+        imports, listening, first_requests = [], [], []
+        for _ in range(args.runs):
+            imports.append(measure_import(module))
+            listen_time, first_request_time = measure_server(command, ping_path, ui_path, args.timeout)
+            listening.append(listen_time)
+            first_requests.append(first_request_time)
+        results["targets"][name] = {
+            "import_seconds": summarize(imports),
+            "listening_seconds": summarize(listening),
+            "first_request_seconds": summarize(first_requests),
+        }
+        print(f"{name}: import {statistics.median(imports):.3f}s, listening {statistics.median(listening):.3f}s, "
+              f"first request {statistics.median(first_requests):.3f}s", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
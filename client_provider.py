@@ -0,0 +1,171 @@
+"""Process-wide OpenAI/Azure OpenAI clients.
+
+app.py mounts two assistant apps in one process. Each used to load .env, run
+the Key Vault device-code login and build its own client with its own
+connection pool. get_client() and get_async_client() authenticate once and
+hand every module the same clients, so both mounts share one connection
+pool. When the credentials come from Key Vault, a background thread re-reads
+them before they go stale and swaps the new key into the live clients.
+
+With CREDENTIAL_CACHE_KEY set, settings read from Key Vault are kept in the
+encrypted credential cache (credential_cache.py), so a warm restart skips the
+device-code login. If the API rejects the key with a 401, the cache is
+dropped and Key Vault is read again in the background. Requests are retried
+and circuit-broken by the transports in resilience.py.
+
+    OPENAI_API_KEY               use OpenAI directly instead of Azure Key Vault
+    KEY_VAULT_NAME               Key Vault holding the Azure OpenAI settings (default ClassWeatherApi)
+    CREDENTIAL_REFRESH_SECONDS   how often Key Vault settings are re-read, 0 turns it off (default 1800)
+"""
+import os
+import threading
+import logging
+from openai import OpenAI, AzureOpenAI, AsyncOpenAI, AsyncAzureOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+import credential_cache
+# httpx here is the HTTP library the openai SDK is built on, which its clients require
+from resilience import httpx, ResilientTransport, AsyncResilientTransport
+from structured_logging import get_logger, log_event
+
+logger = get_logger("credentials")
+
+# The SDK's own pool limits, which a custom transport would otherwise replace
+CONNECTION_LIMITS = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+class ClientProvider:
+    def __init__(self):
+        load_dotenv()
+        self._lock = threading.Lock()
+        self._client = None
+        self._aclient = None
+        self._app_initialized = False
+        self._reauthenticating = False
+        self.settings = self._resolve_settings()
+        refresh_seconds = float(os.getenv("CREDENTIAL_REFRESH_SECONDS", "1800"))
+        if self.settings["kind"] == "azure" and refresh_seconds > 0:
+            threading.Thread(target=self._refresh_loop, args=(refresh_seconds,), name="credential-refresh", daemon=True).start()
+
+    def _resolve_settings(self, use_cache=True):
+        if os.getenv("OPENAI_API_KEY"):
+            return {"kind": "openai", "api_key": os.getenv("OPENAI_API_KEY")}
+        if use_cache:
+            cached = credential_cache.load()
+            if cached:
+                return cached
+        try:
+            # Only needed without OPENAI_API_KEY, so it is imported here
+            from practical_ai_azure_keyvault import initialize_app, AIConfig
+            if not self._app_initialized:
+                # This triggers device code authentication, once per process
+                initialize_app(os.getenv("KEY_VAULT_NAME", "ClassWeatherApi"))
+                self._app_initialized = True
+            config = AIConfig()
+            settings = {
+                "kind": "azure",
+                "endpoint": config.endpoint,
+                "api_key": config.api_key,
+                "api_version": config.api_version
+            }
+        except Exception as e:
+            raise ValueError(f"Failed to authenticate with Azure: {str(e)}")
+        credential_cache.save(settings)
+        return settings
+
+    def _build(self, openai_class, azure_class, http_client):
+        if self.settings["kind"] == "openai":
+            return openai_class(api_key=self.settings["api_key"], http_client=http_client, max_retries=0)
+        return azure_class(
+            azure_endpoint=self.settings["endpoint"],
+            api_key=self.settings["api_key"],
+            api_version=self.settings["api_version"],
+            http_client=http_client,
+            # Retries are done by the transport instead (see resilience.py)
+            max_retries=0
+        )
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                http_client = DefaultHttpxClient(
+                    transport=ResilientTransport(httpx.HTTPTransport(limits=CONNECTION_LIMITS)),
+                    event_hooks={"response": [self._check_auth]}
+                )
+                self._client = self._build(OpenAI, AzureOpenAI, http_client)
+            return self._client
+
+    def async_client(self):
+        with self._lock:
+            if self._aclient is None:
+                http_client = DefaultAsyncHttpxClient(
+                    transport=AsyncResilientTransport(httpx.AsyncHTTPTransport(limits=CONNECTION_LIMITS)),
+                    event_hooks={"response": [self._acheck_auth]}
+                )
+                self._aclient = self._build(AsyncOpenAI, AsyncAzureOpenAI, http_client)
+            return self._aclient
+
+    def _check_auth(self, response):
+        if response.status_code == 401:
+            self.auth_failed()
+
+    async def _acheck_auth(self, response):
+        self._check_auth(response)
+
+    def auth_failed(self):
+        """The API rejected our key: drop the cached settings and re-read Key Vault."""
+        if self.settings["kind"] != "azure":
+            return
+        with self._lock:
+            if self._reauthenticating:
+                return
+            self._reauthenticating = True
+        credential_cache.invalidate()
+        threading.Thread(target=self._reauthenticate, name="credential-reauth", daemon=True).start()
+
+    def _reauthenticate(self):
+        try:
+            self.refresh(use_cache=False)
+        except Exception as e:
+            log_event(logger, "reauthenticate_failed", level=logging.WARNING, error=str(e))
+        finally:
+            with self._lock:
+                self._reauthenticating = False
+
+    def refresh(self, use_cache=True):
+        """Re-read the settings and put a rotated API key into the live clients."""
+        settings = self._resolve_settings(use_cache)
+        with self._lock:
+            if settings["api_key"] != self.settings["api_key"]:
+                for live in (self._client, self._aclient):
+                    if live is not None:
+                        live.api_key = settings["api_key"]
+            self.settings = settings
+
+    def _refresh_loop(self, refresh_seconds):
+        stop = threading.Event()
+        while not stop.wait(refresh_seconds):
+            try:
+                # A process that logged in itself re-reads Key Vault; one started
+                # from the credential cache keeps using it until it expires
+                self.refresh(use_cache=not self._app_initialized)
+            except Exception as e:
+                log_event(logger, "credential_refresh_failed", level=logging.WARNING, error=str(e))
+
+
+def get_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = ClientProvider()
+        return _provider
+
+
+def get_client():
+    return get_provider().client()
+
+
+def get_async_client():
+    return get_provider().async_client()
@@ -0,0 +1,101 @@
+"""Encrypted on-disk cache of the Azure OpenAI settings read from Key Vault.
+
+Every cold start used to run the Key Vault device-code login and read the
+endpoint, API key and API version again, which needs a person at the
+keyboard. The settings resolved by a successful login are saved here,
+encrypted with Fernet, so a warm restart (or another worker on the same
+host) can build its clients straight away. The cache expires after a TTL
+and is deleted as soon as the API rejects the cached key.
+
+The cache is only used when CREDENTIAL_CACHE_KEY is set. The key is never
+written to disk, so the file alone does not give away the API key; keep
+the key wherever the other secrets of the deployment are kept.
+
+    CREDENTIAL_CACHE_KEY   Fernet key to encrypt with, e.g. from Fernet.generate_key(); unset or malformed turns the cache off
+    CREDENTIAL_CACHE_TTL   seconds the cached settings stay valid, 0 turns the cache off (default 43200)
+    CREDENTIAL_CACHE_PATH  cache file (default ~/.cache/assistant_credentials/settings.bin)
+"""
+import os
+import json
+import time
+import logging
+import functools
+from cryptography.fernet import Fernet, InvalidToken
+from structured_logging import get_logger, log_event
+
+logger = get_logger("credentials")
+
+
+def enabled():
+    return ttl() > 0 and _usable_key(os.getenv("CREDENTIAL_CACHE_KEY"))
+
+
+@functools.lru_cache(maxsize=None)
+def _usable_key(key):
+    # Cached so a malformed key is reported once, not on every load and save
+    if not key:
+        return False
+    try:
+        Fernet(key)
+    except ValueError as e:
+        log_event(logger, "credential_cache_disabled", level=logging.WARNING, reason="invalid_key", error=str(e))
+        return False
+    return True
+
+
+def ttl():
+    return float(os.getenv("CREDENTIAL_CACHE_TTL", "43200"))
+
+
+def _path():
+    return os.path.expanduser(os.getenv("CREDENTIAL_CACHE_PATH", "~/.cache/assistant_credentials/settings.bin"))
+
+
+def _write_private(path, data):
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    # Write to a temporary file and rename so other processes never read half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _fernet():
+    return Fernet(os.getenv("CREDENTIAL_CACHE_KEY"))
+
+
+def load():
+    """The cached settings dict, or None if there is no valid cache."""
+    if not enabled():
+        return None
+    try:
+        with open(_path(), "rb") as f:
+            entry = json.loads(_fernet().decrypt(f.read()))
+    except FileNotFoundError:
+        return None
+    except (InvalidToken, ValueError) as e:
+        log_event(logger, "credential_cache_unreadable", level=logging.WARNING, error=str(e))
+        invalidate()
+        return None
+    if entry.get("expires_at", 0) <= time.time():
+        invalidate()
+        return None
+    return entry["settings"]
+
+
+def save(settings):
+    if not enabled():
+        return
+    entry = {"expires_at": time.time() + ttl(), "settings": settings}
+    try:
+        _write_private(_path(), _fernet().encrypt(json.dumps(entry).encode("utf-8")))
+    except OSError as e:
+        log_event(logger, "credential_cache_write_failed", level=logging.WARNING, error=str(e))
+
+
+def invalidate():
+    try:
+        os.remove(_path())
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,55 @@
+"""Shared keep-alive HTTP clients for external tool APIs.
+
+Opening a new HTTPSConnection per call pays for a TCP and TLS handshake
+every time and, with no timeout, can hang a worker forever. get_http_client()
+hands out one pooled httpx.Client per base URL for the whole process, so
+connections are reused across calls and Gradio sessions, the number of open
+connections is bounded, and every request has connect/read timeouts.
+
+    TOOL_HTTP_CONNECT_TIMEOUT  seconds to establish a connection (default 5)
+    TOOL_HTTP_READ_TIMEOUT     seconds to wait for response data (default 30)
+    TOOL_HTTP_POOL_SIZE        maximum connections per base URL (default 10)
+    TOOL_HTTP_KEEPALIVE        seconds an idle connection is kept (default 60)
+"""
+import os
+import atexit
+import threading
+import httpx
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _new_client(base_url):
+    pool_size = int(os.getenv("TOOL_HTTP_POOL_SIZE", "10"))
+    return httpx.Client(
+        base_url=base_url,
+        timeout=httpx.Timeout(
+            float(os.getenv("TOOL_HTTP_READ_TIMEOUT", "30")),
+            connect=float(os.getenv("TOOL_HTTP_CONNECT_TIMEOUT", "5"))
+        ),
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=float(os.getenv("TOOL_HTTP_KEEPALIVE", "60"))
+        )
+    )
+
+
+def get_http_client(base_url):
+    """The process-wide pooled client for base_url, created on first use."""
+    with _clients_lock:
+        http = _clients.get(base_url)
+        if http is None or http.is_closed:
+            http = _clients[base_url] = _new_client(base_url)
+        return http
+
+
+def close_http_clients():
+    with _clients_lock:
+        for http in _clients.values():
+            http.close()
+        _clients.clear()
+
+
+atexit.register(close_http_clients)
@@ -0,0 +1,73 @@
+"""Gradio apps that are built on first use instead of at import time.
+
+app.py used to import gradio, openai and both assistant modules, log in and
+build both Blocks UIs before uvicorn could bind its port. LazyGradioMount is
+an ASGI app that can be mounted straight away and only imports and builds
+its Gradio app when the first request arrives (or when prewarm() is called
+once the server is up), so a new instance starts accepting connections
+almost immediately.
+"""
+import asyncio
+import logging
+from structured_logging import get_logger, log_event
+
+logger = get_logger("mounts")
+
+
+class LazyGradioMount:
+    def __init__(self, init, build):
+        """
+        init: blocking setup (env, credentials, clients); run in a worker thread
+        build: returns the gr.Blocks for this mount; run on the event loop
+        """
+        self._init = init
+        self._build = build
+        self._app = None
+        self._lifespan = None
+        self._lock = None
+        self._prewarm_task = None
+
+    async def _create(self):
+        # Imported here so importing app.py does not pay for gradio
+        import gradio as gr
+        from fastapi import FastAPI
+
+        await asyncio.to_thread(self._init)
+        blocks = self._build()
+        # Mounted at "" inside its own FastAPI app; the outer mount supplies the
+        # path prefix through the request's root_path
+        sub_app = gr.mount_gradio_app(FastAPI(), blocks, path="")
+        self._lifespan = sub_app.router.lifespan_context(sub_app)
+        await self._lifespan.__aenter__()
+        return sub_app
+
+    async def get_app(self):
+        if self._app is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._app is None:
+                    self._app = await self._create()
+        return self._app
+
+    def prewarm(self):
+        """Start building in the background so the first visitor does not wait."""
+        if self._prewarm_task is None:
+            self._prewarm_task = asyncio.get_running_loop().create_task(self.get_app())
+            self._prewarm_task.add_done_callback(self._report_prewarm)
+
+    def _report_prewarm(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            # The next request will try again and show the error
+            log_event(logger, "gradio_build_failed", level=logging.WARNING, error=str(task.exception()))
+
+    async def close(self):
+        if self._prewarm_task is not None and not self._prewarm_task.done():
+            self._prewarm_task.cancel()
+        if self._lifespan is not None:
+            await self._lifespan.__aexit__(None, None, None)
+            self._lifespan = None
+
+    async def __call__(self, scope, receive, send):
+        app = await self.get_app()
+        await app(scope, receive, send)
@@ -0,0 +1,147 @@
+"""Prometheus metrics for chat turns, runs and tools.
+
+A slow turn could be spent creating the thread, posting the message,
+starting or polling the run, running tools or reading the reply, and nothing
+said which. Each of those stages is timed into one histogram labelled by
+stage, assistant and outcome (ok or error); streamed runs add the time to the
+first token and the whole stream. Counters track polling timeouts, runs that
+did not complete, tool errors, retries and cancelled runs, and gauges show
+how many turns are waiting for rate limit quota (see rate_limiter.py) and the
+state of each endpoint's circuit breaker (see resilience.py).
+
+app.py serves the metrics at /metrics. The standalone scripts start their own
+metrics server when METRICS_PORT is set.
+
+    METRICS_PORT   port for the standalone scripts' metrics server (default: off)
+"""
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, start_http_server, CONTENT_TYPE_LATEST
+
+# Runs routinely take tens of seconds, so the buckets reach further than the defaults
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "assistant_stage_seconds",
+    "Time spent in each stage of a chat turn",
+    ["stage", "assistant_id", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+TOOL_SECONDS = Histogram(
+    "assistant_tool_seconds",
+    "Time spent running each tool",
+    ["tool", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+RUN_TIMEOUTS = Counter(
+    "assistant_run_timeouts_total",
+    "Runs still unfinished when polling gave up",
+    ["assistant_id"]
+)
+RUN_FAILURES = Counter(
+    "assistant_run_failures_total",
+    "Runs that ended without completing",
+    ["assistant_id", "status"]
+)
+TOOL_ERRORS = Counter(
+    "assistant_tool_errors_total",
+    "Tool calls that returned an error, timed out or named an unknown tool",
+    ["tool", "reason"]
+)
+RATE_LIMIT_QUEUE_DEPTH = Gauge(
+    "assistant_rate_limit_queue_depth",
+    "Chat turns waiting for rate limit quota",
+    ["assistant_id"]
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "assistant_rate_limit_rejections_total",
+    "Chat turns turned away because the line was full or the wait too long",
+    ["assistant_id"]
+)
+CIRCUIT_STATE = Gauge(
+    "assistant_circuit_state",
+    "Circuit breaker state per OpenAI endpoint: 0 closed, 1 half-open, 2 open",
+    ["endpoint"]
+)
+RETRIES = Counter(
+    "assistant_retries_total",
+    "OpenAI requests and runs retried, by endpoint and the status or error that caused it",
+    ["endpoint", "reason"]
+)
+RUN_CANCELS = Counter(
+    "assistant_run_cancels_total",
+    "Runs cancelled because polling gave up, the listener left or they blocked the thread, by the status they ended in",
+    ["reason", "status"]
+)
+
+FAILED_RUN_STATUSES = ("failed", "expired", "cancelled", "incomplete")
+
+_server_started = False
+
+
+def observe_stage(name, assistant_id, seconds, outcome="ok"):
+    STAGE_SECONDS.labels(name, assistant_id or "", outcome).observe(seconds)
+
+
+@contextmanager
+def stage(name, assistant_id=None):
+    """Time the block as one stage; an exception leaving it is recorded as outcome="error"."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        observe_stage(name, assistant_id, time.perf_counter() - started, outcome)
+
+
+def record_run_status(assistant_id, status):
+    if status in FAILED_RUN_STATUSES:
+        RUN_FAILURES.labels(assistant_id or "", status).inc()
+
+
+def record_run_timeout(assistant_id):
+    RUN_TIMEOUTS.labels(assistant_id or "").inc()
+
+
+def record_tool(name, seconds, outcome="ok"):
+    TOOL_SECONDS.labels(name, outcome).observe(seconds)
+    if outcome != "ok":
+        TOOL_ERRORS.labels(name, outcome).inc()
+
+
+def set_rate_limit_queue_depth(assistant_id, depth):
+    RATE_LIMIT_QUEUE_DEPTH.labels(assistant_id or "").set(depth)
+
+
+def record_rate_limit_rejection(assistant_id):
+    RATE_LIMIT_REJECTIONS.labels(assistant_id or "").inc()
+
+
+def set_circuit_state(endpoint, value):
+    CIRCUIT_STATE.labels(endpoint).set(value)
+
+
+def record_retry(endpoint, reason):
+    RETRIES.labels(endpoint, reason).inc()
+
+
+def record_run_cancel(reason, status):
+    RUN_CANCELS.labels(reason, status or "unknown").inc()
+
+
+def render_metrics():
+    """(body, content type) in the Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics on its own port when METRICS_PORT (or port) is set. Returns the port or None."""
+    global _server_started
+    port = port or os.getenv("METRICS_PORT")
+    if not port or _server_started:
+        return None
+    start_http_server(int(port))
+    _server_started = True
+    return int(port)
@@ -0,0 +1,294 @@
+"""Copy OpenAI assistants to Azure OpenAI.
+
+Replaces create_azure_asst.ipynb. Assistants listed in assistants.csv are
+retrieved from OpenAI and recreated on Azure in parallel, with their
+instructions, tools, tool_resources and the files behind them (vector
+stores for file_search, files for code_interpreter). Each finished assistant,
+and each file and vector store copied on the way, is appended to a
+checkpoint file, and Azure assistants and vector stores are tagged with the
+id they were copied from, so an interrupted run can be started again and
+will neither redo nor duplicate finished work. A file or vector store
+shared by several assistants is copied once. When done it writes
+azure_assistants.csv in the same format as assistants.csv.
+
+Environment (same as the notebook):
+    OPENAI_API_KEY                                  source (OpenAI)
+    AZURE_API_KEY, AZURE_ENDPOINT, AZURE_OPENAI_VERSION  destination (Azure)
+    OPENAI_BASE_URL                                 optional, e.g. a local mock server
+
+    python migrate_assistants.py --model gpt-4o --workers 8 --rate 5
+"""
+import os
+import io
+import csv
+import json
+import time
+import argparse
+import threading
+import concurrent.futures
+from openai import OpenAI, AzureOpenAI
+from dotenv import load_dotenv
+
+MIGRATED_FROM = "migrated_from"
+
+
+class RateLimiter:
+    """Spaces calls so no more than `rate` start per second across all workers."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines file of finished work, keyed by source id. Lines
+    without a "kind" are assistants (self.done); files and vector stores
+    have kind "file" or "vector_store" (self.copies, keyed by (kind, id)).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self.copies = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self._add(json.loads(line))
+
+    def _add(self, entry):
+        if "kind" in entry:
+            self.copies[(entry["kind"], entry["source_id"])] = entry
+        else:
+            self.done[entry["source_id"]] = entry
+
+    def record(self, entry):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._add(entry)
+
+
+def vector_stores(client):
+    # Vector stores moved from client.beta to client in newer openai versions
+    return getattr(client, "vector_stores", None) or client.beta.vector_stores
+
+
+def read_source_assistants(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row for row in csv.DictReader(f) if row.get("assistant_id")]
+
+
+class Migrator:
+    def __init__(self, source, dest, model, limiter, checkpoint, files_dir=None):
+        self.source = source
+        self.dest = dest
+        self.model = model
+        self.limiter = limiter
+        self.checkpoint = checkpoint
+        self.files_dir = files_dir
+        # One lock per file or vector store, so workers sharing one copy it once
+        self._copy_locks = {}
+        self._copy_locks_lock = threading.Lock()
+        # Azure copies that already exist, by source id, so a crash between
+        # create and checkpoint does not produce a second copy
+        self.existing = self.migrated(dest.beta.assistants.list)
+        self.existing_stores = self.migrated(vector_stores(dest).list)
+
+    def call(self, func, *args, **kwargs):
+        self.limiter.wait()
+        return func(*args, **kwargs)
+
+    def list_all(self, func, *args, **kwargs):
+        """Every item of a paginated list, each page fetched through the rate limiter."""
+        page = self.call(func, *args, limit=100, **kwargs)
+        items = list(page.data)
+        while page.has_next_page():
+            page = self.call(page.get_next_page)
+            items.extend(page.data)
+        return items
+
+    def migrated(self, list_func):
+        """Destination objects tagged with MIGRATED_FROM, by source id."""
+        found = {}
+        for item in self.list_all(list_func):
+            source_id = (item.metadata or {}).get(MIGRATED_FROM)
+            if source_id:
+                found[source_id] = item
+        return found
+
+    def copy_once(self, kind, source_id, copy):
+        """
+        The checkpoint entry for a copied file or vector store. copy() makes it
+        the first time and returns the entry's fields, or None if nothing was
+        copied, in which case the next caller tries again.
+        """
+        with self._copy_locks_lock:
+            lock = self._copy_locks.setdefault((kind, source_id), threading.Lock())
+        with lock:
+            entry = self.checkpoint.copies.get((kind, source_id))
+            if entry is None:
+                fields = copy()
+                if fields is None:
+                    return None
+                entry = {"kind": kind, "source_id": source_id, **fields}
+                self.checkpoint.record(entry)
+            return entry
+
+    def copy_file(self, file_id, missing):
+        entry = self.copy_once("file", file_id, lambda: self._copy_file(file_id, missing))
+        return entry["azure_id"] if entry else None
+
+    def _copy_file(self, file_id, missing):
+        info = self.call(self.source.files.retrieve, file_id)
+        try:
+            data = self.call(self.source.files.content, file_id).read()
+        except Exception as e:
+            # OpenAI does not allow downloading files uploaded for assistants;
+            # fall back to a local copy with the same name
+            local_path = os.path.join(self.files_dir, info.filename) if self.files_dir else None
+            if not local_path or not os.path.exists(local_path):
+                print(f"  Warning: could not copy file {info.filename} ({file_id}): {e}")
+                missing.append({"file_id": file_id, "filename": info.filename})
+                return None
+            with open(local_path, "rb") as f:
+                data = f.read()
+        uploaded = self.call(self.dest.files.create, file=(info.filename, io.BytesIO(data)), purpose="assistants")
+        return {"azure_id": uploaded.id, "filename": info.filename}
+
+    def copy_vector_store(self, vector_store_id, missing):
+        entry = self.copy_once("vector_store", vector_store_id, lambda: self._copy_vector_store(vector_store_id))
+        missing.extend(entry["missing_files"])
+        return entry["azure_id"]
+
+    def _copy_vector_store(self, vector_store_id):
+        if vector_store_id in self.existing_stores:
+            return {"azure_id": self.existing_stores[vector_store_id].id, "missing_files": [], "adopted": True}
+        missing = []
+        source_store = self.call(vector_stores(self.source).retrieve, vector_store_id)
+        file_ids = [f.id for f in self.list_all(vector_stores(self.source).files.list, vector_store_id)]
+        new_ids = [new_id for new_id in (self.copy_file(file_id, missing) for file_id in file_ids) if new_id]
+        new_store = self.call(
+            vector_stores(self.dest).create,
+            name=source_store.name,
+            file_ids=new_ids,
+            metadata={MIGRATED_FROM: vector_store_id}
+        )
+        return {"azure_id": new_store.id, "missing_files": missing}
+
+    def copy_tool_resources(self, tool_resources, missing):
+        if tool_resources is None:
+            return None
+        copied = {}
+        file_search = getattr(tool_resources, "file_search", None)
+        if file_search and file_search.vector_store_ids:
+            copied["file_search"] = {
+                "vector_store_ids": [self.copy_vector_store(vs_id, missing) for vs_id in file_search.vector_store_ids]
+            }
+        code_interpreter = getattr(tool_resources, "code_interpreter", None)
+        if code_interpreter and code_interpreter.file_ids:
+            new_ids = [self.copy_file(file_id, missing) for file_id in code_interpreter.file_ids]
+            copied["code_interpreter"] = {"file_ids": [new_id for new_id in new_ids if new_id]}
+        return copied or None
+
+    def migrate(self, source_id):
+        if source_id in self.existing:
+            existing = self.existing[source_id]
+            entry = {"source_id": source_id, "azure_id": existing.id, "name": existing.name, "missing_files": [], "adopted": True}
+            self.checkpoint.record(entry)
+            return entry
+        source = self.call(self.source.beta.assistants.retrieve, source_id)
+        missing = []
+        tool_resources = self.copy_tool_resources(source.tool_resources, missing)
+        settings = {
+            "name": source.name,
+            "description": source.description,
+            "instructions": source.instructions,
+            "tool_resources": tool_resources,
+            "temperature": source.temperature,
+            "top_p": source.top_p,
+        }
+        created = self.call(
+            self.dest.beta.assistants.create,
+            model=self.model or source.model,
+            tools=[tool.model_dump(exclude_none=True) for tool in source.tools],
+            metadata={**(source.metadata or {}), MIGRATED_FROM: source_id},
+            # Leave unset fields to the destination's defaults rather than sending nulls
+            **{key: value for key, value in settings.items() if value is not None}
+        )
+        entry = {"source_id": source_id, "azure_id": created.id, "name": created.name, "missing_files": missing}
+        self.checkpoint.record(entry)
+        return entry
+
+
+def write_assistants_csv(path, entries, name_filter=None):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["assistant_id", "name"])
+        writer.writeheader()
+        for entry in entries:
+            if name_filter and name_filter not in (entry["name"] or ""):
+                continue
+            writer.writerow({"assistant_id": entry["azure_id"], "name": entry["name"]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="assistants.csv", help="CSV of OpenAI assistants (assistant_id,name)")
+    parser.add_argument("--output", default="azure_assistants.csv", help="CSV to write the Azure assistants to")
+    parser.add_argument("--checkpoint", default="migration_checkpoint.jsonl")
+    parser.add_argument("--model", help="Azure deployment to use; defaults to the source assistant's model")
+    parser.add_argument("--workers", type=int, default=4, help="assistants migrated at the same time")
+    parser.add_argument("--rate", type=float, default=5, help="maximum API calls started per second, 0 for no limit")
+    parser.add_argument("--files-dir", help="local copies of files that cannot be downloaded from OpenAI")
+    parser.add_argument("--name-filter", help="only write assistants whose name contains this to the output CSV")
+    args = parser.parse_args()
+
+    load_dotenv()
+    source = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    dest = AzureOpenAI(
+        api_key=os.getenv("AZURE_API_KEY"),
+        azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_VERSION")
+    )
+
+    checkpoint = Checkpoint(args.checkpoint)
+    migrator = Migrator(source, dest, args.model, RateLimiter(args.rate), checkpoint, args.files_dir)
+    rows = read_source_assistants(args.input)
+    todo = [row["assistant_id"] for row in rows if row["assistant_id"] not in checkpoint.done]
+    print(f"{len(rows)} assistants, {len(rows) - len(todo)} already migrated, {len(todo)} to go")
+
+    failures = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(migrator.migrate, source_id): source_id for source_id in todo}
+        for future in concurrent.futures.as_completed(futures):
+            source_id = futures[future]
+            try:
+                entry = future.result()
+                print(f"{source_id} -> {entry['azure_id']} {entry['name']}")
+            except Exception as e:
+                failures += 1
+                print(f"Error: {source_id} failed, it will be retried on the next run: {e}")
+
+    # Keep the order of the input file
+    entries = [checkpoint.done[row["assistant_id"]] for row in rows if row["assistant_id"] in checkpoint.done]
+    write_assistants_csv(args.output, entries, args.name_filter)
+    print(f"Wrote {len(entries)} assistants to {args.output}; {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,100 @@
+"""Gradio queue limits for each app and each kind of event.
+
+msg.submit ran with Gradio's default concurrency, which depending on the
+Gradio version either runs one chat turn at a time per app or does not limit
+them at all, and a download could sit in the queue behind chat turns. Each
+app now queues with an explicit size and each kind of event has its own
+concurrency group: chat turns, which take seconds, are capped per app;
+downloads have a small group of their own so they never wait for a chat
+slot; Clear, assistant selection and page load skip the queue (queue=False).
+
+Chat turns can also be capped per assistant. The single-assistant apps put
+that cap on their chat group; the dropdown apps pick the assistant per turn,
+so a turn there holds an AssistantSlots slot for its assistant instead.
+
+    GRADIO_MAX_QUEUE_SIZE         events an app keeps waiting before turning new ones away (default 128)
+    GRADIO_CHAT_CONCURRENCY       chat turns an app runs at once (default 16)
+    GRADIO_DOWNLOAD_CONCURRENCY   transcript downloads an app runs at once (default 4)
+    ASSISTANT_CONCURRENCY         per-assistant caps on chat turns, e.g. "asst_abc=4,asst_def=8"
+
+Each GRADIO_ setting can be given for one app by adding the app's name, e.g.
+GRADIO_CHAT_CONCURRENCY_DROPDOWN=32 for /gradio2 (apps: ASSISTANT, DROPDOWN).
+"""
+import os
+import asyncio
+import threading
+from contextlib import nullcontext
+
+_shared_slots = None
+_shared_slots_lock = threading.Lock()
+
+
+def app_setting(name, app, default):
+    """GRADIO_<name>_<APP>, falling back to GRADIO_<name> and then the default."""
+    value = os.getenv(f"GRADIO_{name}_{app.upper()}") or os.getenv(f"GRADIO_{name}")
+    return int(value) if value else default
+
+
+def assistant_limits():
+    """{assistant_id: cap} from ASSISTANT_CONCURRENCY."""
+    limits = {}
+    for entry in os.getenv("ASSISTANT_CONCURRENCY", "").split(","):
+        if "=" in entry:
+            assistant_id, limit = entry.split("=", 1)
+            limits[assistant_id.strip()] = int(limit)
+    return limits
+
+
+def queue_settings(app):
+    """Keyword arguments for Blocks.queue()."""
+    return {"max_size": app_setting("MAX_QUEUE_SIZE", app, 128)}
+
+
+def chat_event(app, assistant_id=None):
+    """Keyword arguments for the chat event: its own group, capped by the app and the assistant."""
+    limit = app_setting("CHAT_CONCURRENCY", app, 16)
+    limits = assistant_limits()
+    if assistant_id in limits:
+        limit = min(limit, limits[assistant_id])
+    return {"concurrency_id": "chat", "concurrency_limit": limit}
+
+
+def download_event(app):
+    """Keyword arguments for the download event, kept apart from chat turns."""
+    return {"concurrency_id": "download", "concurrency_limit": app_setting("DOWNLOAD_CONCURRENCY", app, 4)}
+
+
+class AssistantSlots:
+    """Per-assistant caps on chat turns for apps where the assistant is chosen per turn."""
+    def __init__(self, limits=None):
+        self.limits = limits if limits is not None else assistant_limits()
+        self._semaphores = {}
+        self._async_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, table, assistant_id, factory):
+        with self._lock:
+            if assistant_id not in table:
+                table[assistant_id] = factory(self.limits[assistant_id])
+            return table[assistant_id]
+
+    def slot(self, assistant_id):
+        """Context manager holding one of the assistant's slots; a no-op for uncapped assistants."""
+        if assistant_id not in self.limits:
+            return nullcontext()
+        return self._semaphore(self._semaphores, assistant_id, threading.BoundedSemaphore)
+
+    def aslot(self, assistant_id):
+        """slot() for coroutines, used with async with."""
+        if assistant_id not in self.limits:
+            return nullcontext()
+        return self._semaphore(self._async_semaphores, assistant_id, asyncio.BoundedSemaphore)
+
+
+def shared_assistant_slots():
+    """One set of slots per process, shared by every app mounted in it."""
+    global _shared_slots
+    with _shared_slots_lock:
+        if _shared_slots is None:
+            _shared_slots = AssistantSlots()
+        return _shared_slots
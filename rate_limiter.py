@@ -0,0 +1,214 @@
+"""Token-bucket rate limits on chat turns, per assistant and for the API key.
+
+At the start of a class every student's first message reached the API at
+once, the deployment's requests-per-minute and tokens-per-minute quotas ran
+out, and the 429s came back as "An error occurred". Turns now wait in line
+for the quota instead. Each assistant has a bucket of runs per minute and one
+of tokens per minute, and the API key the process uses has another pair
+shared by every assistant. A turn waits until it is at the front of its
+assistant's line and every bucket has room, and the chat shows its place in
+line meanwhile. When the line is full, or a turn has waited longer than
+RATE_LIMIT_MAX_WAIT, the turn is answered with a busy message instead.
+
+Token costs are estimated before the run, from the length of the
+conversation (the whole thread is sent to the model on each run) plus
+RATE_LIMIT_REPLY_TOKENS for the reply, at about four characters per token.
+
+    RATE_LIMIT_RPM            runs started per minute for each assistant (default 0, no limit)
+    RATE_LIMIT_TPM            estimated tokens per minute for each assistant (default 0, no limit)
+    RATE_LIMIT_KEY_RPM        runs started per minute for the API key, across assistants (default 0)
+    RATE_LIMIT_KEY_TPM        estimated tokens per minute for the API key (default 0)
+    RATE_LIMIT_QUEUE          turns that can wait for each assistant before new ones are turned away (default 50)
+    RATE_LIMIT_MAX_WAIT       seconds a turn waits before giving up (default 60)
+    RATE_LIMIT_REPLY_TOKENS   tokens a reply is assumed to use (default 500)
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from metrics import set_rate_limit_queue_depth, record_rate_limit_rejection
+
+CHARS_PER_TOKEN = 4
+# How often a turn that is not at the front of the line checks again
+RECHECK_SECONDS = 0.25
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+class RateLimitBusy(Exception):
+    """The line for this assistant is full, or the turn waited too long."""
+    def __init__(self, position):
+        super().__init__(f"The assistant is busy right now (number {position} in line). Please try again in a moment.")
+        self.position = position
+
+
+def waiting_message(position):
+    return f"The assistant is busy. You are number {position} in line; your message will be sent as soon as there is room."
+
+
+def estimate_tokens(message, history, reply_tokens=None):
+    """Rough token cost of a run: the conversation so far, the new message and the reply."""
+    reply_tokens = reply_tokens if reply_tokens is not None else int(os.getenv("RATE_LIMIT_REPLY_TOKENS", "500"))
+    chars = len(message) + sum(len(m["content"] or "") for m in history or [])
+    return chars // CHARS_PER_TOKEN + reply_tokens
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 a second, holding at most one minute's worth."""
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available; a cost above capacity waits for a full bucket."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self, rpm=None, tpm=None, key_rpm=None, key_tpm=None, max_queue=None, max_wait=None):
+        self.rpm = rpm if rpm is not None else float(os.getenv("RATE_LIMIT_RPM", "0"))
+        self.tpm = tpm if tpm is not None else float(os.getenv("RATE_LIMIT_TPM", "0"))
+        self.key_rpm = key_rpm if key_rpm is not None else float(os.getenv("RATE_LIMIT_KEY_RPM", "0"))
+        self.key_tpm = key_tpm if key_tpm is not None else float(os.getenv("RATE_LIMIT_KEY_TPM", "0"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("RATE_LIMIT_QUEUE", "50"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("RATE_LIMIT_MAX_WAIT", "60"))
+        self._buckets = {}
+        self._lines = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return any(limit > 0 for limit in (self.rpm, self.tpm, self.key_rpm, self.key_tpm))
+
+    def _bucket(self, name, per_minute):
+        if name not in self._buckets:
+            self._buckets[name] = TokenBucket(per_minute)
+        return self._buckets[name]
+
+    def _costs(self, assistant_id, tokens):
+        """(bucket, cost) for every limit that applies to a turn."""
+        costs = []
+        for name, per_minute, cost in (
+            (("assistant", assistant_id, "requests"), self.rpm, 1),
+            (("assistant", assistant_id, "tokens"), self.tpm, tokens),
+            (("key", "requests"), self.key_rpm, 1),
+            (("key", "tokens"), self.key_tpm, tokens),
+        ):
+            if per_minute > 0:
+                costs.append((self._bucket(name, per_minute), cost))
+        return costs
+
+    def queue_depth(self, assistant_id):
+        with self._lock:
+            return len(self._lines.get(assistant_id, ()))
+
+    def _join(self, assistant_id):
+        with self._lock:
+            line = self._lines.setdefault(assistant_id, deque())
+            if len(line) >= self.max_queue:
+                record_rate_limit_rejection(assistant_id)
+                raise RateLimitBusy(len(line) + 1)
+            ticket = object()
+            line.append(ticket)
+            set_rate_limit_queue_depth(assistant_id, len(line))
+            return ticket
+
+    def _leave(self, assistant_id, ticket):
+        with self._lock:
+            line = self._lines[assistant_id]
+            if ticket in line:
+                line.remove(ticket)
+            set_rate_limit_queue_depth(assistant_id, len(line))
+
+    def _try_admit(self, assistant_id, ticket, tokens):
+        """(seconds to wait, place in line); (0, 1) means the turn was admitted and took its quota."""
+        with self._lock:
+            line = self._lines[assistant_id]
+            position = line.index(ticket) + 1
+            if position > 1:
+                return RECHECK_SECONDS, position
+            now = time.monotonic()
+            costs = self._costs(assistant_id, tokens)
+            wait = max(bucket.wait_time(cost, now) for bucket, cost in costs)
+            if wait > 0:
+                return wait, position
+            for bucket, cost in costs:
+                bucket.take(cost)
+            line.popleft()
+            set_rate_limit_queue_depth(assistant_id, len(line))
+            return 0, position
+
+    def wait(self, assistant_id, tokens):
+        """
+        Wait for the turn's place and quota. Yields the place in line whenever
+        it changes while waiting and returns once the turn may start. Raises
+        RateLimitBusy if the line is full or the wait passes max_wait.
+        """
+        if not self.enabled:
+            return
+        ticket = self._join(assistant_id)
+        deadline = time.monotonic() + self.max_wait
+        shown = None
+        try:
+            while True:
+                wait, position = self._try_admit(assistant_id, ticket, tokens)
+                if not wait:
+                    ticket = None
+                    return
+                if time.monotonic() >= deadline:
+                    record_rate_limit_rejection(assistant_id)
+                    raise RateLimitBusy(position)
+                if position != shown:
+                    shown = position
+                    yield position
+                time.sleep(min(wait, RECHECK_SECONDS))
+        finally:
+            # Also runs when the caller stops listening, so an abandoned turn leaves the line
+            if ticket is not None:
+                self._leave(assistant_id, ticket)
+
+    async def await_turn(self, assistant_id, tokens):
+        """wait() for coroutines: an async generator that sleeps on the event loop."""
+        if not self.enabled:
+            return
+        ticket = self._join(assistant_id)
+        deadline = time.monotonic() + self.max_wait
+        shown = None
+        try:
+            while True:
+                wait, position = self._try_admit(assistant_id, ticket, tokens)
+                if not wait:
+                    ticket = None
+                    return
+                if time.monotonic() >= deadline:
+                    record_rate_limit_rejection(assistant_id)
+                    raise RateLimitBusy(position)
+                if position != shown:
+                    shown = position
+                    yield position
+                await asyncio.sleep(min(wait, RECHECK_SECONDS))
+        finally:
+            if ticket is not None:
+                self._leave(assistant_id, ticket)
+
+
+def shared_rate_limiter():
+    """One limiter per process, so every app mounted in it draws on the same quotas."""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
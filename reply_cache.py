@@ -0,0 +1,161 @@
+"""Cached replies to the first question of a conversation.
+
+When a class opens an assistant, most students start with the same few
+questions, and each of them paid for a thread, a run and a full generation
+to get the same answer. For assistants listed in REPLY_CACHE_ASSISTANTS, the
+reply to a conversation's first message is kept in a TTL + LRU cache keyed by
+the assistant, its version and the normalised message (case, spacing and
+trailing punctuation do not matter). A later conversation opening with the
+same question gets that reply at once, without a run or any rate limit
+quota, and the question and answer are then written to its thread so the
+follow-ups have the context.
+
+An assistant's version is its "version" metadata value if it has one, and
+otherwise a hash of its model, instructions and tools, so editing the
+assistant stops old replies from being served. Versions are looked up at
+most once every REPLY_CACHE_VERSION_TTL seconds per assistant.
+
+Only assistants whose first answers do not depend on who is asking should
+be listed. Hit and miss counts are in ttl_cache.cache_stats() under "replies".
+
+    REPLY_CACHE_ASSISTANTS     assistant IDs to cache first replies for, comma separated, or * for all (default none)
+    REPLY_CACHE_TTL            seconds a reply is served from the cache (default 86400)
+    REPLY_CACHE_SIZE           replies kept before the least recently used are dropped (default 1000)
+    REPLY_CACHE_VERSION_TTL    seconds an assistant's version is remembered (default 300)
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from ttl_cache import TTLCache
+from structured_logging import get_logger, log_event
+
+# Assistant settings that change what it answers
+VERSION_FIELDS = ("model", "instructions", "tools", "tool_resources", "temperature", "top_p", "response_format")
+
+logger = get_logger("reply_cache")
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def normalise(message):
+    """The message with case, spacing and trailing punctuation evened out."""
+    text = " ".join(unicodedata.normalize("NFKC", message).casefold().split())
+    return text.rstrip(" ?!.")
+
+
+def assistant_version(assistant):
+    metadata = assistant.metadata or {}
+    if metadata.get("version"):
+        return str(metadata["version"])
+    fields = assistant.model_dump(include=set(VERSION_FIELDS), mode="json")
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class ReplyCache:
+    def __init__(self, assistants=None, ttl=None, maxsize=None, version_ttl=None):
+        if assistants is None:
+            assistants = [a.strip() for a in os.getenv("REPLY_CACHE_ASSISTANTS", "").split(",") if a.strip()]
+        self.assistants = set(assistants)
+        ttl = ttl if ttl is not None else float(os.getenv("REPLY_CACHE_TTL", "86400"))
+        maxsize = maxsize if maxsize is not None else int(os.getenv("REPLY_CACHE_SIZE", "1000"))
+        version_ttl = version_ttl if version_ttl is not None else float(os.getenv("REPLY_CACHE_VERSION_TTL", "300"))
+        self.replies = TTLCache("replies", maxsize=maxsize, ttl=ttl)
+        self.versions = TTLCache("assistant_versions", maxsize=256, ttl=version_ttl)
+
+    def enabled(self, assistant_id):
+        return "*" in self.assistants or assistant_id in self.assistants
+
+    def _key(self, assistant_id, version, message):
+        return (assistant_id, version, normalise(message))
+
+    def _version(self, client, assistant_id):
+        version = self.versions.get(assistant_id)
+        if version is None:
+            version = assistant_version(client.beta.assistants.retrieve(assistant_id))
+            self.versions.set(assistant_id, version)
+        return version
+
+    async def _aversion(self, aclient, assistant_id):
+        version = self.versions.get(assistant_id)
+        if version is None:
+            version = assistant_version(await aclient.beta.assistants.retrieve(assistant_id))
+            self.versions.set(assistant_id, version)
+        return version
+
+    def lookup(self, client, assistant_id, message, history):
+        """The cached reply to a first message, or None."""
+        if history or not self.enabled(assistant_id):
+            return None
+        try:
+            version = self._version(client, assistant_id)
+        except Exception as e:
+            log_event(logger, "assistant_version_failed", level=logging.WARNING, assistant_id=assistant_id, error=str(e))
+            return None
+        return self.replies.get(self._key(assistant_id, version, message))
+
+    async def alookup(self, aclient, assistant_id, message, history):
+        """Async version of lookup()."""
+        if history or not self.enabled(assistant_id):
+            return None
+        try:
+            version = await self._aversion(aclient, assistant_id)
+        except Exception as e:
+            log_event(logger, "assistant_version_failed", level=logging.WARNING, assistant_id=assistant_id, error=str(e))
+            return None
+        return self.replies.get(self._key(assistant_id, version, message))
+
+    def remember(self, assistant_id, message, history, reply):
+        """Keep the reply a run wrote for a first message. Skipped if the version was not looked up just before."""
+        if history or not self.enabled(assistant_id):
+            return
+        version = self.versions.get(assistant_id)
+        if version is not None:
+            self.replies.set(self._key(assistant_id, version, message), reply)
+
+    def record(self, client, assistant_id, message, reply, thread_id=None):
+        """Write a cached exchange to thread_id, or to a new thread, and return the thread's id."""
+        try:
+            if thread_id:
+                client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+                client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=reply)
+            else:
+                thread_id = client.beta.threads.create(messages=[
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": reply}
+                ]).id
+        except Exception as e:
+            # The reply was still shown; the next message just starts without this context
+            log_event(logger, "reply_cache_record_failed", level=logging.WARNING, assistant_id=assistant_id,
+                      thread_id=thread_id, error=str(e))
+        log_event(logger, "reply_cache_hit", sample=True, assistant_id=assistant_id, thread_id=thread_id, reply_chars=len(reply))
+        return thread_id
+
+    async def arecord(self, aclient, assistant_id, message, reply, thread_id=None):
+        """Async version of record()."""
+        try:
+            if thread_id:
+                await aclient.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+                await aclient.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=reply)
+            else:
+                thread_id = (await aclient.beta.threads.create(messages=[
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": reply}
+                ])).id
+        except Exception as e:
+            log_event(logger, "reply_cache_record_failed", level=logging.WARNING, assistant_id=assistant_id,
+                      thread_id=thread_id, error=str(e))
+        log_event(logger, "reply_cache_hit", sample=True, assistant_id=assistant_id, thread_id=thread_id, reply_chars=len(reply))
+        return thread_id
+
+
+def shared_reply_cache():
+    """One cache per process, so both mounted apps serve each other's replies."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ReplyCache()
+        return _shared_cache
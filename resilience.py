@@ -0,0 +1,326 @@
+"""Retries with jittered backoff and per-endpoint circuit breakers for OpenAI calls.
+
+Every OpenAI request went out once (plus the SDK's two quick retries), and
+whatever came back, a connection reset, a 502, a 429, reached the user as
+"An error occurred". ResilientTransport now sits under the shared clients'
+httpx clients (see client_provider.py), so every call made through them, from
+the chat functions, the run poller, streaming, the thread pool or transcript
+export, goes through the same policy:
+
+- Connection failures and 408, 409, 429 and 5xx responses are retried with
+  full-jitter exponential backoff, honouring Retry-After, until
+  RETRY_MAX_ATTEMPTS or RETRY_DEADLINE runs out. A POST may already have
+  posted a message or started a run, so it is only retried if it cannot have
+  reached the server (a connection failure) or was turned away before being
+  handled (408 or 429).
+- Each endpoint (method and path with IDs left out, e.g.
+  "POST /threads/{id}/runs") has a circuit breaker. BREAKER_FAILURES failures
+  in a row open it, and calls to that endpoint then fail at once with
+  CircuitOpen instead of piling up. After BREAKER_RESET_SECONDS one call is
+  let through; if it succeeds the breaker closes again.
+
+Runs that fail server-side with rate_limit_exceeded or server_error are
+retried the same way by run_poller.py and streaming.py.
+
+The transports are built on the HTTP library the openai SDK itself uses
+(httpx, or the httpx2 fork in some releases), since the SDK's client only
+accepts requests and transports of its own library.
+
+Breaker state is exported as assistant_circuit_state (0 closed, 1 half-open,
+2 open) and retries as assistant_retries_total, and every state change is
+logged.
+
+    RETRY_MAX_ATTEMPTS      attempts per request, including the first (default 4)
+    RETRY_BASE_DELAY        first backoff ceiling in seconds, doubled per retry (default 0.5)
+    RETRY_MAX_DELAY         largest backoff ceiling in seconds (default 8)
+    RETRY_DEADLINE          seconds a request may spend on retries (default 30)
+    BREAKER_FAILURES        failures in a row that open a breaker (default 5)
+    BREAKER_RESET_SECONDS   seconds a breaker stays open before a trial call (default 30)
+"""
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+import threading
+import importlib
+from openai import DefaultHttpxClient
+from structured_logging import get_logger, log_event
+from metrics import set_circuit_state, record_retry
+
+# The module DefaultHttpxClient's Client class comes from: httpx or httpx2
+httpx = importlib.import_module(
+    next(c for c in DefaultHttpxClient.__mro__ if c.__name__ == "Client").__module__.partition(".")[0]
+)
+
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+# Statuses that mean a request was not acted on, so even a POST can be repeated
+UNHANDLED_STATUS = (408, 429)
+# Methods that are safe to repeat after the server has handled them
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "DELETE")
+# Run failures that are worth trying again with a new run
+RETRYABLE_RUN_ERRORS = ("rate_limit_exceeded", "server_error")
+# Errors that mean the request never reached the server, so even a POST can be repeated
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+ID_SEGMENT = re.compile(r"^(thread|run|msg|asst|step|vs|call)_\w+$|^file-\w+$")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = get_logger("resilience")
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpen(Exception):
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"{endpoint} is failing, not calling it for another {retry_in:.0f} seconds")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None, deadline=None):
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("RETRY_MAX_DELAY", "8"))
+        self.deadline = deadline if deadline is not None else float(os.getenv("RETRY_DEADLINE", "30"))
+
+    def delay(self, attempt, retry_after=None):
+        """Full jitter: anywhere up to the attempt's exponential ceiling, or what the server asked for."""
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def next_delay(self, attempt, started, retry_after=None):
+        """Seconds to wait before attempt + 1, or None when the attempts or the deadline are used up."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.delay(attempt, retry_after)
+        if time.monotonic() + delay - started > self.deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint, failure_threshold=None, reset_seconds=None):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold if failure_threshold is not None else int(os.getenv("BREAKER_FAILURES", "5"))
+        self.reset_seconds = reset_seconds if reset_seconds is not None else float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        set_circuit_state(endpoint, STATE_VALUES[CLOSED])
+
+    def _set_state(self, state):
+        if state != self.state:
+            log_event(logger, "circuit_" + state, level=logging.WARNING if state == OPEN else logging.INFO,
+                      endpoint=self.endpoint, failures=self.failures)
+            self.state = state
+            set_circuit_state(self.endpoint, STATE_VALUES[state])
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go out now. Returns True if the call is the half-open trial."""
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            retry_in = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self._set_state(HALF_OPEN)
+            # Half-open lets a single trial call through
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            raise CircuitOpen(self.endpoint, max(retry_in, 0))
+
+    def record_success(self):
+        with self._lock:
+            self._trial_running = False
+            self.failures = 0
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._trial_running = False
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release_trial(self):
+        """A call ended without an answer either way (it was cancelled); let another trial through."""
+        with self._lock:
+            self._trial_running = False
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+def endpoint_name(request):
+    """Method and path with version prefixes and object IDs left out, e.g. "GET /threads/{id}/messages"."""
+    segments = [s for s in request.url.path.split("/") if s and s not in ("v1", "openai")]
+    return request.method + " /" + "/".join("{id}" if ID_SEGMENT.match(s) else s for s in segments)
+
+
+def get_breaker(endpoint):
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def breaker_states():
+    """{endpoint: {"state", "failures"}} for every endpoint called so far."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.endpoint: breaker.snapshot() for breaker in breakers}
+
+
+def retry_after_seconds(response):
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return float(value) / scale
+            except ValueError:
+                return None
+    return None
+
+
+def should_retry_response(request, response):
+    should_retry = response.headers.get("x-should-retry")
+    if should_retry == "false":
+        return False
+    if request.method not in IDEMPOTENT_METHODS:
+        # A 5xx may come after the message was posted or the run started
+        return response.status_code in UNHANDLED_STATUS
+    return should_retry == "true" or response.status_code in RETRYABLE_STATUS
+
+
+def should_retry_error(request, error):
+    return isinstance(error, UNSENT_ERRORS) or (request.method in IDEMPOTENT_METHODS and isinstance(error, httpx.TransportError))
+
+
+def retryable_run_error(last_error):
+    """True if a run that failed with last_error is worth starting again."""
+    return last_error is not None and getattr(last_error, "code", None) in RETRYABLE_RUN_ERRORS
+
+
+def run_retry_delay(run, policy, attempt, started):
+    """
+    Seconds to wait before starting a failed run again, or None if it should
+    not be retried: the error is not retryable or the policy is used up.
+    """
+    if run.status != "failed" or not retryable_run_error(run.last_error):
+        return None
+    delay = policy.next_delay(attempt, started)
+    if delay is not None:
+        record_retry("run", run.last_error.code)
+        log_event(logger, "run_retry", level=logging.WARNING, thread_id=run.thread_id, run_id=run.id,
+                  error=run.last_error.code, attempt=attempt + 1, delay_ms=round(delay * 1000))
+    return delay
+
+
+def describe_error(e):
+    """One sentence for the chat window saying what went wrong, without a traceback."""
+    cause = e if isinstance(e, CircuitOpen) else e.__cause__
+    if isinstance(cause, CircuitOpen):
+        return f"The assistant service is not responding, so calls are paused for about {max(cause.retry_in, 1):.0f} seconds."
+    status = getattr(e, "status_code", None)
+    if status == 429:
+        return "The assistant service is over its rate limit."
+    if status is not None and status >= 500:
+        return "The assistant service had an internal error."
+    text = str(e).strip() or f"Unexpected {type(e).__name__}"
+    return text if text.endswith(".") else f"{text}."
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """Wraps an httpx transport with RetryPolicy and the per-endpoint circuit breakers."""
+    def __init__(self, transport=None, policy=None):
+        self.transport = transport or httpx.HTTPTransport()
+        self.policy = policy or RetryPolicy()
+
+    def handle_request(self, request):
+        endpoint = endpoint_name(request)
+        breaker = get_breaker(endpoint)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            trial = breaker.before_call()
+            try:
+                response = self.transport.handle_request(request)
+            except Exception as e:
+                breaker.record_failure()
+                delay = self.policy.next_delay(attempt, started) if should_retry_error(request, e) else None
+                if delay is None:
+                    raise
+                record_retry(endpoint, type(e).__name__)
+            except BaseException:
+                # Cancelled or interrupted: says nothing about the endpoint, but a half-open trial is over
+                if trial:
+                    breaker.release_trial()
+                raise
+            else:
+                if not should_retry_response(request, response):
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                delay = self.policy.next_delay(attempt, started, retry_after_seconds(response))
+                if delay is None:
+                    return response
+                response.close()
+                record_retry(endpoint, str(response.status_code))
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """ResilientTransport for the async clients."""
+    def __init__(self, transport=None, policy=None):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.policy = policy or RetryPolicy()
+
+    async def handle_async_request(self, request):
+        endpoint = endpoint_name(request)
+        breaker = get_breaker(endpoint)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            trial = breaker.before_call()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except Exception as e:
+                breaker.record_failure()
+                delay = self.policy.next_delay(attempt, started) if should_retry_error(request, e) else None
+                if delay is None:
+                    raise
+                record_retry(endpoint, type(e).__name__)
+            except BaseException:
+                # Cancelled or interrupted: says nothing about the endpoint, but a half-open trial is over
+                if trial:
+                    breaker.release_trial()
+                raise
+            else:
+                if not should_retry_response(request, response):
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                delay = self.policy.next_delay(attempt, started, retry_after_seconds(response))
+                if delay is None:
+                    return response
+                await response.aclose()
+                record_retry(endpoint, str(response.status_code))
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,219 @@
+"""Adaptive polling for assistant runs.
+
+Runs are started with runs.create() and then polled here instead of going
+through create_and_poll plus a second fixed one-second loop. Polling starts
+fast and backs off exponentially up to a cap, so short runs are noticed
+quickly and long runs do not burn requests. Every poller keeps counters for
+how many polls it made and how long runs sat finished before we noticed.
+
+Defaults come from environment variables and can be overridden per assistant:
+
+    RUN_POLL_INITIAL   first wait in seconds (default 0.25)
+    RUN_POLL_BACKOFF   multiplier applied after every poll (default 1.5)
+    RUN_POLL_MAX       longest single wait in seconds (default 2)
+    RUN_POLL_DEADLINE  give up after this many seconds (default 60)
+
+A run that is given up on is cancelled (see thread_runs.py), so it does not
+keep the thread busy for the next message.
+"""
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from structured_logging import get_logger, log_event, elapsed_ms
+from metrics import stage, record_run_status, record_run_timeout
+from resilience import RetryPolicy, run_retry_delay
+from thread_runs import cancel_run, acancel_run
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled", "incomplete", "requires_action")
+
+logger = get_logger("runs")
+
+
+class RunPoller:
+    def __init__(self, initial_interval=None, backoff=None, max_interval=None, deadline=None):
+        self.initial_interval = initial_interval if initial_interval is not None else float(os.getenv("RUN_POLL_INITIAL", "0.25"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("RUN_POLL_BACKOFF", "1.5"))
+        self.max_interval = max_interval if max_interval is not None else float(os.getenv("RUN_POLL_MAX", "2"))
+        self.deadline = deadline if deadline is not None else float(os.getenv("RUN_POLL_DEADLINE", "60"))
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "polls": 0, "timeouts": 0, "wait_seconds": 0.0, "wasted_wait_seconds": 0.0}
+
+    def intervals(self):
+        interval = self.initial_interval
+        while True:
+            yield interval
+            interval = min(interval * self.backoff, self.max_interval)
+
+    def poll(self, client, thread_id, run):
+        """Poll run until it reaches a terminal status and return the final run."""
+        start_time = time.time()
+        waited = polls = 0
+        slept = 0.0
+        try:
+            for interval in self.intervals():
+                if run.status in TERMINAL_STATUSES:
+                    return run
+                remaining = self.deadline - (time.time() - start_time)
+                if remaining <= 0:
+                    self._record_timeout()
+                    raise TimeoutError("Assistant response timed out. Please try again.")
+                slept = min(interval, remaining)
+                time.sleep(slept)
+                waited += slept
+                polls += 1
+                run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        finally:
+            self._record(run, polls, waited, slept)
+
+    async def apoll(self, aclient, thread_id, run):
+        """Async version of poll() for the async clients."""
+        start_time = time.time()
+        waited = polls = 0
+        slept = 0.0
+        try:
+            for interval in self.intervals():
+                if run.status in TERMINAL_STATUSES:
+                    return run
+                remaining = self.deadline - (time.time() - start_time)
+                if remaining <= 0:
+                    self._record_timeout()
+                    raise TimeoutError("Assistant response timed out. Please try again.")
+                slept = min(interval, remaining)
+                await asyncio.sleep(slept)
+                waited += slept
+                polls += 1
+                run = await aclient.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        finally:
+            self._record(run, polls, waited, slept)
+
+    def _record(self, run, polls, waited, last_sleep):
+        wasted = 0.0
+        if polls and run.status in TERMINAL_STATUSES:
+            # The run finished at some point during the last wait. Its *_at
+            # timestamps are whole seconds, too coarse to say when, so count
+            # half of that wait as the expected time it sat finished
+            wasted = last_sleep / 2
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["polls"] += polls
+            self._stats["wait_seconds"] += waited
+            self._stats["wasted_wait_seconds"] += wasted
+
+    def _record_timeout(self):
+        with self._lock:
+            self._stats["timeouts"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+default_poller = None
+assistant_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def set_poller(poller, assistant_id=None):
+    """
+    Replace the default poller, or the poller for one assistant.
+
+    poller can be any object with poll() and apoll() methods, or None to drop
+    an assistant override.
+    """
+    global default_poller
+    with _pollers_lock:
+        if assistant_id is None:
+            default_poller = poller
+        elif poller is None:
+            assistant_pollers.pop(assistant_id, None)
+        else:
+            assistant_pollers[assistant_id] = poller
+
+
+def get_poller(assistant_id=None):
+    global default_poller
+    with _pollers_lock:
+        if assistant_id in assistant_pollers:
+            return assistant_pollers[assistant_id]
+        if default_poller is None:
+            default_poller = RunPoller()
+        return default_poller
+
+
+def _log_poll(event, started, assistant_id, thread_id, run, level=logging.INFO):
+    log_event(
+        logger, event, level=level, sample=level <= logging.INFO,
+        assistant_id=assistant_id, thread_id=thread_id, run_id=run.id,
+        status=run.status, duration_ms=elapsed_ms(started)
+    )
+
+
+def poll_run(client, thread_id, run, assistant_id=None):
+    """
+    Poll run until it finishes. A run that failed with rate_limit_exceeded or
+    server_error is started again after a backoff (see resilience.py).
+    """
+    policy = RetryPolicy()
+    retry_started = time.monotonic()
+    for attempt in itertools.count():
+        run = _poll_once(client, thread_id, run, assistant_id)
+        delay = run_retry_delay(run, policy, attempt, retry_started)
+        if delay is None:
+            return run
+        time.sleep(delay)
+        with stage("run_create", assistant_id):
+            run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=run.assistant_id)
+
+
+async def apoll_run(aclient, thread_id, run, assistant_id=None):
+    """Async version of poll_run()."""
+    policy = RetryPolicy()
+    retry_started = time.monotonic()
+    for attempt in itertools.count():
+        run = await _apoll_once(aclient, thread_id, run, assistant_id)
+        delay = run_retry_delay(run, policy, attempt, retry_started)
+        if delay is None:
+            return run
+        await asyncio.sleep(delay)
+        with stage("run_create", assistant_id):
+            run = await aclient.beta.threads.runs.create(thread_id=thread_id, assistant_id=run.assistant_id)
+
+
+def _poll_once(client, thread_id, run, assistant_id):
+    started = time.perf_counter()
+    try:
+        with stage("run_poll", assistant_id):
+            run = get_poller(assistant_id).poll(client, thread_id, run)
+    except TimeoutError:
+        record_run_timeout(assistant_id)
+        _log_poll("run_timeout", started, assistant_id, thread_id, run, logging.WARNING)
+        cancel_run(client, thread_id, run.id, "timeout")
+        raise
+    record_run_status(assistant_id, run.status)
+    _log_poll("run_finished", started, assistant_id, thread_id, run)
+    return run
+
+
+async def _apoll_once(aclient, thread_id, run, assistant_id):
+    started = time.perf_counter()
+    try:
+        with stage("run_poll", assistant_id):
+            run = await get_poller(assistant_id).apoll(aclient, thread_id, run)
+    except TimeoutError:
+        record_run_timeout(assistant_id)
+        _log_poll("run_timeout", started, assistant_id, thread_id, run, logging.WARNING)
+        await acancel_run(aclient, thread_id, run.id, "timeout")
+        raise
+    record_run_status(assistant_id, run.status)
+    _log_poll("run_finished", started, assistant_id, thread_id, run)
+    return run
+
+
+def poll_stats():
+    """Counters for the default poller and every per-assistant override."""
+    with _pollers_lock:
+        pollers = {"default": default_poller, **assistant_pollers}
+    return {name: poller.stats() for name, poller in pollers.items() if hasattr(poller, "stats")}
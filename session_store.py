@@ -0,0 +1,285 @@
+"""Chat history kept on the server, keyed by a per-browser session key.
+
+Every msg.submit used to send the whole chatbot history up to the handler,
+which appended one pair and sent the whole list back, so each turn cost more
+than the last. The history now lives here: a turn sends only the new message
+and the session key, and the reply streams back as Gradio diffs. The key is
+kept in the browser (gr.BrowserState), so reloading the page or reconnecting
+restores the conversation from the store. The history is kept in the
+chatbot's messages format ({"role", "content"} dicts); histories saved as
+[message, reply] pairs by earlier versions are converted when read.
+
+Sessions are kept in this process's memory by default. When app.py runs
+several workers (--workers), each turn may be served by a different process,
+so the sessions go in a SQLite file that every worker on the host opens
+instead (SESSION_STORE=sqlite). Another store, e.g. one shared between hosts,
+can be plugged in by naming its class; it needs the methods of
+MemorySessionStore.
+
+    SESSION_STORE   memory, sqlite, or a class as "module:ClassName" (default memory)
+    SESSION_DB      SQLite file for SESSION_STORE=sqlite (default sessions.db)
+    SESSION_MAX     sessions kept, least recently used dropped first (default 10000)
+    SESSION_TTL     seconds an idle session is kept (default 86400)
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import importlib
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def new_session_key():
+    return uuid.uuid4().hex
+
+
+def exchange(message, reply=""):
+    """One turn in the chatbot's messages format: the user's message and the reply to it."""
+    return [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+
+
+def as_messages(history):
+    """history in the messages format, converting [message, reply] pairs."""
+    messages = []
+    for item in history:
+        messages.extend([item] if isinstance(item, dict) else exchange(*item))
+    return messages
+
+
+def _put_reply(history, reply, turn):
+    # Another turn of the conversation may have started since this one, so
+    # the reply goes by index rather than to the end; a cleared session has none
+    if turn is None:
+        turn = len(history) - 1
+    if 0 <= turn < len(history):
+        history[turn]["content"] = reply
+
+
+class MemorySessionStore:
+    def __init__(self, max_sessions=None, ttl=None):
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("SESSION_MAX", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("SESSION_TTL", "86400"))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        # Caller holds the lock
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        if self.ttl > 0 and time.monotonic() - session["touched"] > self.ttl:
+            del self._sessions[key]
+            return None
+        session["touched"] = time.monotonic()
+        self._sessions.move_to_end(key)
+        return session
+
+    def _session(self, key):
+        session = self._live(key)
+        if session is None:
+            session = {"thread_id": None, "history": [], "assistant": None, "touched": time.monotonic()}
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, key):
+        """A copy of a session: {"history", "thread_id", "assistant"}. An unknown key gives an empty one."""
+        with self._lock:
+            session = self._live(key) if key else None
+            if session is None:
+                return {"history": [], "thread_id": None, "assistant": None}
+            return {
+                "history": [dict(message) for message in session["history"]],
+                "thread_id": session["thread_id"],
+                "assistant": session["assistant"]
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return bool(key) and self._live(key) is not None
+
+    def add_message(self, key, message, assistant=None):
+        """
+        Start a turn: record the user's message with an empty reply, and who
+        it is for. Returns the turn, the index of its reply in the history.
+        """
+        with self._lock:
+            session = self._session(key)
+            session["history"].extend(exchange(message))
+            if assistant:
+                session["assistant"] = assistant
+            return len(session["history"]) - 1
+
+    def claim_thread(self, key, thread_id):
+        """Give the session thread_id unless it already has a thread; returns the session's thread."""
+        with self._lock:
+            session = self._session(key)
+            if not session["thread_id"]:
+                session["thread_id"] = thread_id
+            return session["thread_id"]
+
+    def set_reply(self, key, reply, thread_id=None, turn=None):
+        """
+        Record (so far) the reply of turn, as returned by add_message(), and the
+        thread it is in. Without a turn the reply goes to the last message.
+        """
+        with self._lock:
+            session = self._session(key)
+            _put_reply(session["history"], reply, turn)
+            if thread_id:
+                session["thread_id"] = thread_id
+
+    def clear(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """MemorySessionStore's methods on a SQLite file, so every process on the host sees the same sessions."""
+    def __init__(self, path=None, max_sessions=None, ttl=None):
+        self.path = path or os.getenv("SESSION_DB", "sessions.db")
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("SESSION_MAX", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("SESSION_TTL", "86400"))
+        # One connection per thread; sqlite3 connections are not shared between threads
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "key TEXT PRIMARY KEY, history TEXT NOT NULL, thread_id TEXT, assistant TEXT, touched REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # WAL lets readers carry on while another worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two workers updating one session cannot lose a turn
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _live(self, conn, key):
+        # Read only: idle sessions are deleted by _prune(), and touched is set by every write
+        row = conn.execute("SELECT history, thread_id, assistant, touched FROM sessions WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl > 0 and time.time() - row[3] > self.ttl):
+            return None
+        return {"history": as_messages(json.loads(row[0])), "thread_id": row[1], "assistant": row[2]}
+
+    def _session(self, conn, key):
+        session = self._live(conn, key)
+        if session is None:
+            session = {"history": [], "thread_id": None, "assistant": None}
+            self._prune(conn)
+        return session
+
+    def _prune(self, conn):
+        # Runs when a session is created: drop idle sessions, then the least recently used over the cap
+        if self.ttl > 0:
+            conn.execute("DELETE FROM sessions WHERE touched < ?", (time.time() - self.ttl,))
+        row = conn.execute("SELECT touched FROM sessions ORDER BY touched DESC LIMIT 1 OFFSET ?",
+                           (max(self.max_sessions - 1, 0),)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM sessions WHERE touched <= ?", (row[0],))
+
+    def _save(self, conn, key, session):
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (key, history, thread_id, assistant, touched) VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(session["history"]), session["thread_id"], session["assistant"], time.time())
+        )
+
+    def get(self, key):
+        """A copy of a session: {"history", "thread_id", "assistant"}. An unknown key gives an empty one."""
+        if not key:
+            return {"history": [], "thread_id": None, "assistant": None}
+        # A single SELECT needs no transaction, and under WAL it does not wait for writers
+        return self._live(self._connect(), key) or {"history": [], "thread_id": None, "assistant": None}
+
+    def __contains__(self, key):
+        return bool(key) and self._live(self._connect(), key) is not None
+
+    def add_message(self, key, message, assistant=None):
+        """
+        Start a turn: record the user's message with an empty reply, and who
+        it is for. Returns the turn, the index of its reply in the history.
+        """
+        with self._transaction() as conn:
+            session = self._session(conn, key)
+            session["history"].extend(exchange(message))
+            if assistant:
+                session["assistant"] = assistant
+            self._save(conn, key, session)
+            return len(session["history"]) - 1
+
+    def claim_thread(self, key, thread_id):
+        """Give the session thread_id unless it already has a thread; returns the session's thread."""
+        with self._transaction() as conn:
+            session = self._session(conn, key)
+            if not session["thread_id"]:
+                session["thread_id"] = thread_id
+                self._save(conn, key, session)
+            return session["thread_id"]
+
+    def set_reply(self, key, reply, thread_id=None, turn=None):
+        """
+        Record (so far) the reply of turn, as returned by add_message(), and the
+        thread it is in. Without a turn the reply goes to the last message.
+        """
+        with self._transaction() as conn:
+            session = self._session(conn, key)
+            _put_reply(session["history"], reply, turn)
+            if thread_id:
+                session["thread_id"] = thread_id
+            self._save(conn, key, session)
+
+    def clear(self, key):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(kind=None):
+    """The store named by SESSION_STORE: memory, sqlite, or "module:ClassName"."""
+    kind = kind or os.getenv("SESSION_STORE", "memory")
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "sqlite":
+        return SQLiteSessionStore()
+    module_name, _, class_name = kind.partition(":")
+    if not class_name:
+        raise ValueError(f"SESSION_STORE must be memory, sqlite or module:ClassName, not {kind!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def shared_session_store():
+    """One store per process, shared by every app mounted in it."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = create_session_store()
+        return _shared_store
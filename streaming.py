@@ -0,0 +1,225 @@
+"""Token streaming for assistant runs.
+
+stream_run() opens a streaming run and yields text deltas as the model writes
+them, so the chat window can start filling in after a few hundred
+milliseconds instead of waiting for create_and_poll to finish the whole run.
+astream_run() is the same thing for the async clients used by app.py.
+
+A run that fails with rate_limit_exceeded or server_error before writing any
+text is started again after a backoff (see resilience.py). If the reply stops
+being read before the run finishes, because the browser went away or the
+stream broke, the run is cancelled so it does not hold up the thread (see
+thread_runs.py).
+
+A streamed run gets as long as a polled one, RUN_POLL_DEADLINE seconds or the
+deadline of the assistant's own poller (see run_poller.py). After that the
+stream is closed, the run cancelled and the turn answered with a timeout.
+"""
+import os
+import time
+import asyncio
+import inspect
+import logging
+import openai
+from structured_logging import get_logger, log_event, elapsed_ms
+from metrics import stage, observe_stage, record_run_status, record_run_timeout
+from resilience import RetryPolicy, run_retry_delay
+from run_poller import get_poller
+from thread_runs import cancel_run, acancel_run
+
+FAILED_RUN_EVENTS = ("thread.run.failed", "thread.run.expired", "thread.run.cancelled")
+FINISHED_RUN_EVENTS = ("thread.run.completed", "thread.run.incomplete") + FAILED_RUN_EVENTS
+
+logger = get_logger("runs")
+
+
+def _text_deltas(event):
+    # A message delta can carry several content parts; only text parts are shown in the chat
+    for part in event.data.delta.content or []:
+        if part.type == "text" and part.text is not None and part.text.value:
+            yield part.text.value
+
+
+def _active_run(event, run_id):
+    """The ID of the run still going after event, or None once it has finished."""
+    if event.event == "thread.run.created":
+        return event.data.id
+    if event.event in FINISHED_RUN_EVENTS:
+        return None
+    return run_id
+
+
+def _log_run_end(event, started, assistant_id, thread_id, chars):
+    if event.event in FINISHED_RUN_EVENTS:
+        failed = event.event in FAILED_RUN_EVENTS
+        observe_stage("run_stream", assistant_id, time.perf_counter() - started, "error" if failed else "ok")
+        record_run_status(assistant_id, event.data.status)
+        log_event(
+            logger, "run_finished", level=logging.WARNING if failed else logging.INFO, sample=not failed,
+            assistant_id=assistant_id, thread_id=thread_id, run_id=event.data.id,
+            status=event.data.status, duration_ms=elapsed_ms(started), reply_chars=chars, streamed=True
+        )
+
+
+def _deadline(assistant_id):
+    poller = get_poller(assistant_id)
+    return time.monotonic() + getattr(poller, "deadline", float(os.getenv("RUN_POLL_DEADLINE", "60")))
+
+
+def _timeout(deadline):
+    # No single read of the stream waits past the deadline, so a stalled run is noticed too
+    return openai.Timeout(max(deadline - time.monotonic(), 0.1), connect=openai.DEFAULT_TIMEOUT.connect)
+
+
+def _check_deadline(deadline):
+    if time.monotonic() >= deadline:
+        raise TimeoutError("Assistant response timed out. Please try again.")
+
+
+def _log_timeout(started, assistant_id, thread_id, run_id):
+    record_run_timeout(assistant_id)
+    log_event(
+        logger, "run_timeout", level=logging.WARNING, assistant_id=assistant_id, thread_id=thread_id,
+        run_id=run_id, duration_ms=elapsed_ms(started), streamed=True
+    )
+
+
+def stream_run(client, thread_id, assistant_id, tool_handler=None):
+    """
+    Start a run on thread_id and yield text deltas as they arrive.
+
+    tool_handler: called with the run's tool calls when the run stops with
+    requires_action; it must return the list of {"tool_call_id", "output"}
+    dicts to submit. Streaming then carries on with the rest of the reply.
+    """
+    started = time.perf_counter()
+    chars = 0
+    policy = RetryPolicy()
+    retry_started = time.monotonic()
+    attempt = 0
+    run_id = None
+    cancel_reason = "abandoned"
+    deadline = _deadline(assistant_id)
+    stream = client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id, timeout=_timeout(deadline))
+    try:
+        while stream is not None:
+            next_stream = None
+            retry_delay = None
+            with stream as events:
+                for event in events:
+                    _check_deadline(deadline)
+                    run_id = _active_run(event, run_id)
+                    _log_run_end(event, started, assistant_id, thread_id, chars)
+                    if event.event == "thread.message.delta":
+                        for delta in _text_deltas(event):
+                            if not chars:
+                                observe_stage("first_token", assistant_id, time.perf_counter() - started)
+                            chars += len(delta)
+                            yield delta
+                    elif event.event == "thread.run.requires_action":
+                        run = event.data
+                        if tool_handler is None:
+                            raise Exception("Run requires tool outputs but no tool handler is configured")
+                        with stage("tool_calls", assistant_id):
+                            tools_output = tool_handler(run.required_action.submit_tool_outputs.tool_calls)
+                        next_stream = client.beta.threads.runs.submit_tool_outputs_stream(
+                            thread_id=thread_id,
+                            run_id=run.id,
+                            tool_outputs=tools_output,
+                            timeout=_timeout(deadline)
+                        )
+                    elif event.event in FAILED_RUN_EVENTS:
+                        # Once text has been shown the run cannot be quietly replaced
+                        retry_delay = None if chars else run_retry_delay(event.data, policy, attempt, retry_started)
+                        if retry_delay is None:
+                            raise Exception(f"Run failed: {event.data.last_error}")
+                        break
+                    elif event.event == "error":
+                        raise Exception(f"Stream error: {event.data}")
+            if retry_delay is not None:
+                time.sleep(retry_delay)
+                attempt += 1
+                next_stream = client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id, timeout=_timeout(deadline))
+            stream = next_stream
+    except Exception as e:
+        # Past the deadline a failed read is the deadline's doing too
+        if time.monotonic() < deadline:
+            raise
+        cancel_reason = "timeout"
+        _log_timeout(started, assistant_id, thread_id, run_id)
+        if isinstance(e, TimeoutError):
+            raise
+        raise TimeoutError("Assistant response timed out. Please try again.") from e
+    finally:
+        if run_id is not None:
+            cancel_run(client, thread_id, run_id, cancel_reason)
+
+
+async def astream_run(aclient, thread_id, assistant_id, tool_handler=None):
+    """
+    Async version of stream_run() for AsyncOpenAI/AsyncAzureOpenAI clients.
+
+    tool_handler may be a plain function or a coroutine function.
+    """
+    started = time.perf_counter()
+    chars = 0
+    policy = RetryPolicy()
+    retry_started = time.monotonic()
+    attempt = 0
+    run_id = None
+    cancel_reason = "abandoned"
+    deadline = _deadline(assistant_id)
+    stream = aclient.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id, timeout=_timeout(deadline))
+    try:
+        while stream is not None:
+            next_stream = None
+            retry_delay = None
+            async with stream as events:
+                async for event in events:
+                    _check_deadline(deadline)
+                    run_id = _active_run(event, run_id)
+                    _log_run_end(event, started, assistant_id, thread_id, chars)
+                    if event.event == "thread.message.delta":
+                        for delta in _text_deltas(event):
+                            if not chars:
+                                observe_stage("first_token", assistant_id, time.perf_counter() - started)
+                            chars += len(delta)
+                            yield delta
+                    elif event.event == "thread.run.requires_action":
+                        run = event.data
+                        if tool_handler is None:
+                            raise Exception("Run requires tool outputs but no tool handler is configured")
+                        with stage("tool_calls", assistant_id):
+                            tools_output = tool_handler(run.required_action.submit_tool_outputs.tool_calls)
+                            if inspect.isawaitable(tools_output):
+                                tools_output = await tools_output
+                        next_stream = aclient.beta.threads.runs.submit_tool_outputs_stream(
+                            thread_id=thread_id,
+                            run_id=run.id,
+                            tool_outputs=tools_output,
+                            timeout=_timeout(deadline)
+                        )
+                    elif event.event in FAILED_RUN_EVENTS:
+                        retry_delay = None if chars else run_retry_delay(event.data, policy, attempt, retry_started)
+                        if retry_delay is None:
+                            raise Exception(f"Run failed: {event.data.last_error}")
+                        break
+                    elif event.event == "error":
+                        raise Exception(f"Stream error: {event.data}")
+            if retry_delay is not None:
+                await asyncio.sleep(retry_delay)
+                attempt += 1
+                next_stream = aclient.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id, timeout=_timeout(deadline))
+            stream = next_stream
+    except Exception as e:
+        # Past the deadline a failed read is the deadline's doing too
+        if time.monotonic() < deadline:
+            raise
+        cancel_reason = "timeout"
+        _log_timeout(started, assistant_id, thread_id, run_id)
+        if isinstance(e, TimeoutError):
+            raise
+        raise TimeoutError("Assistant response timed out. Please try again.") from e
+    finally:
+        if run_id is not None:
+            await acancel_run(aclient, thread_id, run_id, cancel_reason)
@@ -0,0 +1,141 @@
+"""Structured, level-gated logging that never blocks a request.
+
+The chat handlers used to print every reply and pprint the whole history on
+each turn: formatting that grew with the conversation, blocking writes to
+stdout, and transcripts in the logs. log_event() records one event with
+fields such as assistant_id, thread_id, run_id, durations and sizes, never
+message text. It does nothing unless the level is enabled (and the event is
+sampled in), and records go through a bounded queue to a background thread
+that does the formatting and writing. If the queue is full, records are
+dropped and counted rather than making the request wait.
+
+Logging is configured by the first get_logger() call, usually while the app
+modules are imported, so the settings are read from .env there rather than
+waiting for gradio_init() to load it.
+
+    LOG_LEVEL         DEBUG, INFO, WARNING or ERROR (default INFO)
+    LOG_FORMAT        json or text (default json)
+    LOG_SAMPLE_RATE   share of sampled INFO/DEBUG events to keep, 0 to 1 (default 1)
+    LOG_QUEUE_SIZE    records waiting to be written before new ones are dropped (default 10000)
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from dotenv import load_dotenv
+
+ROOT_LOGGER = "assistant"
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+_sample_rate = 1.0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread; only make the record safe to hand over
+        record.exc_text = logging.Formatter().formatException(record.exc_info) if record.exc_info else None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+        line = f"{stamp} {record.levelname} {record.name} {record.getMessage()} {fields}".rstrip()
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+def configure_logging(level=None, fmt=None, sample_rate=None, queue_size=None, stream=None):
+    """Set up the queue handler and its writer thread once per process."""
+    global _configured, _listener, _queue_handler, _sample_rate
+    with _configure_lock:
+        if _configured:
+            return
+        # Variables already in the environment win, as they do in gradio_init()
+        load_dotenv()
+        level = level or os.getenv("LOG_LEVEL", "INFO").upper()
+        fmt = fmt or os.getenv("LOG_FORMAT", "json").lower()
+        _sample_rate = sample_rate if sample_rate is not None else float(os.getenv("LOG_SAMPLE_RATE", "1"))
+        queue_size = queue_size or int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+        log_queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level)
+        root.addHandler(_queue_handler)
+        # The assistant loggers write only through the queue, not through whatever the app set up
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(name):
+    """A logger under the "assistant" namespace, configuring logging on first use."""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def log_event(logger, event, level=logging.INFO, sample=False, exc_info=None, **fields):
+    """
+    Log one event with structured fields.
+
+    The level check comes first so a disabled event costs almost nothing.
+    sample=True marks a frequent event (one per turn or run) that is kept
+    only for LOG_SAMPLE_RATE of calls at INFO and below.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample and level <= logging.INFO and _sample_rate < 1 and random.random() >= _sample_rate:
+        return
+    logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+
+def elapsed_ms(started):
+    """Milliseconds since a time.perf_counter() reading."""
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import socket
+import threading
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerThread:
+    """Runs an ASGI app with uvicorn on a background thread."""
+    def __init__(self, app):
+        import uvicorn
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("server did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(10)
+
+
+@pytest.fixture(scope="session")
+def mock_api():
+    """The mock Assistants API, with the process's OpenAI clients pointed at it."""
+    from mock_assistants_server import MockConfig, create_app
+    app = create_app(MockConfig(latency=0, jitter=0, run_seconds=0.2, token_seconds=0, reply_words=8, seed=1))
+    with ServerThread(app) as server:
+        os.environ.update({"OPENAI_API_KEY": "mock", "OPENAI_BASE_URL": server.url + "/v1",
+                           "OPENAI_ASSISTANT_ID": "asst_test"})
+        server.state = app.state.mock
+        yield server
+
+
+@pytest.fixture
+def start_mock():
+    """Starts extra mock API servers for one test; returns (url, state) for each."""
+    from mock_assistants_server import MockConfig, create_app
+    servers = []
+
+    def start():
+        app = create_app(MockConfig(latency=0, jitter=0, seed=1))
+        server = ServerThread(app).__enter__()
+        servers.append(server)
+        return server.url + "/v1", app.state.mock
+    yield start
+    for server in servers:
+        server.__exit__()
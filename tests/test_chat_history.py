@@ -0,0 +1,35 @@
+import gradio as gr
+import thread_messages
+from session_store import MemorySessionStore, SQLiteSessionStore, exchange
+
+
+def test_handler_history_is_valid_for_the_chatbot(mock_api):
+    import assistant
+    assistant.gradio_init()
+    for history, thread_id, _, session in assistant.gradio_interface("How often should I train?", None, "asst_test", None):
+        gr.Chatbot().postprocess(history)
+    assert [m["role"] for m in history] == ["user", "assistant"]
+    assert history[-1]["content"] and thread_id
+    assert assistant.sessions.get(session)["history"] == history
+    thread_messages._remember(thread_id, "msg_last")
+    assistant.clear_conversation(session)
+    assert thread_messages._cursor(thread_id) is None
+
+
+def test_invalid_assistant_reply_is_saved(mock_api):
+    import assistant_with_dropdown as dropdown
+    dropdown.gradio_init()
+    history, _, _, session = list(dropdown.gradio_interface("Hello", None, "No such assistant", None))[-1]
+    gr.Chatbot().postprocess(history)
+    assert dropdown.sessions.get(session)["history"] == exchange("Hello", dropdown.INVALID_ASSISTANT)
+
+
+def test_stores_keep_messages_and_convert_pairs(tmp_path):
+    for store in (MemorySessionStore(), SQLiteSessionStore(str(tmp_path / "sessions.db"))):
+        store.add_message("key", "Hi")
+        store.set_reply("key", "Hello!", "thread_1")
+        assert store.get("key")["history"] == exchange("Hi", "Hello!")
+    conn = store._connect()
+    conn.execute("UPDATE sessions SET history = ? WHERE key = ?", ('[["Hi", "Hello!"]]', "key"))
+    conn.commit()
+    assert store.get("key")["history"] == exchange("Hi", "Hello!")
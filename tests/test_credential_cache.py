@@ -0,0 +1,30 @@
+import os
+from cryptography.fernet import Fernet
+import credential_cache
+
+SETTINGS = {"kind": "azure", "endpoint": "https://example", "api_key": "secret", "api_version": "2024-05-01"}
+
+
+def test_cache_is_off_without_a_key(tmp_path, monkeypatch):
+    monkeypatch.setenv("CREDENTIAL_CACHE_PATH", str(tmp_path / "settings.bin"))
+    monkeypatch.delenv("CREDENTIAL_CACHE_KEY", raising=False)
+    credential_cache.save(SETTINGS)
+    assert os.listdir(tmp_path) == []
+    assert credential_cache.load() is None
+
+
+def test_malformed_key_turns_the_cache_off(tmp_path, monkeypatch):
+    monkeypatch.setenv("CREDENTIAL_CACHE_PATH", str(tmp_path / "settings.bin"))
+    monkeypatch.setenv("CREDENTIAL_CACHE_KEY", "not-a-fernet-key")
+    credential_cache.save(SETTINGS)
+    assert os.listdir(tmp_path) == []
+    assert credential_cache.load() is None
+
+
+def test_cache_round_trip_keeps_the_key_off_disk(tmp_path, monkeypatch):
+    monkeypatch.setenv("CREDENTIAL_CACHE_PATH", str(tmp_path / "settings.bin"))
+    monkeypatch.setenv("CREDENTIAL_CACHE_KEY", Fernet.generate_key().decode())
+    credential_cache.save(SETTINGS)
+    assert os.listdir(tmp_path) == ["settings.bin"]
+    assert b"secret" not in (tmp_path / "settings.bin").read_bytes()
+    assert credential_cache.load() == SETTINGS
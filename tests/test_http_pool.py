@@ -0,0 +1,56 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import http_pool
+
+
+class NutritionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # One handler per TCP connection
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status, body = self.server.reply
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def nutrition_api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NutritionHandler)
+    server.connections = 0
+    server.reply = (200, {"result": {"calories": 2000}})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("NUTRITION_API_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("RAPIDAPI_KEY", "test")
+    yield server
+    server.shutdown()
+    server.server_close()
+    http_pool.close_http_clients()
+
+
+def test_nutrition_requests_reuse_one_connection(nutrition_api):
+    import assistant
+    payload = json.dumps({"goal": "Maintain"})
+    assert assistant.request_nutrition_advice(payload) == {"calories": 2000}
+    assert assistant.request_nutrition_advice(payload) == {"calories": 2000}
+    assert nutrition_api.connections == 1
+
+
+def test_nutrition_error_status_is_an_error(nutrition_api):
+    import assistant
+    nutrition_api.reply = (500, {"message": "upstream failed"})
+    result = assistant.request_nutrition_advice("{}")
+    assert "500" in result["error"]
@@ -0,0 +1,85 @@
+import json
+import concurrent.futures
+import pytest
+from openai import OpenAI
+from migrate_assistants import Checkpoint, Migrator, RateLimiter, MIGRATED_FROM
+
+
+class CountingLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__(0)
+        self.calls = 0
+
+    def wait(self):
+        self.calls += 1
+
+
+@pytest.fixture
+def servers(start_mock):
+    source_url, source = start_mock()
+    dest_url, dest = start_mock()
+    guide = source.new_file("guide.pdf", b"guide")
+    plans = source.new_file("plans.pdf", b"plans")
+    data = source.new_file("data.csv", b"a,b")
+    store = source.new_vector_store("Handbook", [guide["id"], plans["id"]])
+    shared = {"file_search": {"vector_store_ids": [store["id"]]}}
+    for name in ("Coach", "Nutritionist"):
+        source.new_assistant({"name": name, "tools": [{"type": "file_search"}], "tool_resources": shared},
+                             assistant_id=f"asst_{name.lower()}")
+    source.new_assistant({"name": "Analyst", "tools": [{"type": "code_interpreter"}],
+                          "tool_resources": {"code_interpreter": {"file_ids": [data["id"]]}}},
+                         assistant_id="asst_analyst")
+    return OpenAI(api_key="mock", base_url=source_url), OpenAI(api_key="mock", base_url=dest_url), dest
+
+
+SOURCE_IDS = ["asst_coach", "asst_nutritionist", "asst_analyst"]
+
+
+def migrate(source, dest, path, source_ids=SOURCE_IDS, limiter=None):
+    checkpoint = Checkpoint(str(path))
+    migrator = Migrator(source, dest, None, limiter or RateLimiter(0), checkpoint)
+    todo = [source_id for source_id in source_ids if source_id not in checkpoint.done]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(migrator.migrate, todo))
+    return checkpoint
+
+
+def test_shared_vector_store_is_copied_once(servers, tmp_path):
+    source, dest, dest_state = servers
+    checkpoint = migrate(source, dest, tmp_path / "checkpoint.jsonl")
+    assert len(dest_state.vector_stores) == 1
+    assert len(dest_state.files) == 3
+    store_ids = {dest_state.assistants[entry["azure_id"]]["tool_resources"]["file_search"]["vector_store_ids"][0]
+                 for entry in checkpoint.done.values() if entry["name"] != "Analyst"}
+    assert store_ids == set(dest_state.vector_stores)
+
+
+def test_resume_reuses_copied_files_and_stores(servers, tmp_path):
+    source, dest, dest_state = servers
+    path = tmp_path / "checkpoint.jsonl"
+    migrate(source, dest, path)
+    assert len(dest_state.assistants) == 3
+    # Crash before any assistant or vector store was recorded: only the file copies are in the checkpoint
+    lines = [line for line in path.read_text().splitlines() if json.loads(line).get("kind") == "file"]
+    path.write_text("\n".join(lines) + "\n")
+    for assistant_id in list(dest_state.assistants):
+        del dest_state.assistants[assistant_id]
+
+    checkpoint = migrate(source, dest, path)
+    assert len(dest_state.files) == 3
+    # The vector store was found by its migrated_from tag instead of being created again
+    assert len(dest_state.vector_stores) == 1
+    assert checkpoint.copies[("vector_store", next(iter(dest_state.vector_stores.values()))[0]["metadata"][MIGRATED_FROM])]["adopted"]
+    assert len(dest_state.assistants) == 3
+    assert set(checkpoint.done) == set(SOURCE_IDS)
+
+
+def test_existing_copies_are_listed_page_by_page_through_the_limiter(servers, tmp_path):
+    source, dest, dest_state = servers
+    for i in range(150):
+        dest_state.new_assistant({"name": f"Copy {i}", "metadata": {MIGRATED_FROM: f"asst_{i}"}})
+    limiter = CountingLimiter()
+    migrator = Migrator(source, dest, None, limiter, Checkpoint(str(tmp_path / "checkpoint.jsonl")))
+    assert len(migrator.existing) == 150
+    # Two pages of assistants and one of vector stores
+    assert limiter.calls == 3
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+import resilience
+from resilience import describe_error, should_retry_error, should_retry_response
+
+
+def request(method):
+    return resilience.httpx.Request(method, "https://api.openai.com/v1/threads/thread_1/runs")
+
+
+def response(status):
+    return resilience.httpx.Response(status)
+
+
+def test_transport_uses_the_sdks_http_library():
+    from openai import DefaultHttpxClient
+    assert issubclass(DefaultHttpxClient, resilience.httpx.Client)
+
+
+def test_post_is_not_retried_after_the_server_handled_it():
+    for status in (500, 502, 503, 504, 409):
+        assert not should_retry_response(request("POST"), response(status))
+    for status in (408, 429):
+        assert should_retry_response(request("POST"), response(status))
+    assert not should_retry_error(request("POST"), resilience.httpx.ReadTimeout("read"))
+    assert should_retry_error(request("POST"), resilience.httpx.ConnectError("refused"))
+
+
+def test_get_is_retried_on_server_errors():
+    for status in (409, 429, 500, 502, 503, 504):
+        assert should_retry_response(request("GET"), response(status))
+    assert should_retry_error(request("GET"), resilience.httpx.ReadTimeout("read"))
+
+
+def test_describe_error_without_a_message():
+    assert describe_error(RuntimeError()) == "Unexpected RuntimeError."
+    assert describe_error(ValueError("Bad key")) == "Bad key."
+
+
+def test_cancelled_trial_call_lets_the_next_one_through():
+    class Cancelled(resilience.httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            self.calls = getattr(self, "calls", 0) + 1
+            raise asyncio.CancelledError
+
+    breaker = resilience.get_breaker("GET /test/cancelled")
+    breaker.failure_threshold, breaker.reset_seconds = 1, 0
+    breaker.record_failure()
+    transport = resilience.AsyncResilientTransport(Cancelled())
+    for _ in range(2):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(transport.handle_async_request(resilience.httpx.Request("GET", "https://api.openai.com/v1/test/cancelled")))
+    assert transport.transport.calls == 2
+
+
+def test_one_call_and_one_chat_turn_succeed(mock_api):
+    from client_provider import get_client
+    thread = get_client().beta.threads.create()
+    assert thread.id.startswith("thread_")
+
+    import assistant
+    assistant.gradio_init()
+    reply, thread_id = assistant.chat_with_assistant("How often should I train?", [], "asst_test", None)
+    assert thread_id and not reply.startswith("An error occurred"), reply
@@ -0,0 +1,30 @@
+import time
+import sqlite3
+import threading
+from session_store import SQLiteSessionStore, exchange
+
+
+def test_reads_do_not_wait_for_a_writer(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path)
+    store.add_message("key", "Hi")
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        result = {}
+        reader = threading.Thread(target=lambda: result.update(history=store.get("key")["history"], known="key" in store))
+        reader.start()
+        reader.join(2)
+        assert result == {"history": exchange("Hi"), "known": True}
+    finally:
+        writer.execute("ROLLBACK")
+
+
+def test_reads_leave_touched_alone_and_respect_the_ttl(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60)
+    store.add_message("key", "Hi")
+    conn = store._connect()
+    conn.execute("UPDATE sessions SET touched = ?", (time.time() - 120,))
+    assert store.get("key")["history"] == []
+    assert "key" not in store
+    assert conn.execute("SELECT touched FROM sessions").fetchone()[0] < time.time() - 60
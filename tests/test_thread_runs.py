@@ -0,0 +1,82 @@
+import threading
+import pytest
+from session_store import MemorySessionStore, new_session_key
+from thread_runs import session_thread
+
+
+class CountingPool:
+    def __init__(self):
+        self.taken = 0
+        self.returned = []
+        self.gate = threading.Barrier(2)
+
+    def take(self):
+        self.taken += 1
+        thread_id = f"thread_{self.taken}"
+        # Both turns are between reading the session and claiming a thread
+        self.gate.wait(5)
+        return thread_id
+
+    def put_back(self, thread_id):
+        self.returned.append(thread_id)
+
+
+def test_concurrent_first_turns_share_one_thread():
+    sessions, pool, session = MemorySessionStore(), CountingPool(), new_session_key()
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(session_thread(sessions, session, pool))) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    assert len(set(results)) == 1
+    assert sessions.get(session)["thread_id"] == results[0]
+    assert len(pool.returned) == 1 and pool.returned[0] != results[0]
+
+
+def test_double_submit_on_new_conversation_runs_on_one_thread(mock_api):
+    import assistant
+    assistant.gradio_init()
+    session = new_session_key()
+    replies = {}
+
+    def submit(message):
+        for history, thread_id, _, _ in assistant.gradio_interface(message, session, "asst_test", None):
+            pass
+        # The chat shows both turns; this one's reply follows its message
+        reply_at = history.index({"role": "user", "content": message}) + 1
+        replies[message] = (history[reply_at]["content"], thread_id)
+
+    workers = [threading.Thread(target=submit, args=(message,)) for message in ("Hi", "Hello")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+    assert len({thread_id for _, thread_id in replies.values()}) == 1
+    assert not any(reply.startswith("An error occurred") for reply, _ in replies.values()), replies
+    thread_id = next(iter(replies.values()))[1]
+    roles = [m["role"] for m in mock_api.state.messages[thread_id]]
+    assert roles == ["user", "assistant", "user", "assistant"]
+    # Each reply is saved with its own message, not in whichever turn was added last
+    stored = assistant.sessions.get(session)["history"]
+    assert [m["role"] for m in stored] == roles
+    assert {stored[i]["content"]: stored[i + 1]["content"] for i in (0, 2)} == {
+        message: reply for message, (reply, _) in replies.items()
+    }
+
+
+def test_stream_past_its_deadline_is_cancelled(mock_api):
+    from client_provider import get_client
+    from run_poller import RunPoller, set_poller
+    from streaming import stream_run
+    client = get_client()
+    thread_id = client.beta.threads.create().id
+    client.beta.threads.messages.create(thread_id=thread_id, role="user", content="Hi")
+    set_poller(RunPoller(deadline=0.05), "asst_test")
+    try:
+        with pytest.raises(TimeoutError):
+            list(stream_run(client, thread_id, "asst_test"))
+    finally:
+        set_poller(None, "asst_test")
+    runs = [run for run in mock_api.state.runs.values() if run["thread_id"] == thread_id]
+    assert [run["status"] for run in runs] == ["cancelled"]
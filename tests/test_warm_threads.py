@@ -0,0 +1,32 @@
+import time
+from warm_threads import WarmThreadPool
+
+
+class FakeThreads:
+    def __init__(self):
+        self.created = 0
+        self.deleted = []
+
+    def create(self):
+        self.created += 1
+        return type("Thread", (), {"id": f"thread_{self.created}"})()
+
+    def delete(self, thread_id):
+        self.deleted.append(thread_id)
+
+
+class FakeClient:
+    def __init__(self):
+        self.beta = type("Beta", (), {})()
+        self.beta.threads = FakeThreads()
+
+
+def test_expired_thread_taken_from_the_pool_is_deleted_and_counted():
+    client = FakeClient()
+    pool = WarmThreadPool(client, size=0, max_idle=60)
+    pool._ready.append((time.monotonic() - 120, "thread_old"))
+    pool._ready.append((time.monotonic(), "thread_new"))
+    assert pool.take() == "thread_new"
+    assert pool.stats()["expired"] == 1
+    pool._drop_expired()
+    assert client.beta.threads.deleted == ["thread_old"]
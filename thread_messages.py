@@ -0,0 +1,74 @@
+"""Fetch only the reply to the run that just finished.
+
+Listing a thread returns every message in it (and iterating the page keeps
+fetching more pages), so reading the latest reply that way gets slower as a
+conversation grows. latest_assistant_reply() asks for the newest message of
+the finished run instead, and remembers the newest message id per thread so
+calls without a run id only fetch what was added since the last turn.
+"""
+import threading
+from collections import OrderedDict
+
+MAX_TRACKED_THREADS = 10000
+
+_cursors = OrderedDict()
+_cursors_lock = threading.Lock()
+
+
+def _remember(thread_id, message_id):
+    with _cursors_lock:
+        _cursors[thread_id] = message_id
+        _cursors.move_to_end(thread_id)
+        while len(_cursors) > MAX_TRACKED_THREADS:
+            _cursors.popitem(last=False)
+
+
+def _cursor(thread_id):
+    with _cursors_lock:
+        return _cursors.get(thread_id)
+
+
+def forget_thread(thread_id):
+    with _cursors_lock:
+        _cursors.pop(thread_id, None)
+
+
+def _list_kwargs(thread_id, run_id):
+    if run_id:
+        return {"order": "desc", "limit": 1, "run_id": run_id}
+    after = _cursor(thread_id)
+    if after:
+        return {"order": "asc", "after": after, "limit": 100}
+    return {"order": "desc", "limit": 1}
+
+
+def _pick_reply(thread_id, messages, kwargs):
+    # .data is the single page we asked for; iterating the page itself would
+    # keep requesting further pages
+    if kwargs["order"] == "asc":
+        messages = list(reversed(messages))
+    if messages:
+        _remember(thread_id, messages[0].id)
+    for msg in messages:
+        if msg.role == "assistant":
+            return message_text(msg)
+    return None
+
+
+def message_text(msg):
+    """The text of a message, skipping image and other non-text parts."""
+    return "".join(part.text.value for part in msg.content if part.type == "text")
+
+
+def latest_assistant_reply(client, thread_id, run_id=None):
+    """Newest assistant reply for run_id (or since the last call), or None."""
+    kwargs = _list_kwargs(thread_id, run_id)
+    page = client.beta.threads.messages.list(thread_id=thread_id, **kwargs)
+    return _pick_reply(thread_id, page.data, kwargs)
+
+
+async def alatest_assistant_reply(aclient, thread_id, run_id=None):
+    """Async version of latest_assistant_reply()."""
+    kwargs = _list_kwargs(thread_id, run_id)
+    page = await aclient.beta.threads.messages.list(thread_id=thread_id, **kwargs)
+    return _pick_reply(thread_id, page.data, kwargs)
@@ -0,0 +1,255 @@
+"""One run at a time per thread, and cancelling runs nobody is waiting for.
+
+A thread can only have one active run. A follow-up sent while the previous
+reply was still being written, or a double click on Send, failed with "Can't
+add messages to thread_... while a run ... is active". A run whose polling
+timed out, or whose stream the browser dropped, kept going on the server and
+blocked the thread for every later message until the run expired.
+
+- ThreadTurns puts the turns of each thread in line. A turn starts once the
+  turns sent before it on the same thread have finished, and the chat says it
+  is waiting meanwhile. A turn that waits longer than THREAD_TURN_MAX_WAIT is
+  answered with a busy message instead.
+- session_thread() gives a new conversation its thread before its first turn
+  starts, through the session store, so two messages sent at once on a new
+  conversation share one thread (and one line) instead of starting two.
+- cancel_run() cancels a run and waits up to RUN_CANCEL_WAIT seconds for it to
+  stop. run_poller.py calls it when polling gives up on a run, and
+  streaming.py when the reply stops being read before the run has finished.
+- add_user_message() posts the turn's message. If the thread still has an
+  active run that no turn here is waiting for (left by a restarted process,
+  for example), that run is cancelled and the message posted again.
+
+Cancelled runs are counted in assistant_run_cancels_total.
+
+    THREAD_TURN_MAX_WAIT   seconds a turn waits for earlier turns on its thread (default 120)
+    RUN_CANCEL_WAIT        seconds to wait for a cancelled run to stop (default 10)
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+import openai
+from structured_logging import get_logger, log_event, elapsed_ms
+from metrics import record_run_cancel
+
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action", "cancelling")
+# How often a waiting turn, or a cancelled run, is checked again
+RECHECK_SECONDS = 0.25
+WAITING_FOR_PREVIOUS_REPLY = "Waiting for the reply to your previous message; this one will be sent right after it."
+
+logger = get_logger("runs")
+
+_shared_turns = None
+_shared_turns_lock = threading.Lock()
+
+
+class ThreadBusy(Exception):
+    """An earlier turn on the thread is still running after max_wait."""
+    def __init__(self):
+        super().__init__("The reply to your previous message is still being written. Please try again in a moment.")
+
+
+class Turn:
+    """A turn's place in its thread's line; leaves the line when the with block ends."""
+    def __init__(self, turns, thread_id):
+        self.turns = turns
+        self.thread_id = thread_id
+        self.ticket = None
+
+    def __enter__(self):
+        # A new conversation has no thread yet, so nothing to wait for
+        if self.thread_id:
+            self.ticket = self.turns._join(self.thread_id)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.ticket is not None:
+            self.turns._leave(self.thread_id, self.ticket)
+            self.ticket = None
+
+    def wait(self):
+        """Yields once if the turn has to wait, and returns when the turns before it are done."""
+        if self.ticket is None:
+            return
+        deadline = time.monotonic() + self.turns.max_wait
+        shown = False
+        while not self.turns._is_first(self.thread_id, self.ticket):
+            if time.monotonic() >= deadline:
+                raise ThreadBusy()
+            if not shown:
+                shown = True
+                yield
+            time.sleep(RECHECK_SECONDS)
+
+    async def await_turn(self):
+        """wait() for coroutines: an async generator that sleeps on the event loop."""
+        if self.ticket is None:
+            return
+        deadline = time.monotonic() + self.turns.max_wait
+        shown = False
+        while not self.turns._is_first(self.thread_id, self.ticket):
+            if time.monotonic() >= deadline:
+                raise ThreadBusy()
+            if not shown:
+                shown = True
+                yield
+            await asyncio.sleep(RECHECK_SECONDS)
+
+
+class ThreadTurns:
+    def __init__(self, max_wait=None):
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("THREAD_TURN_MAX_WAIT", "120"))
+        self._lines = {}
+        self._lock = threading.Lock()
+
+    def turn(self, thread_id):
+        return Turn(self, thread_id)
+
+    def _join(self, thread_id):
+        with self._lock:
+            ticket = object()
+            self._lines.setdefault(thread_id, deque()).append(ticket)
+            return ticket
+
+    def _leave(self, thread_id, ticket):
+        with self._lock:
+            line = self._lines[thread_id]
+            line.remove(ticket)
+            if not line:
+                del self._lines[thread_id]
+
+    def _is_first(self, thread_id, ticket):
+        with self._lock:
+            return self._lines[thread_id][0] is ticket
+
+    def waiting(self, thread_id):
+        """Turns on thread_id that are running or waiting."""
+        with self._lock:
+            return len(self._lines.get(thread_id, ()))
+
+
+def shared_thread_turns():
+    """One set of lines per process, so both mounted apps see each other's turns."""
+    global _shared_turns
+    with _shared_turns_lock:
+        if _shared_turns is None:
+            _shared_turns = ThreadTurns()
+        return _shared_turns
+
+
+def session_thread(sessions, session, thread_pool):
+    """
+    The session's thread, giving it one from thread_pool if it has none yet.
+    Returns None if no thread could be had; the turn then creates one itself
+    and reports the error.
+    """
+    thread_id = sessions.get(session)["thread_id"]
+    if thread_id:
+        return thread_id
+    try:
+        thread_id = thread_pool.take()
+    except Exception as e:
+        log_event(logger, "thread_create_failed", level=logging.WARNING, error=str(e))
+        return None
+    return _claim(sessions, session, thread_pool, thread_id)
+
+
+async def asession_thread(sessions, session, thread_pool, aclient):
+    """Async version of session_thread(). The store is called from a worker thread, off the event loop."""
+    thread_id = (await asyncio.to_thread(sessions.get, session))["thread_id"]
+    if thread_id:
+        return thread_id
+    try:
+        thread_id = await thread_pool.atake(aclient)
+    except Exception as e:
+        log_event(logger, "thread_create_failed", level=logging.WARNING, error=str(e))
+        return None
+    return await asyncio.to_thread(_claim, sessions, session, thread_pool, thread_id)
+
+
+def _claim(sessions, session, thread_pool, thread_id):
+    claimed = sessions.claim_thread(session, thread_id)
+    if claimed != thread_id:
+        # Another turn of this conversation got its thread in first
+        thread_pool.put_back(thread_id)
+    return claimed
+
+
+def _cancel_wait(wait):
+    return wait if wait is not None else float(os.getenv("RUN_CANCEL_WAIT", "10"))
+
+
+def _log_cancel(started, thread_id, run_id, reason, status):
+    record_run_cancel(reason, status)
+    log_event(
+        logger, "run_cancelled", level=logging.WARNING if status in ACTIVE_RUN_STATUSES else logging.INFO,
+        thread_id=thread_id, run_id=run_id, reason=reason, status=status, duration_ms=elapsed_ms(started)
+    )
+
+
+def cancel_run(client, thread_id, run_id, reason, wait=None):
+    """
+    Cancel run_id and wait up to RUN_CANCEL_WAIT seconds for it to stop, so
+    the thread takes new messages again. Returns the run's last status, or
+    None if the cancel call failed; errors are logged rather than raised since
+    the caller has already given up on the run.
+    """
+    started = time.perf_counter()
+    try:
+        run = client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        deadline = time.monotonic() + _cancel_wait(wait)
+        while run.status in ACTIVE_RUN_STATUSES and time.monotonic() < deadline:
+            time.sleep(RECHECK_SECONDS)
+            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        # Also happens when the run finished by itself just before the cancel
+        log_event(logger, "run_cancel_failed", level=logging.WARNING, thread_id=thread_id, run_id=run_id,
+                  reason=reason, error=str(e))
+        return None
+    _log_cancel(started, thread_id, run_id, reason, run.status)
+    return run.status
+
+
+async def acancel_run(aclient, thread_id, run_id, reason, wait=None):
+    """Async version of cancel_run()."""
+    started = time.perf_counter()
+    try:
+        run = await aclient.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        deadline = time.monotonic() + _cancel_wait(wait)
+        while run.status in ACTIVE_RUN_STATUSES and time.monotonic() < deadline:
+            await asyncio.sleep(RECHECK_SECONDS)
+            run = await aclient.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        log_event(logger, "run_cancel_failed", level=logging.WARNING, thread_id=thread_id, run_id=run_id,
+                  reason=reason, error=str(e))
+        return None
+    _log_cancel(started, thread_id, run_id, reason, run.status)
+    return run.status
+
+
+def add_user_message(client, thread_id, message):
+    """Post message to thread_id, first cancelling a run left active on the thread."""
+    try:
+        return client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+    except openai.BadRequestError:
+        # Only an active run is worth clearing; any other bad request is raised as it was
+        runs = client.beta.threads.runs.list(thread_id=thread_id, limit=1)
+        if not runs.data or runs.data[0].status not in ACTIVE_RUN_STATUSES:
+            raise
+        cancel_run(client, thread_id, runs.data[0].id, "stale")
+    return client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+
+
+async def aadd_user_message(aclient, thread_id, message):
+    """Async version of add_user_message()."""
+    try:
+        return await aclient.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+    except openai.BadRequestError:
+        runs = await aclient.beta.threads.runs.list(thread_id=thread_id, limit=1)
+        if not runs.data or runs.data[0].status not in ACTIVE_RUN_STATUSES:
+            raise
+        await acancel_run(aclient, thread_id, runs.data[0].id, "stale")
+    return await aclient.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
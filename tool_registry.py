@@ -0,0 +1,160 @@
+"""Registry and concurrent dispatcher for assistant tools.
+
+Register a tool function under the name the assistant calls it by, with the
+same JSON schema used for its parameters in the Azure/OpenAI tool spec:
+
+    @tool("Generate_Workout_Plan", {
+        "type": "object",
+        "properties": {"days": {"type": "string"}},
+        "required": ["days"]
+    })
+    def Generate_Workout_Plan(days):
+        ...
+
+When a run stops with requires_action, pass its tool calls to
+dispatch_tool_calls(). The calls run at the same time in a bounded thread
+pool, each with its own timeout, and the outputs come back as one list
+ready for a single submit_tool_outputs call. A step with several tool calls
+then takes as long as its slowest tool rather than the sum of them all.
+
+    TOOL_WORKERS       size of the shared tool thread pool (default 8)
+    TOOL_TIMEOUT       default per-tool timeout in seconds (default 30)
+
+Tools that always return the same output for the same arguments can opt in
+to result caching with @tool(..., cache_ttl=seconds, cache_size=entries).
+Results are keyed by tool name and canonical JSON arguments; error results
+are never cached. See ttl_cache.cache_stats() for hit/miss counts.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+import concurrent.futures
+from ttl_cache import TTLCache, canonical_key, cached_call, is_error
+from metrics import record_tool
+
+tools = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class Tool:
+    def __init__(self, name, func, parameters=None, timeout=None, cache_ttl=None, cache_size=128):
+        self.name = name
+        self.func = func
+        self.parameters = parameters or {"type": "object", "properties": {}}
+        self.timeout = timeout
+        self.cache = TTLCache(f"tool:{name}", maxsize=cache_size, ttl=cache_ttl) if cache_ttl else None
+
+    def spec(self):
+        """The function tool spec to give the assistant for this tool."""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": (self.func.__doc__ or "").strip(),
+                "parameters": self.parameters
+            }
+        }
+
+    def call(self, arguments):
+        args = json.loads(arguments) if arguments else {}
+        missing = [p for p in self.parameters.get("required", []) if p not in args]
+        if missing:
+            return {"error": f"Missing arguments for {self.name}: {', '.join(missing)}"}
+        # Only pass the parameters the schema declares; models sometimes add extras
+        properties = self.parameters.get("properties", {})
+        kwargs = {k: v for k, v in args.items() if k in properties} if properties else args
+        if self.cache is None:
+            return self.func(**kwargs)
+        return cached_call(self.cache, canonical_key(self.name, kwargs), lambda: self.func(**kwargs))
+
+
+def tool(name, parameters=None, timeout=None, cache_ttl=None, cache_size=128):
+    """Decorator registering func as the tool the assistant calls `name`."""
+    def register(func):
+        tools[name] = Tool(name, func, parameters, timeout, cache_ttl, cache_size)
+        return func
+    return register
+
+
+def tool_specs():
+    return [t.spec() for t in tools.values()]
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=int(os.getenv("TOOL_WORKERS", "8")),
+                thread_name_prefix="tool"
+            )
+        return _executor
+
+
+def _run_tool(tool_call):
+    registered = tools.get(tool_call.function.name)
+    if registered is None:
+        record_tool(tool_call.function.name, 0.0, "unknown")
+        return {"error": f"Unknown tool: {tool_call.function.name}"}
+    started = time.perf_counter()
+    try:
+        result = registered.call(tool_call.function.arguments)
+    except Exception as e:
+        result = {"error": f"{tool_call.function.name} failed: {str(e)}"}
+    record_tool(registered.name, time.perf_counter() - started, "error" if is_error(result) else "ok")
+    return result
+
+
+def _timeout_for(tool_call):
+    registered = tools.get(tool_call.function.name)
+    if registered is not None and registered.timeout is not None:
+        return registered.timeout
+    return float(os.getenv("TOOL_TIMEOUT", "30"))
+
+
+def _tool_output(tool_call, result):
+    output = result if isinstance(result, str) else json.dumps(result)
+    return {"tool_call_id": tool_call.id, "output": output}
+
+
+def _timed_out(tool_call, timeout):
+    record_tool(tool_call.function.name, timeout, "timeout")
+    return {"error": f"{tool_call.function.name} timed out after {timeout} seconds"}
+
+
+def dispatch_tool_calls(tool_calls):
+    """Run tool_calls concurrently and return the outputs for submit_tool_outputs."""
+    executor = _get_executor()
+    started = time.monotonic()
+    pending = [(call, executor.submit(_run_tool, call)) for call in tool_calls]
+    tools_output = []
+    for call, future in pending:
+        timeout = _timeout_for(call)
+        try:
+            result = future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            # The worker thread cannot be interrupted; the model gets an error
+            # output now and the late result is dropped
+            future.cancel()
+            result = _timed_out(call, timeout)
+        tools_output.append(_tool_output(call, result))
+    return tools_output
+
+
+async def adispatch_tool_calls(tool_calls):
+    """Async version of dispatch_tool_calls() for the async chat path."""
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+
+    async def run_one(call):
+        timeout = _timeout_for(call)
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(executor, _run_tool, call), timeout)
+        except asyncio.TimeoutError:
+            result = _timed_out(call, timeout)
+        return _tool_output(call, result)
+
+    return list(await asyncio.gather(*(run_one(call) for call in tool_calls)))
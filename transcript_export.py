@@ -0,0 +1,181 @@
+"""Chat transcripts exported from the thread on the server.
+
+download_history() used to join the chat the browser still held into one
+string and write it to a temporary file that was never deleted. The export
+now pages through the thread's messages oldest first and writes each one to
+disk as it arrives (Markdown, JSON lines or plain text), so only one page is
+ever in memory and the file holds the whole conversation. Export files are
+deleted once Gradio has copied them for download (the UI chains
+release_export() after the download event), and anything left behind, such
+as exports requested through the API, is swept away after EXPORT_TTL seconds.
+
+    EXPORT_DIR   where export files are written (default <tmp>/assistant_exports)
+    EXPORT_TTL   seconds before a leftover export file is deleted (default 600)
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+import logging
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from thread_messages import message_text
+from structured_logging import get_logger, log_event
+
+logger = get_logger("exports")
+
+# Read at import, before gradio_init() would load .env
+load_dotenv()
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "assistant_exports"))
+EXPORT_TTL = float(os.getenv("EXPORT_TTL", "600"))
+PAGE_SIZE = 100
+
+# Pass as gr.Blocks(delete_cache=...) so Gradio's own copies of the exports expire too
+GRADIO_DELETE_CACHE = (max(int(EXPORT_TTL), 60), max(int(EXPORT_TTL), 60))
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def _timestamp(created_at):
+    if not created_at:
+        return ""
+    return datetime.fromtimestamp(created_at, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+
+class TextWriter:
+    extension = "txt"
+    labels = {"user": "Human", "assistant": "AI"}
+
+    def __init__(self, f):
+        self.f = f
+
+    def header(self, thread_id):
+        pass
+
+    def message(self, msg):
+        label = self.labels.get(msg["role"], msg["role"])
+        self.f.write(f"{label}: {msg['text']}\n")
+
+
+class MarkdownWriter(TextWriter):
+    extension = "md"
+    labels = {"user": "User", "assistant": "Assistant"}
+
+    def header(self, thread_id):
+        self.f.write("# Chat Transcript\n\n")
+        if thread_id:
+            self.f.write(f"Thread: `{thread_id}`\n\n")
+
+    def message(self, msg):
+        label = self.labels.get(msg["role"], msg["role"])
+        when = _timestamp(msg.get("created_at"))
+        self.f.write(f"### {label}" + (f" ({when})" if when else "") + "\n\n")
+        self.f.write(f"{msg['text']}\n\n")
+
+
+class JsonLinesWriter(TextWriter):
+    extension = "jsonl"
+
+    def message(self, msg):
+        self.f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+
+
+EXPORT_FORMATS = {"md": MarkdownWriter, "jsonl": JsonLinesWriter, "txt": TextWriter}
+# (label, value) pairs for a gr.Radio format picker
+EXPORT_CHOICES = [("Text", "txt"), ("Markdown", "md"), ("JSON Lines", "jsonl")]
+
+
+def iter_thread_messages(client, thread_id, page_size=PAGE_SIZE):
+    """Messages of a thread, oldest first, fetching the next page only when needed."""
+    for msg in client.beta.threads.messages.list(thread_id=thread_id, order="asc", limit=page_size):
+        yield {
+            "id": msg.id,
+            "role": msg.role,
+            "created_at": msg.created_at,
+            "run_id": msg.run_id,
+            "text": message_text(msg)
+        }
+
+
+def iter_history(history):
+    """Messages from the chatbot history, for chats that have no thread yet."""
+    for message in history or []:
+        if message["content"]:
+            yield {"role": message["role"], "text": message["content"]}
+
+
+def export_transcript(client, thread_id, history=None, fmt="txt"):
+    """Write the conversation to a new export file and return its path.
+
+    The thread is read from the server when there is one; otherwise the
+    chatbot history is used.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    writer_class = EXPORT_FORMATS[fmt]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _start_sweeper()
+
+    messages = iter_thread_messages(client, thread_id) if thread_id else iter_history(history)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    fd, path = tempfile.mkstemp(prefix=f"chat_{stamp}_", suffix=f".{writer_class.extension}", dir=EXPORT_DIR)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            writer = writer_class(f)
+            writer.header(thread_id)
+            for msg in messages:
+                writer.message(msg)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def release_export(path):
+    """Delete an export file once it has been served. Returns None to clear the state holding it."""
+    if path and os.path.dirname(os.path.abspath(path)) == os.path.abspath(EXPORT_DIR):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return None
+
+
+def sweep_exports(ttl=None):
+    """Delete export files older than ttl seconds; returns how many were removed."""
+    ttl = EXPORT_TTL if ttl is None else ttl
+    cutoff = time.time() - ttl
+    removed = 0
+    try:
+        entries = list(os.scandir(EXPORT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(max(EXPORT_TTL / 2, 30))
+        try:
+            sweep_exports()
+        except Exception as e:
+            log_event(logger, "export_sweep_failed", level=logging.WARNING, error=str(e))
+
+
+def _start_sweeper():
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            # Files left by a previous run are cleaned up right away
+            sweep_exports()
+            _sweeper = threading.Thread(target=_sweep_loop, name="export-sweeper", daemon=True)
+            _sweeper.start()
@@ -0,0 +1,84 @@
+"""Small thread-safe TTL + LRU cache with hit/miss counters.
+
+Used to remember results of deterministic tool functions and external API
+calls so a repeated call returns in microseconds instead of recomputing or
+making another round trip. Every named cache registers itself so
+cache_stats() can report on all of them.
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+
+caches = {}
+_caches_lock = threading.Lock()
+
+
+def canonical_key(name, args):
+    """Cache key for a call to `name`: argument order and spacing do not matter."""
+    return name + ":" + json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class TTLCache:
+    def __init__(self, name, maxsize=256, ttl=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        with _caches_lock:
+            caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._data[key]
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl}
+
+
+_MISSING = object()
+
+
+def is_error(result):
+    return isinstance(result, dict) and "error" in result
+
+
+def cached_call(cache, key, compute):
+    """Return the cached value for key, or compute it and cache it unless it is an error."""
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        if not is_error(value):
+            cache.set(key, value)
+    return value
+
+
+def cache_stats():
+    with _caches_lock:
+        named = dict(caches)
+    return {name: cache.stats() for name, cache in named.items()}
@@ -0,0 +1,122 @@
+"""Pool of pre-created conversation threads.
+
+The first message of every conversation used to wait for threads.create()
+before it could even post the user's message. WarmThreadPool keeps a few
+empty threads ready, refilled by a background thread, so a new
+conversation (including one started after Clear) can take one instantly.
+Threads that sit unused for too long are discarded and deleted.
+
+    THREAD_POOL_SIZE      empty threads to keep ready, 0 turns the pool off (default 4)
+    THREAD_POOL_MAX_IDLE  seconds an unused thread is kept before it is replaced (default 3600)
+"""
+import os
+import time
+import threading
+import logging
+from collections import deque
+from structured_logging import get_logger, log_event
+
+logger = get_logger("threads")
+
+
+class WarmThreadPool:
+    def __init__(self, client, size=None, max_idle=None):
+        self.client = client
+        self.size = size if size is not None else int(os.getenv("THREAD_POOL_SIZE", "4"))
+        self.max_idle = max_idle if max_idle is not None else float(os.getenv("THREAD_POOL_MAX_IDLE", "3600"))
+        self._ready = deque()
+        self._expired = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stats = {"hits": 0, "misses": 0, "created": 0, "expired": 0, "errors": 0}
+        if self.size > 0:
+            self._wake.set()
+            threading.Thread(target=self._refill_loop, name="warm-threads", daemon=True).start()
+
+    def take(self):
+        """A ready thread id, or a newly created one if the pool is empty."""
+        thread_id = self._take_ready()
+        if thread_id is None:
+            thread_id = self.client.beta.threads.create().id
+        return thread_id
+
+    async def atake(self, aclient):
+        """Like take(), but creates with the async client when the pool is empty."""
+        thread_id = self._take_ready()
+        if thread_id is None:
+            thread_id = (await aclient.beta.threads.create()).id
+        return thread_id
+
+    def put_back(self, thread_id):
+        """Return a thread that was taken but not used, so the next conversation gets it."""
+        with self._lock:
+            self._ready.appendleft((time.monotonic(), thread_id))
+
+    def _take_ready(self):
+        with self._lock:
+            self._pop_expired()
+            if self._ready:
+                self._stats["hits"] += 1
+                thread_id = self._ready.popleft()[1]
+            else:
+                self._stats["misses"] += 1
+                thread_id = None
+        # Refills the pool and deletes anything that expired here
+        self._wake.set()
+        return thread_id
+
+    def _pop_expired(self):
+        """Move expired threads to the delete list. Caller holds the lock."""
+        now = time.monotonic()
+        while self._ready and now - self._ready[0][0] >= self.max_idle:
+            self._expired.append(self._ready.popleft()[1])
+            self._stats["expired"] += 1
+
+    def _drop_expired(self):
+        with self._lock:
+            self._pop_expired()
+            expired, self._expired = self._expired, []
+        for thread_id in expired:
+            try:
+                self.client.beta.threads.delete(thread_id)
+            except Exception:
+                pass
+
+    def _refill_loop(self):
+        while True:
+            # Wake up when a thread is taken, and at least twice per idle period to expire old ones
+            self._wake.wait(timeout=self.max_idle / 2)
+            self._wake.clear()
+            self._drop_expired()
+            while True:
+                with self._lock:
+                    if len(self._ready) >= self.size:
+                        break
+                try:
+                    thread_id = self.client.beta.threads.create().id
+                except Exception as e:
+                    log_event(logger, "thread_precreate_failed", level=logging.WARNING, error=str(e))
+                    with self._lock:
+                        self._stats["errors"] += 1
+                    time.sleep(5)
+                    continue
+                with self._lock:
+                    self._ready.append((time.monotonic(), thread_id))
+                    self._stats["created"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "ready": len(self._ready), "size": self.size}
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_thread_pool(client):
+    """One pool per process, shared by every app mounted in it."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = WarmThreadPool(client)
+        return _shared_pool
@@ -0,0 +1,220 @@
+"""Run app.py as several worker processes on one host.
+
+`python app.py --workers N` used to have no meaning: everything ran in one
+uvicorn process. serve() now starts N worker processes, each running app.py
+on its own local port, and answers on the public port with StickyProxy in
+front of them.
+
+Gradio cannot simply be run with `uvicorn --workers`: an event is sent with
+one request (/queue/join) and its results stream back on another
+(/queue/data), and both have to reach the process that holds the event.
+StickyProxy gives each browser a cookie naming its worker and sends all of
+that browser's requests there. What a conversation needs beyond one page
+view, its thread_id, history and selected assistant, is kept in the session
+store, which serve() points at a SQLite file shared by the workers (see
+session_store.py). So if a worker dies it is started again, its browsers are
+moved to another worker, and a page reload picks the conversation up from
+the store.
+
+The Key Vault device-code login is done once, by this process, before the
+workers start. The resolved settings go into the encrypted credential cache
+(see credential_cache.py) and each worker builds its clients from there. If
+no CREDENTIAL_CACHE_KEY is configured, a key is generated for this run and
+passed to the workers in their environment only. This process keeps
+re-reading Key Vault every CREDENTIAL_REFRESH_SECONDS, so the cache, and with
+it the workers, pick up a rotated key.
+
+Rate limits, run polling and the reply cache stay per worker, and each
+worker serves its own metrics at http://127.0.0.1:<its port>/metrics.
+
+    WEB_WORKERS        worker processes when --workers is not given (default 1)
+    WORKER_BASE_PORT   local port of the first worker, the others follow it (default: the public port + 1)
+"""
+import os
+import sys
+import time
+import asyncio
+import itertools
+import logging
+import subprocess
+import threading
+from http.cookies import SimpleCookie
+import httpx
+from structured_logging import get_logger, log_event
+
+WORKER_COOKIE = "app_worker"
+# Headers that describe one connection and must not be passed through
+HOP_HEADERS = {b"connection", b"keep-alive", b"proxy-connection", b"te", b"trailer", b"transfer-encoding", b"upgrade"}
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+logger = get_logger("workers")
+
+
+class StickyProxy:
+    """ASGI app that sends every request from a browser to the same upstream worker."""
+    def __init__(self, upstreams):
+        self.upstreams = upstreams
+        self._next = itertools.cycle(range(len(upstreams)))
+        # The /queue/data event streams stay open for as long as the page does
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=5), limits=httpx.Limits(max_connections=None))
+
+    def _assigned(self, scope):
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                morsel = SimpleCookie(value.decode("latin-1")).get(WORKER_COOKIE)
+                if morsel is not None and morsel.value.isdigit() and int(morsel.value) < len(self.upstreams):
+                    return int(morsel.value)
+        return None
+
+    def _request(self, scope, index, body):
+        url = self.upstreams[index] + scope.get("raw_path", scope["path"].encode()).decode("latin-1")
+        if scope["query_string"]:
+            url += "?" + scope["query_string"].decode("latin-1")
+        headers = [(name, value) for name, value in scope["headers"] if name not in HOP_HEADERS]
+        client = scope.get("client")
+        if client:
+            headers.append((b"x-forwarded-for", client[0].encode()))
+        headers.append((b"x-forwarded-proto", scope["scheme"].encode()))
+        return self.client.build_request(scope["method"], url, headers=headers, content=body)
+
+    async def _send_upstream(self, scope, body):
+        """(response, worker index, whether the browser gets a new cookie), moving on from workers that are down."""
+        index = self._assigned(scope)
+        assign = index is None
+        for _ in range(len(self.upstreams)):
+            if index is None:
+                index = next(self._next)
+            try:
+                return await self.client.send(self._request(scope, index, body), stream=True), index, assign
+            except httpx.ConnectError:
+                log_event(logger, "worker_unreachable", level=logging.WARNING, worker=index)
+                index, assign = None, True
+        return None, None, False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            # Gradio's queue uses server-sent events, not websockets
+            await send({"type": "websocket.close"})
+            return
+        body = b""
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+
+        response, index, assign = await self._send_upstream(scope, body)
+        if response is None:
+            await send({"type": "http.response.start", "status": 502, "headers": [(b"content-type", b"text/plain")]})
+            await send({"type": "http.response.body", "body": b"No worker is available"})
+            return
+        headers = [(name, value) for name, value in response.headers.raw if name.lower() not in HOP_HEADERS]
+        if assign:
+            headers.append((b"set-cookie", f"{WORKER_COOKIE}={index}; Path=/; HttpOnly; SameSite=Lax".encode()))
+        relay = asyncio.ensure_future(self._relay(response, headers, send))
+        # Stop relaying as soon as the browser goes away, or an event stream would be kept open forever
+        disconnect = asyncio.ensure_future(self._disconnected(receive))
+        try:
+            await asyncio.wait({relay, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (relay, disconnect):
+                task.cancel()
+            await response.aclose()
+        if relay.done() and not relay.cancelled() and relay.exception() is not None:
+            log_event(logger, "relay_failed", level=logging.WARNING, worker=index, error=str(relay.exception()))
+
+    async def _relay(self, response, headers, send):
+        await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+        async for chunk in response.aiter_raw():
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _disconnected(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def prepare_credentials():
+    """Log in once here, so the workers start from the credential cache instead of each asking for a device code."""
+    if os.getenv("OPENAI_API_KEY"):
+        return
+    import credential_cache
+    from client_provider import get_provider
+    if not os.getenv("CREDENTIAL_CACHE_KEY"):
+        # Lives only in this process and the workers' environment
+        from cryptography.fernet import Fernet
+        os.environ["CREDENTIAL_CACHE_KEY"] = Fernet.generate_key().decode()
+    if not credential_cache.enabled():
+        log_event(logger, "credential_cache_disabled", level=logging.WARNING,
+                  detail="CREDENTIAL_CACHE_TTL is 0, so every worker will run the device-code login")
+        return
+    get_provider()
+
+
+class WorkerProcess:
+    def __init__(self, index, port, env):
+        self.index = index
+        self.port = port
+        self.env = env
+        self.process = None
+
+    def start(self):
+        command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(self.port)]
+        self.process = subprocess.Popen(command, cwd=ROOT, env=self.env)
+        log_event(logger, "worker_started", worker=self.index, port=self.port, pid=self.process.pid)
+
+    def check(self):
+        """Start the worker again if it has exited."""
+        code = self.process.poll()
+        if code is not None:
+            log_event(logger, "worker_exited", level=logging.WARNING, worker=self.index, port=self.port, exit_code=code)
+            self.start()
+
+    def stop(self):
+        self.process.terminate()
+
+
+def _supervise(workers, stop, interval=2.0):
+    while not stop.wait(interval):
+        for worker in workers:
+            worker.check()
+
+
+def serve(workers, host="0.0.0.0", port=8000):
+    import uvicorn
+    prepare_credentials()
+    env = dict(os.environ)
+    # Every worker has to see every session
+    env.setdefault("SESSION_STORE", "sqlite")
+    base_port = int(os.getenv("WORKER_BASE_PORT", str(port + 1)))
+    processes = [WorkerProcess(i, base_port + i, env) for i in range(workers)]
+    for worker in processes:
+        worker.start()
+    stop = threading.Event()
+    threading.Thread(target=_supervise, args=(processes, stop), name="worker-supervisor", daemon=True).start()
+    try:
+        proxy = StickyProxy([f"http://127.0.0.1:{worker.port}" for worker in processes])
+        uvicorn.run(proxy, host=host, port=port)
+    finally:
+        stop.set()
+        for worker in processes:
+            worker.stop()
+        deadline = time.monotonic() + 10
+        for worker in processes:
+            try:
+                worker.process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+            except subprocess.TimeoutExpired:
+                worker.process.kill()